@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+In-process DB-API driver for benchmarks
+
+Statements are not executed,SELECT returns the same generated rows every time,
+so only the cost of saiorm is measured.
+"""
+import datetime
+import decimal
+
+COLUMNS = ("id", "user_id", "name", "email", "score", "amount", "created_at", "note")
+
+TYPE_CODES = (3, 3, 253, 253, 5, 246, 12, 252)  # type codes of pymysql
+
+
+def make_rows(count):
+    """rows with int,str,float,Decimal,datetime and None values"""
+    created_at = datetime.datetime(2020, 1, 1)
+    return [(i, i % 100, f"user{i}", f"user{i}@example.com", i * 0.5,
+             decimal.Decimal(i) / 100, created_at, None if i % 3 else "note")
+            for i in range(1, count + 1)]
+
+
+def connect(rows=1000, max_allowed_packet=64 * 1024 * 1024, **kwargs):
+    """
+    :param rows: int,number of rows returned by SELECT
+    :param kwargs: ignored,accept the args of pymysql.connect
+    """
+    return Connection(make_rows(rows), max_allowed_packet)
+
+
+class Connection(object):
+    def __init__(self, rows, max_allowed_packet):
+        self.rows = rows
+        self.max_allowed_packet = max_allowed_packet
+        self.statements = 0  # executed statements
+
+    def cursor(self):
+        return Cursor(self)
+
+    def ping(self, reconnect=False):
+        pass
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class Cursor(object):
+    arraysize = 1
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.rowcount = -1
+        self.rownumber = 0
+        self.lastrowid = None
+        self._executed = ""
+        self._rows = []
+        self._sets = 0  # result sets left of multi-statement query
+
+    def execute(self, query, args=None):
+        self.connection.statements += 1
+        self._executed = query
+        self.rownumber = 0
+        self._sets = query.count(";\n")
+        head = query.lstrip()[:30].upper()
+        if head.startswith("SELECT @@MAX_ALLOWED_PACKET"):
+            self.description = (("@@max_allowed_packet", 8, None, None, None, None, None),)
+            self._rows = [(self.connection.max_allowed_packet,)]
+        elif head.startswith("SELECT"):
+            self.description = tuple((name, code, None, None, None, None, None)
+                                     for name, code in zip(COLUMNS, TYPE_CODES))
+            self._rows = self.connection.rows
+        else:
+            self.description = None
+            self._rows = []
+            self.lastrowid = 1
+            self.rowcount = 1
+            return 1
+        self.rowcount = len(self._rows)
+        return self.rowcount
+
+    def mogrify(self, query, args=None):
+        if args is None:
+            return query
+        return query % tuple(repr(i) for i in args)
+
+    def nextset(self):
+        if not self._sets:
+            return None
+        self._sets -= 1
+        return True
+
+    def executemany(self, query, args):
+        self.connection.statements += 1
+        self._executed = query
+        self.description = None
+        self._rows = []
+        self.lastrowid = 1
+        self.rowcount = len(args)
+        return self.rowcount
+
+    def fetchone(self):
+        if self.rownumber >= len(self._rows):
+            return None
+        self.rownumber += 1
+        return self._rows[self.rownumber - 1]
+
+    def fetchmany(self, size=None):
+        size = size or self.arraysize
+        rows = self._rows[self.rownumber:self.rownumber + size]
+        self.rownumber += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self.rownumber:]
+        self.rownumber = len(self._rows)
+        return rows
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        pass
@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+Benchmarks of saiorm,run offline on SQLite and fake_driver.
+
+Usage::
+
+    python benchmarks/run.py --output baseline.json
+    # change saiorm
+    python benchmarks/run.py --baseline baseline.json --threshold 0.1
+
+Exit with 1 if any benchmark is slower than baseline by more than threshold.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import saiorm
+from saiorm import MySQL
+from saiorm import utility
+
+import fake_driver
+
+ROWS = 1000  # rows of select and insert_many
+
+benchmarks = []  # (name, setup function returns (function to measure, operations of each call))
+
+
+def benchmark(name):
+    def decorator(setup):
+        benchmarks.append((name, setup))
+        return setup
+
+    return decorator
+
+
+class FakeConnection(MySQL.Connection):
+    def _connect(self):
+        return fake_driver.connect(**self.db_args)
+
+
+class FakePositionDB(MySQL.PositionDB):
+    def _connect(self):
+        return fake_driver.connect(**self.db_args)
+
+
+def fake_db(rows=ROWS, **kwargs):
+    """MySQL ChainDB on fake_driver"""
+    db = saiorm.init("MySQL", **kwargs)
+    db.connection = FakeConnection("127.0.0.1", 3306, "bench", rows=rows)
+    return db
+
+
+def sqlite_db(rows=ROWS, **kwargs):
+    """SQLite ChainDB in memory,table bench has rows lines"""
+    db = saiorm.init("SQLite", **kwargs)
+    db.connect({"host": ":memory:"})
+    db.execute("CREATE TABLE bench (id INTEGER PRIMARY KEY, user_id INTEGER, name TEXT, email TEXT, "
+               "score REAL, amount TEXT, created_at TEXT, note TEXT)")
+    db.table("bench").insert_many(insert_rows(rows))
+    return db
+
+
+def insert_rows(count):
+    return [{"user_id": i % 100, "name": f"user{i}", "email": f"user{i}@example.com",
+             "score": i * 0.5, "amount": str(i / 100), "created_at": "2020-01-01 00:00:00",
+             "note": None if i % 3 else "note"}
+            for i in range(1, count + 1)]
+
+
+SIMPLE_WHERE = [("user_id", 1), ("score", ">", 2)]
+
+COMPLEX_WHERE = [
+    ("user_id", 1),
+    ("score", "BETWEEN", "1", "2"),
+    ("amount", "`ABS(?)", "2"),
+    ("note", "!=", 0),
+    ("id", "IN", ["1", "2", "3", "4", "5"]),
+    ("created_at", "`NOW()"),
+    ("name", "or", "LIKE", "user%"),
+]
+
+
+@benchmark("parse_where_condition.simple")
+def bench_where_simple():
+    db = fake_db()
+    table = db.table("bench")
+
+    def run():
+        table.where(SIMPLE_WHERE).parse_where_condition("")
+
+    return run, 1
+
+
+@benchmark("parse_where_condition.complex")
+def bench_where_complex():
+    db = fake_db()
+    table = db.table("bench")
+
+    def run():
+        table.where(COMPLEX_WHERE).parse_where_condition("")
+
+    return run, 1
+
+
+@benchmark("parse_condition")
+def bench_condition():
+    db = fake_db()
+    table = db.table("bench")
+
+    def run():
+        table.where(COMPLEX_WHERE).order_by("id DESC").limit(10).parse_condition()
+
+    return run, 1
+
+
+def select_benchmark(make_db, row_factory):
+    def setup():
+        db = make_db(row_factory=row_factory)
+        table = db.table("bench")
+        return lambda: table.select(), ROWS
+
+    return setup
+
+
+for _name, _factory in (("row", utility.Row), ("grace_dict", utility.GraceDict), ("tuple", tuple),
+                        ("namedtuple", "namedtuple"), ("slots", "slots")):
+    benchmark(f"select.fake.{_name}")(select_benchmark(fake_db, _factory))
+for _name, _factory in (("row", utility.Row), ("grace_dict", utility.GraceDict)):
+    benchmark(f"select.sqlite.{_name}")(select_benchmark(sqlite_db, _factory))
+
+
+@benchmark("insert.fake")
+def bench_insert_fake():
+    table = fake_db().table("bench")
+    row = insert_rows(1)[0]
+    return lambda: table.insert(row), 1
+
+
+@benchmark("insert.sqlite")
+def bench_insert_sqlite():
+    table = sqlite_db(0).table("bench")
+    row = insert_rows(1)[0]
+    return lambda: table.insert(row), 1
+
+
+@benchmark("insert_many.fake")
+def bench_insert_many_fake():
+    table = fake_db().table("bench")
+    rows = insert_rows(ROWS)
+    return lambda: table.insert_many(rows), ROWS
+
+
+@benchmark("insert_many.sqlite")
+def bench_insert_many_sqlite():
+    table = sqlite_db(0).table("bench")
+    rows = insert_rows(ROWS)
+    return lambda: table.insert_many(rows), ROWS
+
+
+@benchmark("batch.fake")
+def bench_batch_fake():
+    db = fake_db()
+    db.connection = FakeConnection("127.0.0.1", 3306, "bench", multi_statements=True)
+    table = db.table("bench")
+    rows = insert_rows(100)
+
+    def run():
+        with db.batch():
+            for i, row in enumerate(rows):
+                table.where([("id", i)]).update(row)
+
+    return run, len(rows)
+
+
+@benchmark("position.mk_insert_query")
+def bench_mk_insert_query():
+    db = FakePositionDB("127.0.0.1", 3306, "bench")
+    fields = "user_id,name,email,{'created_at': 'now()'},ip=inet_aton(%s),score,amount,note"
+    return lambda: db.mk_insert_query("bench", fields), 1
+
+
+def measure(func, repeat=5, min_time=0.2):
+    """
+    run func in loops lasting min_time at least,repeat times
+
+    :return: float,seconds of one call,the best of repeat
+    """
+    loops = 1
+    while True:  # calibrate loops
+        elapsed = time_loops(func, loops)
+        if elapsed >= min_time:
+            break
+        loops *= 2 if elapsed * 10 >= min_time else 10
+    best = elapsed / loops
+    for i in range(repeat - 1):
+        best = min(best, time_loops(func, loops) / loops)
+    return best, loops
+
+
+def time_loops(func, loops):
+    start = time.perf_counter()
+    for i in range(loops):
+        func()
+    return time.perf_counter() - start
+
+
+def run(name_filter="", repeat=5, min_time=0.2):
+    """
+    :return: dict,environment and result of each benchmark
+    """
+    results = {}
+    for name, setup in benchmarks:
+        if name_filter and name_filter not in name:
+            continue
+        func, operations = setup()
+        seconds, loops = measure(func, repeat, min_time)
+        results[name] = {
+            "ops": operations / seconds,  # operations per second,rows per second of select and insert_many
+            "seconds": seconds,  # seconds of one call
+            "loops": loops,  # calls of each repeat
+        }
+        print(f"{name:<36} {operations / seconds:>14,.0f} ops/s")
+    return {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "benchmarks": results,
+    }
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    print change of each benchmark against baseline
+
+    :param threshold: float,slower by more than it is a regression
+    :return: list,names of regressions
+    """
+    regressions = []
+    print(f"\n{'benchmark':<36} {'baseline':>14} {'current':>14} {'change':>8}")
+    for name, res in results["benchmarks"].items():
+        base = baseline["benchmarks"].get(name)
+        if not base:
+            print(f"{name:<36} {'-':>14} {res['ops']:>14,.0f} {'new':>8}")
+            continue
+        change = res["ops"] / base["ops"] - 1
+        mark = ""
+        if change < -threshold:
+            regressions.append(name)
+            mark = " REGRESSION"
+        print(f"{name:<36} {base['ops']:>14,.0f} {res['ops']:>14,.0f} {change:>+8.1%}{mark}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of saiorm")
+    parser.add_argument("--output", help="save results to this JSON file")
+    parser.add_argument("--baseline", help="compare with results saved by --output")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="fail if slower than baseline by more than it,defaults to 0.1(10%%)")
+    parser.add_argument("--filter", default="", help="run benchmarks whose name contains it")
+    parser.add_argument("--repeat", type=int, default=5, help="take the best of repeat runs")
+    parser.add_argument("--min-time", type=float, default=0.2, help="seconds of each run at least")
+    args = parser.parse_args(argv)
+
+    results = run(args.filter, args.repeat, args.min_time)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressions: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -27,13 +27,15 @@ to_unicode = utility.to_unicode
 
 
 class ConnectionMongoDB(base.BaseConnection):
+    backend = "MongoDB"
+
     def __init__(self, host, port, database, user=None, password=None,
                  max_idle_time=7 * 3600, return_query=False):
         self.host = host
+        self.port = port
         self.database = database
         self.max_idle_time = float(max_idle_time)
         self._return_query = return_query
-        self.condition = {}  # like WHERE, ORDER BY, LIMIT etc. in SQL
         self.client = None  # Mongo client
 
         args = dict(
@@ -48,7 +50,7 @@ class ConnectionMongoDB(base.BaseConnection):
         self.db_args = args
         self._last_use_time = time.time()
         try:
-            self.reconnect()
+            self._init_connection()
         except Exception:
             logging.error(f"Cannot connect to PostgreSQL on {self.host}:{port}",
                           exc_info=True)
@@ -65,21 +67,20 @@ class ConnectionMongoDB(base.BaseConnection):
         self.db = getattr(client, database)
         self.client = client
 
-    def _log_exception(self, exception, query, parameters):
-        """log exception when execute query"""
-        pass
-
-    def select(self, parameters):
+    def select(self, condition, parameters):
         """
         TODO if want to limit fields,must set all of the fields to hide equals to 0 explicitly
+
+        :param condition: dict,like WHERE, ORDER BY, LIMIT etc. in SQL,see ChainDB.build_condition
         """
-        condition = self.condition["where"]
-        sort = self.condition.get("sort", "")
-        skip = self.condition.get("skip", "")
-        limit = self.condition.get("limit", "")
+        table = condition["table"]
+        where = condition["where"]
+        sort = condition.get("sort", "")
+        skip = condition.get("skip", "")
+        limit = condition.get("limit", "")
 
         try:
-            eval_str = """getattr(self.db, self.condition["table"]).find(condition)"""
+            eval_str = """getattr(self.db, table).find(where)"""
             if sort:
                 eval_str += ".sort(" + str(sort) + ")"
             if skip:
@@ -91,7 +92,7 @@ class ConnectionMongoDB(base.BaseConnection):
 
             if self._return_query:  # generate query
                 query_str_tmpl = "MongoDB {}.find({})"
-                query_value = [self.condition["table"], str(condition)]
+                query_value = [table, str(where)]
                 if sort:
                     query_str_tmpl += ".sort({})"
                     query_value.append(str(sort))
@@ -107,51 +108,75 @@ class ConnectionMongoDB(base.BaseConnection):
                 query = query_str_tmpl.format(*query_value)
             else:
                 query = ""
-            self.condition = {}  # reset condition
             return {
                 "data": res or [],
                 "query": query
             }
         except Exception as e:
-            self._log_exception(e, "select", self.condition)
+            self._log_exception(e, "select", condition)
             raise
 
-    def insert(self, parameters):
+    def insert(self, condition, parameters):
         try:
-            getattr(self.db, self.condition["table"]).insert_one(parameters)
+            getattr(self.db, condition["table"]).insert_one(parameters)
             return {
                 "lastrowid": 0,  # the primary key id affected
                 "rowcount": 0,  # number of rows affected
                 "rownumber": 0,  # line number
-                "query": f"{self.condition['table']}.insert_one({parameters})" if self._return_query else ""
+                "query": f"{condition['table']}.insert_one({parameters})" if self._return_query else ""
                 # query executed
             }
         except Exception as e:
-            self._log_exception(e, "insert", self.condition)
+            self._log_exception(e, "insert", condition)
             raise
 
-    def insert_many(self, parameters):
+    def insert_many(self, condition, parameters):
         try:
-            getattr(self.db, self.condition["table"]).insert_many(parameters)
+            getattr(self.db, condition["table"]).insert_many(parameters)
             return {
                 "lastrowid": 0,  # the primary key id affected
                 "rowcount": 0,  # number of rows affected
                 "rownumber": 0,  # line number
-                "query": f"{self.condition['table']}.insert_many({parameters})" if self._return_query else ""
+                "query": f"{condition['table']}.insert_many({parameters})" if self._return_query else ""
                 # query executed
             }
         except Exception as e:
-            self._log_exception(e, "insert_many", self.condition)
+            self._log_exception(e, "insert_many", condition)
             raise
 
-    def update(self, parameters):
-        where = self.condition["where"]
+    def upsert_many(self, condition, parameters, conflict_keys, update_fields):
+        """bulk_write of UpdateOne(upsert=True),update_fields are $set,other fields are $setOnInsert"""
+        requests = []
+        for row in parameters:
+            update = {}
+            updates = {k: row[k] for k in update_fields if k in row}
+            if updates:
+                update["$set"] = updates
+            inserts = {k: v for k, v in row.items() if k not in updates and k not in conflict_keys}
+            if inserts or not updates:
+                update["$setOnInsert"] = inserts or {k: row[k] for k in conflict_keys}
+            requests.append(pymongo.UpdateOne({k: row[k] for k in conflict_keys}, update, upsert=True))
 
         try:
-            res = getattr(self.db, self.condition["table"]).update(where, parameters)
+            res = getattr(self.db, condition["table"]).bulk_write(requests)
+            query = f"{condition['table']}.bulk_write({requests})" if self._return_query else ""
+            return {
+                "lastrowid": 0,  # the primary key id affected
+                "rowcount": res.upserted_count + res.modified_count,  # number of rows affected
+                "rownumber": 0,  # line number
+                "query": query  # query executed
+            }
+        except Exception as e:
+            self._log_exception(e, "upsert_many", condition)
+            raise
+
+    def update(self, condition, parameters):
+        where = condition["where"]
+
+        try:
+            res = getattr(self.db, condition["table"]).update(where, parameters)
             # returns  {'n': 1, 'nModified': 1, 'ok': 1.0, 'updatedExisting': True}
-            query = f"{self.condition['table']}.update({where}, {parameters})" if self._return_query else ""
-            self.condition = {}  # reset condition
+            query = f"{condition['table']}.update({where}, {parameters})" if self._return_query else ""
             return {
                 "lastrowid": 0,  # the primary key id affected
                 "rowcount": res.get("nModified", res["n"]),  # number of rows affected
@@ -160,16 +185,15 @@ class ConnectionMongoDB(base.BaseConnection):
                 # query executed
             }
         except Exception as e:
-            self._log_exception(e, "update", self.condition)
+            self._log_exception(e, "update", condition)
             raise
 
-    def delete(self):
-        where = self.condition["where"]
+    def delete(self, condition):
+        where = condition["where"]
         try:
-            res = getattr(self.db, self.condition["table"]).remove(where)
+            res = getattr(self.db, condition["table"]).remove(where)
             # returns {'n': 2, 'ok': 1.0}
-            query = f"{self.condition['table']}.remove({self.condition['where']})" if self._return_query else ""
-            self.condition = {}  # reset condition
+            query = f"{condition['table']}.remove({where})" if self._return_query else ""
             return {
                 "lastrowid": 0,  # the primary key id affected
                 "rowcount": res.get("nRemoved", res["n"]),  # number of rows affected
@@ -177,7 +201,7 @@ class ConnectionMongoDB(base.BaseConnection):
                 "query": query  # query executed
             }
         except Exception as e:
-            self._log_exception(e, "delete", self.condition)
+            self._log_exception(e, "delete", condition)
             raise
 
     def group(self):
@@ -185,6 +209,24 @@ class ConnectionMongoDB(base.BaseConnection):
         pass
 
 
+def parse_plan(plan, table):
+    """COLLSCAN and IXSCAN stages in winning plan of explain"""
+    stats = plan.get("executionStats", {})
+    nodes = []
+    stages = [plan.get("queryPlanner", {}).get("winningPlan", {})]
+    while stages:
+        stage = stages.pop()
+        name = stage.get("stage")
+        if name == "COLLSCAN":
+            nodes.append(base.plan_node(table, name, None, stats.get("totalDocsExamined"), True))
+        elif name == "IXSCAN":
+            nodes.append(base.plan_node(table, name, stage.get("indexName"), stats.get("totalKeysExamined"), False))
+        if "inputStage" in stage:
+            stages.append(stage["inputStage"])
+        stages += stage.get("inputStages", [])
+    return nodes
+
+
 class ChainDB(base.ChainDB):
     def connect(self, config_dict=None, return_query=False):
         if return_query:
@@ -203,6 +245,10 @@ class ChainDB(base.ChainDB):
         logging.warning("Saiorm does not support query in MongoDB")
         return self
 
+    def batch(self):
+        logging.warning("Saiorm does not support batch in MongoDB,writes are executed at once")
+        return super().batch()
+
     def group_by(self, condition):
         logging.warning("Saiorm does not support group_by in MongoDB")
         return self
@@ -224,36 +270,94 @@ class ChainDB(base.ChainDB):
         return self
 
     def select(self, fields="*"):
-        self.set_condition()
-        res = self.connection.select(fields)
+        res = self.connection.select(self.build_condition(), fields)
         self.last_query = res["query"]
         return res["data"]
 
+    def iter(self, fields="*", fetch_size=1000):
+        """pymongo cursor is lazy already,fetch fetch_size documents each time"""
+        res = self.connection.select(self.build_condition(), fields)
+        self.last_query = res["query"]
+        if not res["data"]:
+            return iter([])
+        return res["data"].batch_size(fetch_size)
+
+    select_iter = iter  # alias
+
+    def select_page(self, fields, keys, after, limit, desc):
+        """find({key: {"$gt": after}}).sort(key).limit(limit)"""
+        table = self._table
+        condition = self.build_condition()["where"]
+        if after is not None:
+            sign = "$lt" if desc else "$gt"
+            ors = []
+            for index, k in enumerate(keys):
+                equals = dict(zip(keys[:index], after[:index]))
+                equals[k] = {sign: after[index]}
+                ors.append(equals)
+            seek = ors[0] if len(ors) == 1 else {"$or": ors}
+            condition = {"$and": [condition, seek]} if condition else seek
+
+        sort = [(k, pymongo.DESCENDING if desc else pymongo.ASCENDING) for k in keys]
+        res = getattr(self.connection.db, table).find(condition).sort(sort).limit(limit)
+        self.last_query = f"MongoDB {table}.find({condition}).sort({sort}).limit({limit})" \
+            if self.connection._return_query else ""
+        return list(res), None
+
+    def explain(self, fields="*", analyze=False):
+        """cursor.explain() of find,see base.BaseDB.explain"""
+        table = self._table
+        condition = self.build_condition()
+
+        cursor = getattr(self.connection.db, table).find(condition["where"])
+        if condition.get("sort"):
+            cursor = cursor.sort(condition["sort"])
+        if int(condition.get("skip") or 0):
+            cursor = cursor.skip(int(condition["skip"]))
+        if int(condition.get("limit") or 0):
+            cursor = cursor.limit(int(condition["limit"]))
+        plan = cursor.explain()
+        query = f"MongoDB {table}.find({condition['where']}).explain()"
+        self.last_query = query
+        return base.plan_detail(parse_plan(plan, table), plan, query)
+
+    def select_columns(self, fields="*", numpy=False):
+        """
+        same as select,but return values by column.
+        Columns are the given fields,or all keys of the documents if fields is "*",
+        missing keys are None.
+        """
+        rows = list(self.select(fields))
+        if fields == "*":
+            column_names = list(dict.fromkeys(k for row in rows for k in row))
+        else:
+            column_names = [i.strip() for i in fields.split(",")]
+        columns = utility.to_columns([tuple(row.get(i) for i in column_names) for row in rows],
+                                     len(column_names))
+        if numpy:
+            columns = [utility.to_numpy_array(values) for values in columns]
+        return column_names, columns
+
     def get(self, fields="*"):
-        self._limit = 1
-        self.set_condition()
-        res = self.connection.select(fields)
+        res = self.connection.select(self.limit(1).build_condition(), fields)
         self.last_query = res["query"]
         return res["data"]
 
     def update(self, dict_data=None):
-        self.set_condition()
-        res = self.connection.update(dict_data)
+        res = self.connection.update(self.build_condition(), dict_data)
         self.last_query = res["query"]
         return res
 
     def insert(self, dict_data=None):
-        self.set_condition()
         if "fields" in dict_data and "values" in dict_data:  # split dict
             dict_data = {k: dict_data["values"][index]
                          for index, k in enumerate(dict_data["fields"])}
 
-        res = self.connection.insert(dict_data)
+        res = self.connection.insert(self.build_condition(), dict_data)
         self.last_query = res["query"]
         return res
 
     def insert_many(self, dict_data=None):
-        self.set_condition()
         if isinstance(dict_data, dict):
             keys = dict_data.keys()
             if "fields" in keys and "values" in keys:
@@ -261,37 +365,52 @@ class ChainDB(base.ChainDB):
                              for index, k in enumerate(dict_data["fields"])
                              for v in dict_data["values"]]
 
-        res = self.connection.insert_many(dict_data)
+        res = self.connection.insert_many(self.build_condition(), dict_data)
+        self.last_query = res["query"]
+        return res
+
+    def upsert_many(self, rows, conflict_keys, update_fields=None):
+        if not rows:
+            return False
+        if isinstance(rows, dict):  # split dict
+            rows = [dict(zip(rows["fields"], v)) for v in rows["values"]]
+
+        conflict_keys = base.split_names(conflict_keys)
+        if update_fields is None:
+            update_fields = [k for k in rows[0] if k not in conflict_keys]
+        res = self.connection.upsert_many(self.build_condition(), rows, conflict_keys, base.split_names(update_fields))
         self.last_query = res["query"]
         return res
 
     def delete(self):
-        self.set_condition()
-        res = self.connection.delete()
+        res = self.connection.delete(self.build_condition())
         self.last_query = res["query"]
         return res
 
     def increase(self, field, step=1):
         """number field Increase """
-        self.set_condition()
-        res = self.connection.update({"$inc": {field: step}})
+        res = self.connection.update(self.build_condition(), {"$inc": {field: step}})
         self.last_query = res["query"]
         return res
 
     def decrease(self, field, step=1):
         """number field decrease """
-        self.set_condition()
-        res = self.connection.update({"$inc": {field: 0 - step}})
+        res = self.connection.update(self.build_condition(), {"$inc": {field: 0 - step}})
         self.last_query = res["query"]
         return res
 
     def get_fields_name(self):
         logging.warning("Saiorm does not support get_fields_name in MongoDB")
 
-    def set_condition(self):
+    def load_schema(self, refresh=False):
+        logging.warning("Saiorm does not support load_schema in MongoDB")
+        return {}
+
+    def build_condition(self):
         """
-        set condition to MongoDB
+        condition of MongoDB,passed to the methods of connection
 
+        :return: dict,table,where,sort,limit and skip
         """
         res = {
             "table": self._table,
@@ -300,8 +419,6 @@ class ChainDB(base.ChainDB):
             "limit": "0",
             "skip": "0"
         }
-        sql = ""
-        sql_values = []
         if self._where:
             # TODO support native function,BETWEEN,IN etc.
             if isinstance(self._where, list):
@@ -341,6 +458,4 @@ class ChainDB(base.ChainDB):
                 res["limit"] = n
                 res["skip"] = m
 
-        self.connection.condition = res
-
-        return sql, sql_values
+        return res
@@ -4,9 +4,16 @@
 Support MySQL
 """
 import ast
+import itertools
+import json
+import operator
+import os
+import tempfile
 import time
 from pymysql import cursors
 from pymysql import connect
+from pymysql.constants import CLIENT
+from pymysql.constants import FIELD_TYPE
 
 try:
     from . import utility
@@ -20,35 +27,260 @@ except ImportError:
 
 Row = utility.Row
 GraceDict = utility.GraceDict
+to_unicode = utility.to_unicode
+
+# escape characters of LOAD DATA,ESCAPED BY '\\'
+TSV_ESCAPE = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"})
+
+
+def tsv_value(v):
+    """encode a value to field of LOAD DATA,NULL is \\N"""
+    if v is None:
+        return b"\\N"
+    if isinstance(v, str):
+        return v.translate(TSV_ESCAPE).encode("utf8")
+    if isinstance(v, bool):
+        return b"1" if v else b"0"
+    if isinstance(v, (bytes, bytearray)):
+        return bytes(v).replace(b"\\", b"\\\\").replace(b"\t", b"\\t").replace(
+            b"\n", b"\\n").replace(b"\r", b"\\r").replace(b"\0", b"\\0")
+    if isinstance(v, (dict, list)):
+        return json.dumps(v).translate(TSV_ESCAPE).encode("utf8")
+    return str(v).encode("utf8")
+
+
+def tsv_row(row):
+    return b"\t".join([tsv_value(v) for v in row]) + b"\n"
+
+
+def parse_plan(plan):
+    """tables in plan of EXPLAIN FORMAT=JSON"""
+    nodes = []
+    if isinstance(plan, dict):
+        for k, v in plan.items():
+            if k == "table" and isinstance(v, dict) and "table_name" in v:
+                access = v.get("access_type")
+                nodes.append(base.plan_node(v["table_name"], access, v.get("key"),
+                                            v.get("rows_examined_per_scan"), access in ("ALL", "index")))
+            nodes += parse_plan(v)
+    elif isinstance(plan, list):
+        for v in plan:
+            nodes += parse_plan(v)
+    return nodes
 
 
 class Connection(base.BaseConnection):
-    def reconnect(self):
-        """Closes the existing database connection and re-opens it."""
-        self.close()
-        self.db = connect(**self.db_args)
-        # self.db.autocommit(True)
-
-    def iter(self, query, *parameters, **kwparameters):
-        """Returns an iterator for the given query and parameters."""
-        self._ensure_connected()
-        cursor = cursors.SSCursor(self.db)
-        try:
-            self._execute(cursor, query, parameters, kwparameters)
-            column_names = [d[0] for d in cursor.description]
-            for row in cursor:
-                yield Row(zip(column_names, row))
-        finally:
+    backend = "MySQL"
+    numpy_dtypes = {
+        FIELD_TYPE.TINY: "int64",
+        FIELD_TYPE.SHORT: "int64",
+        FIELD_TYPE.INT24: "int64",
+        FIELD_TYPE.LONG: "int64",
+        FIELD_TYPE.LONGLONG: "int64",
+        FIELD_TYPE.YEAR: "int64",
+        FIELD_TYPE.FLOAT: "float64",
+        FIELD_TYPE.DOUBLE: "float64",
+        FIELD_TYPE.DATE: "datetime64[D]",
+        FIELD_TYPE.DATETIME: "datetime64[us]",
+        FIELD_TYPE.TIMESTAMP: "datetime64[us]",
+    }
+
+    _max_allowed_packet = 0
+
+    def __init__(self, host, port, database, user=None, password=None, multi_statements=False, **kwargs):
+        """
+        :param multi_statements: bool,allow many statements in one query,
+            ChainDB.batch sends its statements together with it
+        """
+        if multi_statements:
+            kwargs["client_flag"] = kwargs.get("client_flag", 0) | CLIENT.MULTI_STATEMENTS
+        super().__init__(host, port, database, user, password, **kwargs)
+
+    def _connect(self):
+        """return a new pymysql connection"""
+        return connect(**self.db_args)
+
+    def get_max_allowed_packet(self):
+        """max_allowed_packet of server and pymysql,the smaller one"""
+        if not self._max_allowed_packet:
+            res = self.query_return_detail("SELECT @@max_allowed_packet", row_factory=tuple)
+            client = self.db_args.get("max_allowed_packet", 16 * 1024 * 1024)  # pymysql default
+            self._max_allowed_packet = min(int(res["data"][0][0]), client)
+        return self._max_allowed_packet
+
+    def _ping(self, db):
+        """check the connection before borrowing it from pool"""
+        db.ping(reconnect=False)
+
+    def execute_batch_return_detail(self, statements):
+        """
+        join statements into multi-statement queries under max_allowed_packet and read results by nextset,
+        one by one if multi_statements is not enabled
+        """
+        if not self.db_args.get("client_flag", 0) & CLIENT.MULTI_STATEMENTS:
+            return super().execute_batch_return_detail(statements)
+
+        max_bytes = self.get_max_allowed_packet() - 1024
+        chunks = [[]]
+        size = 0
+        with self._borrow() as db:  # values are escaped by charset of connection
+            cursor = db.cursor()
+            for query, values in statements:
+                query = to_unicode(cursor.mogrify(query.strip().rstrip(";"), values or None))
+                length = len(query.encode("utf8")) + 2
+                if chunks[-1] and size + length > max_bytes:
+                    chunks.append([])
+                    size = 0
+                chunks[-1].append(query)
+                size += length
             cursor.close()
 
-    def _log_exception(self, exception, query, parameters):
-        """log exception when execute SQL"""
-        pass
+        res = []
+        for chunk in chunks:
+            res += self.execute_multi_return_detail(";\n".join(chunk), chunk)
+        return res
+
+    @base.events.observe("batch")
+    def execute_multi_return_detail(self, query, queries):
+        """
+        execute a multi-statement query
+
+        :param queries: list,statements in query
+        :return: list,detail of each statement
+        """
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                res = []
+                try:
+                    cursor.execute(query)
+                    while True:
+                        res.append({
+                            "lastrowid": cursor.lastrowid,  # the primary key id affected
+                            "rowcount": cursor.rowcount,  # number of rows affected
+                            "rownumber": cursor.rownumber,  # line number
+                            "query": queries[len(res)]  # query executed
+                        })
+                        if not cursor.nextset():
+                            break
+                except Exception as e:  # statements after the failed one are not executed
+                    self._log_exception(e, queries[len(res)], ())
+                    self._discard()
+                    raise
+                return res
+            finally:
+                cursor.close()
+
+    def explain_return_detail(self, query, *parameters, analyze=False):
+        """
+        EXPLAIN FORMAT=JSON,analyze is ignored,EXPLAIN ANALYZE of MySQL supports tree format only
+        """
+        res = self.query_return_detail("EXPLAIN FORMAT=JSON " + query, *parameters, row_factory=tuple)
+        plan = json.loads(res["data"][0][0])
+        return base.plan_detail(parse_plan(plan), plan, res["query"])
+
+    @base.events.observe("load_data")
+    def load_data_return_detail(self, table, rows, fields=None):
+        """
+        load rows into table by LOAD DATA LOCAL INFILE.
+
+        Rows are written to a TSV temp file first,pass local_infile=True to connect to use it,
+        and local_infile should be ON in server.
+
+        :param rows: iterable of dict,tuple or list
+        :param fields: list,field names,keys of the first dict by default,
+            all fields of table if rows are tuples and fields is None
+        :return: dict,rowcount,warnings and elapsed seconds
+        """
+        if not self.db_args.get("local_infile"):
+            raise ValueError("Pass local_infile=True to connect to use LOAD DATA LOCAL INFILE")
+
+        start_time = time.time()
+        rows = iter(rows)
+        try:
+            first = next(rows)
+        except StopIteration:
+            return {"lastrowid": 0, "rowcount": 0, "rownumber": 0, "query": "",
+                    "warnings": 0, "warning_messages": [], "elapsed": 0}
+        rows = itertools.chain([first], rows)
+
+        if isinstance(first, dict):
+            fields = list(fields or first.keys())
+            if len(fields) == 1:
+                getter = operator.itemgetter(fields[0])
+                rows = ((getter(i),) for i in rows)
+            else:
+                rows = map(operator.itemgetter(*fields), rows)
+
+        columns = f" ({','.join(fields)})" if fields else ""
+        query = f"LOAD DATA LOCAL INFILE %s INTO TABLE {table} CHARACTER SET utf8mb4 " \
+                f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n'{columns};"
+
+        f = tempfile.NamedTemporaryFile(prefix="saiorm_", suffix=".tsv", delete=False)
+        try:
+            with f:
+                for row in rows:
+                    f.write(tsv_row(row))
+
+            with self._borrow() as db:
+                cursor = db.cursor()
+                try:
+                    self._execute(cursor, query, (f.name,), None)
+                    warnings = cursor._result.warning_count if cursor._result else 0
+                    warning_messages = []
+                    if warnings:
+                        cursor.execute("SHOW WARNINGS LIMIT 10;")
+                        warning_messages = [row[2] for row in cursor.fetchall()]
+                    return {
+                        "lastrowid": cursor.lastrowid,  # the primary key id affected
+                        "rowcount": cursor.rowcount,  # number of rows loaded
+                        "rownumber": cursor.rownumber,  # line number
+                        "query": to_unicode(cursor._executed),  # query executed
+                        "warnings": warnings,  # number of warnings
+                        "warning_messages": warning_messages,  # the first 10 warnings
+                        "elapsed": time.time() - start_time  # seconds of writing file and loading
+                    }
+                finally:
+                    cursor.close()
+        finally:
+            os.remove(f.name)
+
+    def iter(self, query, *parameters, fetch_size=1000, row_factory=None, **kwparameters):
+        """Returns an iterator for the given query and parameters,rows are not buffered in client."""
+        with self._borrow() as db:
+            cursor = cursors.SSCursor(db)
+            try:
+                self._execute(cursor, query, parameters, kwparameters)
+                column_names = [d[0] for d in cursor.description]
+                make_row = utility.row_maker(row_factory or self.row_factory, column_names)
+                while True:
+                    rows = cursor.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield make_row(row)
+            finally:
+                cursor.close()  # read the rest rows of unbuffered result
 
 
 class ChainDB(base.ChainDB):
-    def connect(self, config_dict=None):
-        self.connection = Connection(**config_dict)
+    def connect(self, config_dict=None, replicas=None, replica_strategy="round_robin"):
+        """statement_cache_size in config_dict is ignored,pymysql does not support server side prepared statement"""
+        self.connection = self.new_connection(Connection, config_dict, replicas, replica_strategy)
+
+    def load_data(self, rows, fields=None):
+        """
+        load rows into table by LOAD DATA LOCAL INFILE,much faster than insert_many.
+        see Connection.load_data_return_detail
+        """
+        res = self.connection.load_data_return_detail(self._table, rows, fields)
+        self.invalidate_cache()
+        self.last_query = res["query"]
+        return res
+
+    def get_max_insert_bytes(self):
+        """keep INSERT statement under max_allowed_packet"""
+        return self.connection.get_max_allowed_packet() - 1024  # space for INSERT INTO ...
 
 
 class PositionDB(Connection):
@@ -110,9 +342,12 @@ class PositionDB(Connection):
 
     def __init__(self, host, port, database, user=None, password=None,
                  max_idle_time=7 * 3600, connect_timeout=60, time_zone="+0:00",
-                 prefix="", prefix_sign="###", grace_result=True):
+                 prefix="", prefix_sign="###", grace_result=True, pool_size=0,
+                 pool_min_size=1, pool_timeout=30.0, **kwargs):
         super().__init__(host, port, database, user, password,
-                         max_idle_time, connect_timeout, time_zone)
+                         max_idle_time=max_idle_time, connect_timeout=connect_timeout,
+                         time_zone=time_zone, pool_size=pool_size,
+                         pool_min_size=pool_min_size, pool_timeout=pool_timeout, **kwargs)
         self.prefix = prefix  # table name prefix
         self.prefix_sign = prefix_sign  # 替换表前缀的字符
         self.grace_result = grace_result
@@ -125,42 +360,47 @@ class PositionDB(Connection):
 
     def query(self, query, *parameters, **kwparameters):
         """Returns a row list for the given query and parameters."""
-        cursor = self._cursor()
-        try:
-            self._execute(cursor, query, parameters, kwparameters)
-            column_names = [d[0] for d in cursor.description]
-
-            if self.grace_result:
-                return [GraceDict(zip(column_names, row)) for row in cursor]
-            else:
-                return [zip(column_names, row) for row in cursor]
-        finally:
-            cursor.close()
-
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                self._execute(cursor, query, parameters, kwparameters)
+                column_names = [d[0] for d in cursor.description]
+
+                if self.grace_result:
+                    return [GraceDict(zip(column_names, row)) for row in cursor]
+                else:
+                    return [zip(column_names, row) for row in cursor]
+            finally:
+                cursor.close()
+
+    @base.events.observe("execute")
     def execute_return_detail(self, query, *parameters, **kwparameters):
         """return lastrowid and rowcount"""
-        cursor = self._cursor()
-        try:
-            self._execute(cursor, query, parameters, kwparameters)
-
-            return {
-                "lastrowid": cursor.lastrowid,
-                "rowcount": cursor.rowcount,
-            }
-        finally:
-            cursor.close()
-
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                self._execute(cursor, query, parameters, kwparameters)
+
+                return {
+                    "lastrowid": cursor.lastrowid,
+                    "rowcount": cursor.rowcount,
+                }
+            finally:
+                cursor.close()
+
+    @base.events.observe("executemany")
     def executemany_return_detail(self, query, parameters):
         """return lastrowid and rowcount"""
-        cursor = self._cursor()
-        try:
-            cursor.executemany(query, parameters)
-            return {
-                "lastrowid": cursor.lastrowid,
-                "rowcount": cursor.rowcount,
-            }
-        finally:
-            cursor.close()
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                cursor.executemany(query, parameters)
+                return {
+                    "lastrowid": cursor.lastrowid,
+                    "rowcount": cursor.rowcount,
+                }
+            finally:
+                cursor.close()
 
     def mk_insert_query(self, table, field, many=False):
         """
@@ -239,6 +479,14 @@ class PositionDB(Connection):
         query = self.mk_insert_query(table, field, many=True)
         return self.executemany_return_detail(query, *parameters, **kwparameters)
 
+    def load_data(self, table, rows, fields=None):
+        """
+        load rows by LOAD DATA LOCAL INFILE
+
+        :return: dict,rowcount,warnings and elapsed seconds
+        """
+        return self.load_data_return_detail(self.prefix + table, rows, fields)
+
     def delete(self, table, condition, *parameters, **kwparameters):
         """
         :return: tuple,lastrowid and rowcount
@@ -5,10 +5,18 @@ Support PostgreSQL
 
 bases on torndb
 """
+import datetime
+import itertools
+import json
 import logging
+import operator
+import re
+import struct
 import time
 
 import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
 
 try:
     from . import utility
@@ -25,13 +33,197 @@ GraceDict = utility.GraceDict
 is_array = utility.is_array
 to_unicode = utility.to_unicode
 
+PREPARABLE_STATEMENTS = ("select", "insert", "update", "delete")
+
+# INSERT statement with one row in VALUES,group 2 is the row,executemany sends many rows by execute_values
+INSERT_VALUES = re.compile(r"^(\s*INSERT\s+INTO\s.+?\bVALUES\s*)(\((?:[^()]|\([^()]*\))*\))(.*)$", re.I | re.S)
+
+# statements ChainDB.batch joins into one data-modifying WITH query,group 1 is the table written
+BATCH_STATEMENT = re.compile(r"^\s*(?:INSERT\s+INTO|UPDATE|DELETE\s+FROM)\s+([^\s(]+)", re.I)
+
+PG_EPOCH_DATE = datetime.date(2000, 1, 1)
+PG_EPOCH = datetime.datetime(2000, 1, 1)
+COPY_BINARY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+COPY_BINARY_TRAILER = struct.pack("!h", -1)
+
+
+def csv_value(v):
+    """encode a value to field of CSV COPY,unquoted empty field is NULL"""
+    if v is None:
+        return ""
+    if isinstance(v, str):
+        return '"' + v.replace('"', '""') + '"'
+    if isinstance(v, bool):
+        return "t" if v else "f"
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return "\\x" + bytes(v).hex()  # bytea hex format
+    if isinstance(v, (dict, list)):
+        return '"' + json.dumps(v).replace('"', '""') + '"'
+    return str(v)
+
+
+def csv_row(row):
+    return ",".join([csv_value(v) for v in row]) + "\n"
+
+
+def _binary_text(v):
+    return v.encode("utf8")
+
+
+def _binary_timestamp(v):
+    if v.tzinfo is not None:
+        v = v.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    delta = v - PG_EPOCH
+    return struct.pack("!q", (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds)
+
+
+BINARY_ENCODERS = {  # type OID => function encodes value to binary COPY field
+    16: lambda v: b"\x01" if v else b"\x00",  # boolean
+    17: bytes,  # bytea
+    20: lambda v: struct.pack("!q", v),  # bigint
+    21: lambda v: struct.pack("!h", v),  # smallint
+    23: lambda v: struct.pack("!i", v),  # integer
+    25: _binary_text,  # text
+    114: lambda v: (v if isinstance(v, str) else json.dumps(v)).encode("utf8"),  # json
+    700: lambda v: struct.pack("!f", v),  # real
+    701: lambda v: struct.pack("!d", v),  # double precision
+    1042: _binary_text,  # char
+    1043: _binary_text,  # varchar
+    1082: lambda v: struct.pack("!i", (v - PG_EPOCH_DATE).days),  # date
+    1114: _binary_timestamp,  # timestamp
+    1184: _binary_timestamp,  # timestamp with time zone,naive one is UTC
+    2950: lambda v: v.bytes,  # uuid.UUID
+    3802: lambda v: b"\x01" + (v if isinstance(v, str) else json.dumps(v)).encode("utf8"),  # jsonb
+}
+
+
+def binary_row_encoder(column_types):
+    """
+    function encodes a row to binary COPY tuple
+
+    :param column_types: list,type OID of columns
+    """
+    encoders = []
+    for oid in column_types:
+        if oid not in BINARY_ENCODERS:
+            raise ValueError(f"Binary COPY does not support type OID {oid},use csv format")
+        encoders.append(BINARY_ENCODERS[oid])
+    fields_count = struct.pack("!h", len(encoders))
+    null = struct.pack("!i", -1)
+    pack_length = struct.Struct("!i").pack
+
+    def encode(row):
+        data = [fields_count]
+        for encoder, v in zip(encoders, row):
+            if v is None:
+                data.append(null)
+            else:
+                v = encoder(v)
+                data.append(pack_length(len(v)))
+                data.append(v)
+        return b"".join(data)
+
+    return encode
+
+
+class CopyReader(object):
+    """
+    file-like object for copy_expert,encode rows when reading,
+    so rows are not loaded into memory at the same time.
+
+    :param rows: iterator of row tuple
+    :param encode: function encodes a row to bytes
+    """
+
+    def __init__(self, rows, encode, header=b"", trailer=b""):
+        self.rows = rows
+        self.encode = encode
+        self.trailer = trailer
+        self.rowcount = 0
+        self._buffer = [header] if header else []
+        self._finished = False
+
+    def read(self, size=65536):
+        buffer = self._buffer
+        length = sum(len(i) for i in buffer)
+        encode = self.encode
+        while not self._finished and length < size:
+            try:
+                row = next(self.rows)
+            except StopIteration:
+                self._finished = True
+                if self.trailer:
+                    buffer.append(self.trailer)
+                break
+            data = encode(row)
+            buffer.append(data)
+            length += len(data)
+            self.rowcount += 1
+        self._buffer = []
+        return b"".join(buffer)
+
+
+def parse_plan(plan, analyze=False):
+    """scan nodes in plan of EXPLAIN (FORMAT JSON)"""
+    nodes = []
+    node_type = plan.get("Node Type", "")
+    if node_type.endswith("Scan") and ("Relation Name" in plan or "Index Name" in plan):
+        if analyze and "Actual Rows" in plan:
+            rows = plan["Actual Rows"] * plan.get("Actual Loops", 1)
+        else:
+            rows = plan.get("Plan Rows")
+        nodes.append(base.plan_node(plan.get("Relation Name"), node_type, plan.get("Index Name"),
+                                    rows, node_type == "Seq Scan"))
+    for i in plan.get("Plans", []):
+        nodes += parse_plan(i, analyze)
+    return nodes
+
+
+class StatementConnection(psycopg2.extensions.connection):
+    """psycopg2 connection keeps its own prepared statements"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements = None  # LRUCache,SQL => statement name
+        self.statement_names = itertools.count(1)
+
+
+def split_insert_values(query):
+    """
+    split INSERT statement for execute_values
+
+    :return: tuple,query with VALUES %s and template of one row,None if query is not INSERT ... VALUES (...)
+    """
+    matched = INSERT_VALUES.match(query)
+    if not matched or "%" in matched.group(1) + matched.group(3):
+        return None
+    return f"{matched.group(1)}%s{matched.group(3)}", matched.group(2)
+
 
 class Connection(base.BaseConnection):
+    backend = "PostgreSQL"
+    numpy_dtypes = {  # type OID
+        16: "bool",  # boolean
+        20: "int64",  # bigint
+        21: "int64",  # smallint
+        23: "int64",  # integer
+        700: "float64",  # real
+        701: "float64",  # double precision
+        1082: "datetime64[D]",  # date
+        1114: "datetime64[us]",  # timestamp without time zone
+    }
+
     def __init__(self, host, port, database, user=None, password=None,
-                 max_idle_time=7 * 3600):
+                 max_idle_time=7 * 3600, pool_size=0, pool_min_size=1, pool_timeout=30.0,
+                 statement_cache_size=0, page_size=100):
         self.host = host
+        self.port = port
         self.database = database
         self.max_idle_time = float(max_idle_time)
+        self.page_size = page_size  # rows sent in one statement by executemany
+        # prepare statements on server,cache statement_cache_size ones for each connection
+        self.statement_cache_size = statement_cache_size
+        self._cursor_names = itertools.count(1)  # names of server side cursors
 
         args = dict(
             host=host,
@@ -45,88 +237,379 @@ class Connection(base.BaseConnection):
         self.db_args = args
         self._last_use_time = time.time()
         try:
-            self.reconnect()
+            self._init_connection(pool_size, pool_min_size, pool_timeout)
         except Exception:
             logging.error(f"Cannot connect to PostgreSQL on {self.host}:{port}",
                           exc_info=True)
 
-    def reconnect(self):
-        """Closes the existing database connection and re-opens it."""
-        self.close()
+    def _connect(self):
+        """return a new psycopg2 connection"""
+        if not self.statement_cache_size:
+            db = psycopg2.connect(**self.db_args)
+            db.set_session(autocommit=True)  # psycopg2 的设置方法不一样
+            return db
 
-        self.db = psycopg2.connect(**self.db_args)
-        self.db.set_session(autocommit=True)  # psycopg2 的设置方法不一样
+        db = psycopg2.connect(connection_factory=StatementConnection, **self.db_args)
+        db.set_session(autocommit=True)
 
-    def iter(self, query, *parameters, **kwparameters):
-        """Returns an iterator for the given query and parameters."""
-        self._ensure_connected()
-        # cursor = cursors.SSCursor(self.db) # psycopg2 没有 cursors
-        cursor = self._cursor()
-        try:
-            self._execute(cursor, query, parameters, kwparameters)
-            column_names = [d[0] for d in cursor.description]
-            for row in cursor:
-                yield Row(zip(column_names, row))
-        finally:
+        def deallocate(query, name):
+            cursor = db.cursor()
+            try:
+                cursor.execute(f"DEALLOCATE {name};")
+            except Exception:
+                logging.debug(f"Error when deallocating {name}", exc_info=True)
+            finally:
+                cursor.close()
+
+        db.statements = utility.LRUCache(self.statement_cache_size, on_evict=deallocate)
+        return db
+
+    def _prepare(self, cursor, query, parameters_length):
+        """
+        prepare the query on server if it has not been prepared by the connection
+
+        :return: str,EXECUTE statement with %s placeholders,None if the query can not be prepared
+        """
+        statements = getattr(cursor.connection, "statements", None)
+        if statements is None or "%(" in query:
+            return None
+        if query.lstrip()[:6].lower() not in PREPARABLE_STATEMENTS:
+            return None
+
+        name = statements.get(query)
+        if name is None:
+            name = f"saiorm_{next(cursor.connection.statement_names)}"
+            statement = utility.to_numbered_placeholders(query) if parameters_length else query
+            super()._execute(cursor, f"PREPARE {name} AS {statement}", None, None)
+            statements.set(query, name)
+
+        if parameters_length:
+            return f"EXECUTE {name} ({','.join(['%s'] * parameters_length)});"
+        return f"EXECUTE {name};"
+
+    def _execute(self, cursor, query, parameters, kwparameters):
+        if self.statement_cache_size and not kwparameters:
+            query = self._prepare(cursor, query, len(parameters)) or query
+        return super()._execute(cursor, query, parameters, kwparameters)
+
+    def _executed(self, cursor, query, parameters):
+        """query executed by cursor,the original one with values instead of EXECUTE of prepared statement"""
+        executed = to_unicode(cursor.query)
+        if self.statement_cache_size and executed.startswith("EXECUTE saiorm_"):
+            return to_unicode(cursor.mogrify(query, parameters))
+        return executed
+
+    def iter(self, query, *parameters, fetch_size=1000, row_factory=None, **kwparameters):
+        """
+        Returns an iterator for the given query and parameters,
+        use a named cursor on server,fetch fetch_size rows each time.
+
+        The cursor lives in a transaction until the iteration is finished,
+        out of transaction of begin,one is opened and committed when the iteration is finished.
+        """
+        with self._borrow() as db:
+            # a cursor WITH HOLD would run the whole query and store the result when committed,
+            # keep a transaction open instead so rows are read from server as they are fetched
+            own = db.autocommit and db.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+            if own:
+                db.autocommit = False  # psycopg2 begins the transaction with DECLARE
+            cursor = db.cursor(name=f"saiorm_iter_{next(self._cursor_names)}")
+            cursor.itersize = fetch_size
+            try:
+                # DECLARE CURSOR can not use prepared statement,skip self._execute
+                super()._execute(cursor, query, parameters, kwparameters)
+                make_row = None
+                for row in cursor:
+                    if make_row is None:  # description is set after the first fetching
+                        column_names = [d[0] for d in cursor.description]
+                        make_row = utility.row_maker(row_factory or self.row_factory, column_names)
+                    yield make_row(row)
+            finally:
+                try:
+                    cursor.close()
+                    if own:
+                        db.commit()
+                finally:
+                    if own:
+                        db.autocommit = True
+
+    def execute_batch_return_detail(self, statements):
+        """
+        INSERT,UPDATE and DELETE are joined into one data-modifying WITH query,which returns rowcount of each one,
+        a new query is started when a table written is written again,except inserting after inserting,
+        for statements in one query see the same snapshot.Others are executed one by one.
+        """
+        rounds = []  # list of statements,or one statement not joined
+        tables = {}  # table => written by INSERT only,of the last round
+        for query, values in statements:
+            matched = BATCH_STATEMENT.match(query)
+            if not matched or "RETURNING" in query.upper():
+                rounds.append((query, values))
+                tables = {}
+                continue
+            table = matched.group(1).strip('"').lower()
+            insert = query.lstrip()[:6].upper() == "INSERT"
+            if not rounds or not isinstance(rounds[-1], list) or (
+                    table in tables and not (insert and tables[table])):
+                rounds.append([])
+                tables = {}
+            rounds[-1].append((query, values))
+            tables[table] = insert and tables.get(table, True)
+
+        res = []
+        for i in rounds:
+            if not isinstance(i, list):
+                res.append(self.execute_return_detail(i[0], *i[1]))
+            elif len(i) == 1:
+                res.append(self.execute_return_detail(i[0][0], *i[0][1]))
+            else:
+                res += self._execute_with(i)
+        return res
+
+    def _execute_with(self, statements):
+        with self._borrow() as db:  # values are escaped by encoding of connection
+            cursor = db.cursor()
+            queries = [to_unicode(cursor.mogrify(query.strip().rstrip(";"), values or None))
+                       for query, values in statements]
             cursor.close()
+        parts = ", ".join([f"s{i} AS ({q} RETURNING 1)" for i, q in enumerate(queries)])
+        counts = ", ".join([f"(SELECT count(*) FROM s{i})" for i in range(len(queries))])
+        return self.execute_with_return_detail(f"WITH {parts} SELECT {counts};", queries)
 
-    def _log_exception(self, exception, query, parameters):
-        """log exception when execute SQL"""
-        pass
+    @base.events.observe("batch")
+    def execute_with_return_detail(self, query, queries):
+        """
+        execute a data-modifying WITH query selecting rowcount of each statement
 
-    def query_return_detail(self, query, *parameters, **kwparameters):
+        :param queries: list,statements in query
+        :return: list,detail of each statement
+        """
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                super()._execute(cursor, query, None, None)
+                return [{
+                    "lastrowid": 0,  # the primary key id affected
+                    "rowcount": rowcount,  # number of rows affected
+                    "rownumber": 0,  # line number
+                    "query": q  # query executed
+                } for rowcount, q in zip(cursor.fetchone(), queries)]
+            finally:
+                cursor.close()
+
+    def explain_return_detail(self, query, *parameters, analyze=False):
+        """
+        EXPLAIN (FORMAT JSON),EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) if analyze,
+        ANALYZE runs the query,rows are the actual ones.
+        """
+        options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+        res = self.query_return_detail(f"EXPLAIN ({options}) " + query, *parameters, row_factory=tuple)
+        plan = res["data"][0][0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return base.plan_detail(parse_plan(plan[0]["Plan"], analyze), plan, res["query"])
+
+    @base.events.observe("query")
+    def query_return_detail(self, query, *parameters, row_factory=None, **kwparameters):
         """return_detail"""
-        cursor = self._cursor()
-        try:
-            self._execute(cursor, query, parameters, kwparameters)
-            column_names = [d[0] for d in cursor.description]
-
-            return {
-                "data": [Row(zip(column_names, row)) for row in cursor],
-                "column_names": column_names,
-                "query": to_unicode(cursor.query)  # query executed
-            }
-        finally:
-            cursor.close()
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                self._execute(cursor, query, parameters, kwparameters)
+                column_names = [d[0] for d in cursor.description]
+                make_row = utility.row_maker(row_factory or self.row_factory, column_names)
+                return {
+                    "data": [make_row(row) for row in cursor],
+                    "column_names": column_names,
+                    "column_types": [d[1] for d in cursor.description],
+                    "query": self._executed(cursor, query, kwparameters or parameters)  # query executed
+                }
+            finally:
+                cursor.close()
 
+    @base.events.observe("execute")
     def execute_return_detail(self, query, *parameters, **kwparameters):
         """return_detail"""
-        cursor = self._cursor()
-        try:
-            self._execute(cursor, query, parameters, kwparameters)
-            return {
-                "lastrowid": cursor.lastrowid,  # the primary key id affected
-                "rowcount": cursor.rowcount,  # number of rows affected
-                "rownumber": cursor.rownumber,  # line number
-                "query": to_unicode(cursor.query)  # query executed
-            }
-        finally:
-            cursor.close()
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                self._execute(cursor, query, parameters, kwparameters)
+                return {
+                    "lastrowid": cursor.lastrowid,  # the primary key id affected
+                    "rowcount": cursor.rowcount,  # number of rows affected
+                    "rownumber": cursor.rownumber,  # line number
+                    "query": self._executed(cursor, query, kwparameters or parameters)  # query executed
+                }
+            finally:
+                cursor.close()
 
-    def executemany_return_detail(self, query, parameters):
-        """return_detail"""
-        cursor = self._cursor()
-        try:
-            cursor.executemany(query, parameters)
-            return {
-                "lastrowid": cursor.lastrowid,  # the primary key id affected
-                "rowcount": cursor.rowcount,  # number of rows affected
-                "rownumber": cursor.rownumber,  # line number
-                "query": to_unicode(cursor.query)  # query executed
-            }
-        except Exception as e:
-            self._log_exception(e, query, parameters)
-            self.close()
-            raise
-        finally:
-            cursor.close()
+    @base.events.observe("executemany")
+    def executemany_return_detail(self, query, parameters, page_size=None, row_factory=None, rowcount=True):
+        """
+        return_detail
+
+        INSERT ... VALUES (...) is sent by execute_values,page_size rows in each statement,
+        rows of RETURNING are in returning of the result,built by row_factory.
+        Others are sent by executemany of cursor,which counts rowcount of all statements.
+
+        :param rowcount: bool,False sends statements except INSERT by execute_batch,
+            page_size statements each time,much faster but rowcount is -1 for psycopg2 can not count it
+        """
+        page_size = page_size or self.page_size
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                parameters = list(parameters)
+                split = split_insert_values(query) if parameters and is_array(parameters[0]) else None
+                returning = []
+                if split:
+                    fetch = "RETURNING" in split[0].upper()
+                    count = 0
+                    for i in range(0, len(parameters), page_size):
+                        rows = psycopg2.extras.execute_values(cursor, split[0], parameters[i:i + page_size],
+                                                              split[1], page_size=page_size, fetch=fetch)
+                        count += cursor.rowcount
+                        if fetch:
+                            returning += rows
+                    if fetch and cursor.description:
+                        make_row = utility.row_maker(row_factory or self.row_factory,
+                                                     [d[0] for d in cursor.description])
+                        returning = [make_row(row) for row in returning]
+                else:
+                    statement = query
+                    if self.statement_cache_size and parameters and is_array(parameters[0]):
+                        statement = self._prepare(cursor, query, len(parameters[0])) or query
+                    if rowcount:
+                        cursor.executemany(statement, parameters)
+                        count = cursor.rowcount
+                    else:
+                        psycopg2.extras.execute_batch(cursor, statement, parameters, page_size=page_size)
+                        count = -1
+                return {
+                    "lastrowid": cursor.lastrowid,  # the primary key id affected
+                    "rowcount": count,  # number of rows affected
+                    "rownumber": cursor.rownumber,  # line number
+                    # query executed,the last statement
+                    "query": self._executed(cursor, query, parameters[-1]) if parameters else to_unicode(cursor.query),
+                    "returning": returning  # rows of RETURNING
+                }
+            except Exception as e:
+                self._log_exception(e, query, parameters)
+                self._discard()
+                raise
+            finally:
+                cursor.close()
+
+    @base.events.observe("copy_in")
+    def copy_in_return_detail(self, query, reader, buffer_size=65536):
+        """
+        run COPY FROM STDIN
+
+        :param reader: CopyReader or file-like object
+        :param buffer_size: int,bytes read from reader each time
+        """
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                cursor.copy_expert(query, reader, size=buffer_size)
+                return {
+                    "lastrowid": 0,  # the primary key id affected
+                    "rowcount": getattr(reader, "rowcount", cursor.rowcount),  # number of rows copied
+                    "rownumber": 0,  # line number
+                    "query": query  # query executed
+                }
+            except Exception as e:
+                self._log_exception(e, query, None)
+                raise
+            finally:
+                cursor.close()
 
 
 class ChainDB(base.ChainDB):
     field_name_quote = '"'
+    schema_query = base.schema.POSTGRESQL_QUERY
+    gen_upsert_rows = base.ChainDB.gen_on_conflict_rows
+
+    def connect(self, config_dict=None, replicas=None, replica_strategy="round_robin"):
+        """
+        config_dict accepts host, port, database, user, password, pool_size, statement_cache_size and page_size,
+        see Connection,statement_cache_size prepares statements on server.
+        """
+        self.connection = self.new_connection(Connection, config_dict, replicas, replica_strategy)
+
+    def copy_in(self, rows, fields=None, format="csv", buffer_size=65536):
+        """
+        load rows into table by COPY FROM STDIN,much faster than insert_many.
+
+        Rows are encoded when COPY reads them,so rows can be a generator of big data.
+
+        :param rows: iterable of dict,tuple or list
+        :param fields: list,field names,keys of the first dict by default,
+            all fields of table if rows are tuples and fields is None
+        :param format: str,csv or binary.Binary is faster but supports basic types only,
+            like integer,float,boolean,text,bytea,date,timestamp,uuid and json
+        :param buffer_size: int,bytes sent to server each time
+        """
+        rows = iter(rows)
+        try:
+            first = next(rows)
+        except StopIteration:
+            return False
+        rows = itertools.chain([first], rows)
+
+        if isinstance(first, dict):
+            fields = list(fields or first.keys())
+            if len(fields) == 1:
+                getter = operator.itemgetter(fields[0])
+                rows = ((getter(i),) for i in rows)
+            else:
+                rows = map(operator.itemgetter(*fields), rows)
+
+        columns = f" ({','.join(fields)})" if fields else ""
+        if format == "binary":
+            sql = f"SELECT {','.join(fields) if fields else '*'} FROM {self._table} LIMIT 0;"
+            column_types = self.connection.query_return_detail(sql, row_factory=tuple)["column_types"]
+            reader = CopyReader(rows, binary_row_encoder(column_types),
+                                header=COPY_BINARY_HEADER, trailer=COPY_BINARY_TRAILER)
+            sql = f"COPY {self._table}{columns} FROM STDIN WITH (FORMAT binary);"
+        elif format == "csv":
+            reader = CopyReader(rows, lambda row: csv_row(row).encode("utf8"))
+            sql = f"COPY {self._table}{columns} FROM STDIN WITH (FORMAT csv, ENCODING 'UTF8');"
+        else:
+            raise ValueError("format of COPY should be csv or binary")
+
+        res = self.connection.copy_in_return_detail(sql, reader, buffer_size)
+        self.invalidate_cache()
+        self.last_query = res["query"]
+        return res
+
+    bulk_load = copy_in  # alias
+
+    def insert_many(self, dict_data=None, returning=None):
+        """
+        insert many lines by execute_values of psycopg2,max_insert_rows lines in each statement
+
+        :param returning: str,RETURNING columns like "id",rows of them are in returning of the result
+        """
+        if self.in_batch() is not None:
+            if returning:
+                raise RuntimeError("returning of insert_many is not supported in batch")
+            return super().insert_many(dict_data)
+
+        if not dict_data:
+            return False
+
+        insert = self.build_insert_many(dict_data)
+        if not insert:
+            return False
 
-    def connect(self, config_dict=None):
-        self.connection = Connection(**config_dict)
+        sql, values = insert
+        if returning:
+            sql = f"{sql.rstrip().rstrip(';')} RETURNING {returning};"
+        res = self.connection.executemany_return_detail(sql, values, page_size=self.max_insert_rows)
+        self.invalidate_cache()
+        self.last_query = res["query"]
+        return res
 
     def parse_limit(self, sql):
         """parse limit condition"""
@@ -7,6 +7,7 @@ bases on torndb
 """
 import logging
 import time
+import xml.etree.ElementTree
 
 import pymssql
 
@@ -26,10 +27,39 @@ is_array = utility.is_array
 to_unicode = utility.to_unicode
 
 
+SHOWPLAN_NAMESPACE = "{http://schemas.microsoft.com/sqlserver/2004/07/showplan}"
+
+
+def parse_plan(plan):
+    """operators reading tables in SHOWPLAN_XML"""
+    nodes = []
+    root = xml.etree.ElementTree.fromstring(plan)
+    for rel_op in root.iter(SHOWPLAN_NAMESPACE + "RelOp"):
+        physical_op = rel_op.get("PhysicalOp", "")
+        for child in rel_op:
+            obj = child.find(SHOWPLAN_NAMESPACE + "Object")
+            if obj is None:
+                continue
+            table = obj.get("Table", "").strip("[]")
+            index = obj.get("Index", "").strip("[]") or None
+            rows = rel_op.get("EstimatedRowsRead") or rel_op.get("EstimateRows")
+            nodes.append(base.plan_node(table, physical_op, index, float(rows) if rows else None,
+                                        physical_op.endswith("Scan")))
+            break
+    return nodes
+
+
 class Connection(base.BaseConnection):
+    backend = "SQLServer"
+    numpy_dtypes = {  # pymssql NUMBER covers int and float,let NumPy infer it
+        4: "datetime64[us]",  # DATETIME
+    }
+
     def __init__(self, host, port, database, user=None, password=None,
-                 max_idle_time=7 * 3600, return_query=False):
+                 max_idle_time=7 * 3600, return_query=False, pool_size=0,
+                 pool_min_size=1, pool_timeout=30.0):
         self.host = host
+        self.port = port
         self.database = database
         self.max_idle_time = float(max_idle_time)
         self._return_query = return_query
@@ -46,168 +76,235 @@ class Connection(base.BaseConnection):
         self.db_args = args
         self._last_use_time = time.time()
         try:
-            self.reconnect()
+            self._init_connection(pool_size, pool_min_size, pool_timeout)
         except Exception:
             logging.error(f"Cannot connect to SQLServer on {self.host}:{port}",
                           exc_info=True)
 
-
-
-    def reconnect(self):
-        """Closes the existing database connection and re-opens it.
-        改用 pymssql 实现"""
-        self.close()
-
-        self.db = pymssql.connect(**self.db_args)
-        self.db.autocommit(True)
-
-    def iter(self, query, *parameters, **kwparameters):
-        """Returns an iterator for the given query and parameters."""
-        self._ensure_connected()
-        # cursor = cursors.SSCursor(self.db) # psycopg2 没有 cursors
-        cursor = self._cursor()
-        try:
-            self._execute(cursor, query, parameters, kwparameters)
-            column_names = [d[0] for d in cursor.description]
-            for row in cursor:
-                yield Row(zip(column_names, row))
-        finally:
-            cursor.close()
-
-
-
-
-    def _log_exception(self, exception, query, parameters):
-        """log exception when execute SQL"""
-        pass
-
-
-
-    def query_return_detail(self, query, *parameters, **kwparameters):
+    def _connect(self):
+        """return a new connection,改用 pymssql 实现"""
+        db = pymssql.connect(**self.db_args)
+        db.autocommit(True)
+        return db
+
+    def iter(self, query, *parameters, fetch_size=1000, row_factory=None, **kwparameters):
+        """Returns an iterator for the given query and parameters,fetch fetch_size rows each time."""
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                self._execute(cursor, query, parameters, kwparameters)
+                column_names = [d[0] for d in cursor.description]
+                make_row = utility.row_maker(row_factory or self.row_factory, column_names)
+                while True:
+                    rows = cursor.fetchmany(fetch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield make_row(row)
+            finally:
+                cursor.close()
+
+    _server_version = 0
+
+    def get_server_version(self):
+        """major version of server,11 is SQL Server 2012"""
+        if not self._server_version:
+            res = self.query_return_detail(
+                "SELECT CAST(SERVERPROPERTY('ProductVersion') AS VARCHAR(32));", row_factory=tuple)
+            self._server_version = int(res["data"][0][0].split(".")[0])
+        return self._server_version
+
+    def explain_return_detail(self, query, *parameters, analyze=False):
+        """
+        SET SHOWPLAN_XML ON,the query is compiled but not run,analyze is not supported.
+        SHOWPLAN_XML is a setting of session,so they are run on one connection.
+        """
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                cursor.execute("SET SHOWPLAN_XML ON;")
+                try:
+                    self._execute(cursor, query, parameters, {})
+                    plan = "".join(row[0] for row in cursor.fetchall())
+                finally:
+                    cursor.execute("SET SHOWPLAN_XML OFF;")
+            finally:
+                cursor.close()
+        return base.plan_detail(parse_plan(plan), plan, query)
+
+    @base.events.observe("query")
+    def query_return_detail(self, query, *parameters, row_factory=None, **kwparameters):
         """return_detail"""
-        cursor = self._cursor()
-        try:
-            self._execute(cursor, query, parameters, kwparameters)
-            column_names = [d[0] for d in cursor.description]
-            return {
-                "data": [Row(zip(column_names, row)) for row in cursor.fetchall()],
-                "column_names": column_names,
-                "query": query.replace("%s", "{}").format(*parameters) if self._return_query else ""  # query executed
-            }
-        finally:
-            cursor.close()
-
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                self._execute(cursor, query, parameters, kwparameters)
+                column_names = [d[0] for d in cursor.description]
+                make_row = utility.row_maker(row_factory or self.row_factory, column_names)
+                return {
+                    "data": [make_row(row) for row in cursor.fetchall()],
+                    "column_names": column_names,
+                    "column_types": [d[1] for d in cursor.description],
+                    "query": query.replace("%s", "{}").format(*parameters) if self._return_query else ""  # query executed
+                }
+            finally:
+                cursor.close()
+
+    @base.events.observe("execute")
     def execute_return_detail(self, query, *parameters, **kwparameters):
         """return_detail"""
-        cursor = self._cursor()
-        try:
-            self._execute(cursor, query, parameters, kwparameters)
-            return {
-                "lastrowid": cursor.lastrowid,  # the primary key id affected
-                "rowcount": cursor.rowcount,  # number of rows affected
-                "rownumber": cursor.rownumber,  # line number
-                "query": query.replace("%s", "{}").format(*parameters) if self._return_query else ""  # query executed
-            }
-        finally:
-            cursor.close()
-
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                self._execute(cursor, query, parameters, kwparameters)
+                return {
+                    "lastrowid": cursor.lastrowid,  # the primary key id affected
+                    "rowcount": cursor.rowcount,  # number of rows affected
+                    "rownumber": cursor.rownumber,  # line number
+                    "query": query.replace("%s", "{}").format(*parameters) if self._return_query else ""  # query executed
+                }
+            finally:
+                cursor.close()
+
+    @base.events.observe("executemany")
     def executemany_return_detail(self, query, parameters):
         """return_detail"""
-        cursor = self._cursor()
-        try:
-            cursor.executemany(query, parameters)
-            return {
-                "lastrowid": cursor.lastrowid,  # the primary key id affected
-                "rowcount": cursor.rowcount,  # number of rows affected
-                "rownumber": cursor.rownumber,  # line number
-                "query": query.replace("%s", "{}").format(*parameters) if self._return_query else ""  # query executed
-            }
-        except Exception as e:
-            self._log_exception(e, query, parameters)
-            self.close()
-            raise
-        finally:
-            cursor.close()
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                cursor.executemany(query, parameters)
+                return {
+                    "lastrowid": cursor.lastrowid,  # the primary key id affected
+                    "rowcount": cursor.rowcount,  # number of rows affected
+                    "rownumber": cursor.rownumber,  # line number
+                    "query": query.replace("%s", "{}").format(*parameters) if self._return_query else ""  # query executed
+                }
+            except Exception as e:
+                self._log_exception(e, query, parameters)
+                self._discard()
+                raise
+            finally:
+                cursor.close()
 
 
 class ChainDB(base.ChainDB):
+    field_name_quote = '"'
+    max_insert_rows = 1000  # max rows of table value constructor
+    max_insert_params = 2100  # max parameters of one request
+    schema_query = base.schema.SQLSERVER_QUERY
+
     def __init__(self, table_name_prefix="", debug=False, strict=True,
-                 cache_fields_name=True, grace_result=True, primary_key=""):
+                 cache_fields_name=True, grace_result=True, primary_key="", **kwargs):
         self._primary_key = primary_key  # For SQL Server
         self._return_query = None
-        self.field_name_quote = "'"
+        self.offset_fetch = None  # use OFFSET FETCH to page,detect by server version if None
         super().__init__(table_name_prefix=table_name_prefix, debug=debug, strict=strict,
-                         cache_fields_name=cache_fields_name, grace_result=grace_result)
+                         cache_fields_name=cache_fields_name, grace_result=grace_result,
+                         **kwargs)
 
-    def connect(self, config_dict=None, return_query=False):
+    def connect(self, config_dict=None, return_query=False, replicas=None, replica_strategy="round_robin"):
         config_dict["return_query"] = return_query
-        self.connection = Connection(**config_dict)
+        for i in replicas or []:
+            i["return_query"] = return_query
+        self.connection = self.new_connection(Connection, config_dict, replicas, replica_strategy)
 
     def table(self, table_name="", primary_key=""):
         """
         If table_name is empty,use DB().select("now()") will run SELECT now()
         """
-        self._primary_key = primary_key
-        super().table(table_name=table_name)
-        return self
+        return super().table(table_name=table_name).clone(_primary_key=primary_key)
+
+    def parse_limit(self, sql):
+        """SQL Server does not support LIMIT,implemented in compile_select"""
+        return sql
+
+    def parse_offset_count(self):
+        """
+        offset and count of rows from limit and offset,limit("m,n") means offset m and count n
 
-    def select(self, fields="*"):
+        :return: tuple,int offset and count,count is 0 if there is no limit
         """
-        fields is fields or native sql function,
-        ,use DB().select("=now()") will run SELECT now()
+        if not self._limit:
+            return 0, 0
+        if isinstance(self._limit, str) and "," in self._limit:
+            m, n = self._limit.replace(" ", "").split(",")
+            return int(m), int(n)
+        return int(self._offset or 0), int(self._limit)
+
+    def supports_offset_fetch(self):
+        """OFFSET FETCH is supported since SQL Server 2012(version 11)"""
+        if self.offset_fetch is None:
+            self.offset_fetch = self.connection.get_server_version() >= 11
+        return self.offset_fetch
+
+    def compile_select(self, fields="*"):
         """
-        condition_values = []
-        pre_sql = ""
-        pre_where = ""
+        generate SELECT statement,implement LIMIT with TOP,
+        OFFSET FETCH(SQL Server 2012+) or ROW_NUMBER,offset and count are bound values.
 
+        ORDER BY is necessary to page with offset,primary key of table is used if order_by is not set.
+
+        :return: tuple,sql and values
+        """
         if fields.startswith("`"):  # native function
-            sql = self.gen_select_without_fields(fields[1:])
-        else:
-            # implement LIMIT here
-            if self._limit:
-                _limit = str(self._limit)
-
-                # used here:
-                # SELECT TOP (n-m+1) id FROM tablename
-                # WHERE id NOT IN (
-                #  SELECT TOP m-1 id FROM tablename
-                # )
-                # another way :
-                # SELECT * FROM xxx ORDER BY id OFFSET 5 ROWS FETCH NEXT 5 ROWS ONLY
-
-                if "," not in _limit:
-                    pre_sql = "SELECT TOP {} {} FROM {} ".format(_limit, fields, self._table)
-                else:
-                    m, n = _limit.split(",")
-                    if self._where:
-                        pre_where = f" WHERE {self._primary_key} NOT IN" \
-                                    f" (SELECT TOP {m}-1 {self._primary_key} FROM {self._table}) "
-                        self._where = None  # clean self._where
-                    else:
-                        pre_sql = f"SELECT TOP ({n}-{m}+1) {fields} FROM {self._table}" \
-                                  f" WHERE {self._primary_key} NOT IN (SELECT TOP {m}-1 {self._primary_key} FROM {self._table})"
-                self._limit = None  # clean self._limit
-            else:
-                pre_sql = "SELECT {} FROM {} ".format(fields, self._table)
-
-            condition_sql, condition_values = self.parse_condition()
-
-            if pre_where:
-                # todo after fixing join statement,here will have issue
-                if condition_sql.startswith("WHERE"):
-                    condition_sql = f"{pre_where} AND {condition_sql[len('WHERE'):]}"
-                else:
-                    condition_sql = f"{pre_where} AND {condition_sql}"
-
-            sql = pre_sql + condition_sql
-
-        res = self.query(sql, *condition_values)
-        self.last_query = res["query"]
-        if self.grace_result:
-            res["data"] = [GraceDict(i) for i in res["data"]]
-
-        return res["data"]
+            return self.gen_select_without_fields(fields[1:]), []
+
+        fields = self.wrap_field_name(fields)
+        offset, count = self.parse_offset_count()
+        sql = self.parse_join()
+        sql, condition_values = self.parse_where_condition(sql)
+        sql = self.parse_group_by(sql)
+
+        if not count:
+            sql = self.parse_order_by(sql)
+            return f"SELECT {fields} FROM {self._table} {sql};", condition_values
+
+        if not offset:
+            sql = self.parse_order_by(sql)
+            return f"SELECT TOP ({self.param_place_holder}) {fields} FROM {self._table} {sql};", \
+                   [count] + condition_values
+
+        order_by = self._order_by or self._primary_key or "(SELECT NULL)"
+        if self.supports_offset_fetch():
+            return f"SELECT {fields} FROM {self._table} {sql} ORDER BY {order_by}" \
+                   f" OFFSET {self.param_place_holder} ROWS FETCH NEXT {self.param_place_holder} ROWS ONLY;", \
+                   condition_values + [offset, count]
+
+        # before SQL Server 2012,column _row_number is in the result
+        return f"SELECT * FROM (SELECT {fields}, ROW_NUMBER() OVER (ORDER BY {order_by}) AS _row_number" \
+               f" FROM {self._table} {sql}) AS _page" \
+               f" WHERE _row_number > {self.param_place_holder} AND _row_number <= {self.param_place_holder}" \
+               f" ORDER BY _row_number;", condition_values + [offset, offset + count]
+
+    def select_shape(self, fields):
+        """the shape of SELECT statement,offset and count are bound around the where values as compile_select does"""
+        key, values = super().select_shape(fields)
+        if key is None:
+            return key, values
+        key += (self._primary_key,)  # the default order of paging
+        offset, count = self.parse_offset_count()
+        if not count:
+            return key, values
+        if not offset:
+            return key, [count] + values
+        if self.supports_offset_fetch():
+            return key, values + [offset, count]
+        return key, values + [offset, offset + count]
+
+    def gen_paginate(self, fields, condition, order, values, limit):
+        return f"SELECT TOP ({self.param_place_holder}) {fields} FROM {self._table} {condition} ORDER BY {order};", \
+               [limit] + values
 
     def gen_get_fields_name(self):
         """get one line from table"""
         return f"SELECT TOP 1 * FROM {self._table};"
+
+    def gen_upsert_rows(self, fields, values_sign, rows_count, conflict_keys, update_fields):
+        """MERGE with rows in VALUES as source,HOLDLOCK keeps concurrent upserts from inserting the same key"""
+        names = base.split_names(fields)
+        rows_sign = ",".join([f"({values_sign})"] * rows_count)
+        on = " AND ".join([f"t.{i}=s.{i}" for i in conflict_keys])
+        sql = f"MERGE INTO {self._table} WITH (HOLDLOCK) AS t USING (VALUES {rows_sign}) AS s ({fields}) ON {on}"
+        if update_fields:
+            sql += f" WHEN MATCHED THEN UPDATE SET {','.join([f't.{i}=s.{i}' for i in update_fields])}"
+        return f"{sql} WHEN NOT MATCHED THEN INSERT ({fields}) VALUES ({','.join(['s.' + i for i in names])});"
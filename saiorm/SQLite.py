@@ -6,6 +6,7 @@ Support SQLite
 bases on torndb
 """
 import logging
+import re
 import time
 
 import sqlite3
@@ -25,60 +26,123 @@ GraceDict = utility.GraceDict
 is_array = utility.is_array
 to_unicode = utility.to_unicode
 
+PROFILES = {  # PRAGMA for profile param of connect
+    # concurrent readers with one writer,fsync less,more memory
+    "performance": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64000,  # 64MB
+        "mmap_size": 268435456,  # 256MB
+        "temp_store": "MEMORY",
+    },
+}
+
+
+# SCAN t,SEARCH t USING INDEX i (a=?),SCAN TABLE t AS a USING COVERING INDEX i before 3.36
+PLAN_DETAIL = re.compile(r"^(SCAN|SEARCH)\s+(?:TABLE\s+)?(\S+)(?:\s+AS\s+\S+)?"
+                         r"(?:\s+USING\s+(?:COVERING\s+|AUTOMATIC\s+(?:COVERING\s+)?)?INDEX\s+(\S+)"
+                         r"|\s+USING\s+(INTEGER PRIMARY KEY|PRIMARY KEY))?")
+
+
+def parse_plan(rows):
+    """tables in rows of EXPLAIN QUERY PLAN,SQLite does not estimate rows"""
+    nodes = []
+    for row in rows:
+        m = PLAN_DETAIL.match(row[3])
+        if m:
+            access, table, index, primary_key = m.groups()
+            nodes.append(base.plan_node(table, access, index or primary_key, None, access == "SCAN"))
+    return nodes
+
 
 class Connection(base.BaseConnection):
-    def __init__(self, host, return_query=False):
+    backend = "SQLite"
+
+    def __init__(self, host, return_query=False, statement_cache_size=128, profile=None,
+                 pragmas=None, commit_interval=10000):
+        """
+        :param profile: str,name in PROFILES,like performance
+        :param pragmas: dict,PRAGMA executed after connecting,override the ones of profile
+        :param commit_interval: int,executemany and insert_many commit every commit_interval rows
+            in explicit transactions,0 to commit every statement
+        """
         self.host = host
         self._return_query = return_query
+        # sqlite3 prepares every statement,keep statement_cache_size ones for each connection
+        self.statement_cache_size = statement_cache_size
+        self.pragmas = dict(PROFILES[profile]) if profile else {}
+        self.pragmas.update(pragmas or {})
+        self.commit_interval = commit_interval
 
         self.db = None
         self._last_use_time = time.time()
         try:
-            self.reconnect()
+            self._init_connection()
         except Exception:
             logging.error(f"Cannot connect to SQLite on {self.host}",
                           exc_info=True)
 
-    def reconnect(self):
-        """Closes the existing database connection and re-opens it."""
-        self.close()
-        self.db = sqlite3.connect(self.host)
+    def _connect(self):
+        """
+        return a new sqlite3 connection
 
-    def iter(self, query, *parameters, **kwparameters):
-        """Returns an iterator for the given query and parameters."""
-        # self._ensure_connected()
-        # cursor = cursors.SSCursor(self.db) # psycopg2 没有 cursors
+        It's in autocommit mode,transactions are started by BEGIN explicitly,
+        or the writes would never be committed.
+        """
+        db = sqlite3.connect(self.host, cached_statements=self.statement_cache_size,
+                             isolation_level=None)
+        for k, v in self.pragmas.items():
+            db.execute(f"PRAGMA {k}={v};")
+        return db
+
+    def iter(self, query, *parameters, fetch_size=1000, row_factory=None, **kwparameters):
+        """Returns an iterator for the given query and parameters,fetch fetch_size rows each time."""
         cursor = self._cursor()
         try:
             self._execute(cursor, query, parameters, kwparameters)
             column_names = [d[0] for d in cursor.description]
-            for row in cursor:
-                yield Row(zip(column_names, row))
+            make_row = utility.row_maker(row_factory or self.row_factory, column_names)
+            while True:
+                rows = cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield make_row(row)
         finally:
             cursor.close()
 
     def _ensure_connected(self):
         pass
 
-    def _log_exception(self, exception, query, parameters):
-        """log exception when execute SQL"""
+    def _discard(self):
+        """errors of sqlite3 do not break the connection,keep it(closing loses :memory: database)"""
         pass
 
-    def query_return_detail(self, query, *parameters, **kwparameters):
+    def explain_return_detail(self, query, *parameters, analyze=False):
+        """EXPLAIN QUERY PLAN,analyze is not supported"""
+        res = self.query_return_detail("EXPLAIN QUERY PLAN " + query, *parameters, row_factory=tuple)
+        plan = res["data"]
+        return base.plan_detail(parse_plan(plan), plan, query)
+
+    @base.events.observe("query")
+    def query_return_detail(self, query, *parameters, row_factory=None, **kwparameters):
         """return_detail"""
         cursor = self._cursor()
         try:
             self._execute(cursor, query, parameters, kwparameters)
             column_names = [d[0] for d in cursor.description]
+            make_row = utility.row_maker(row_factory or self.row_factory, column_names)
             return {
-                "data": [Row(zip(column_names, row)) for row in cursor.fetchall()],
+                "data": [make_row(row) for row in cursor.fetchall()],
                 "column_names": column_names,
+                "column_types": [d[1] for d in cursor.description],  # always None in sqlite3
                 "query": query.replace("?", "{}").format(*parameters) if self._return_query else ""  # query executed
             }
         finally:
             # cursor.close()
             pass
 
+    @base.events.observe("execute")
     def execute_return_detail(self, query, *parameters, **kwparameters):
         """return_detail"""
         cursor = self._cursor()
@@ -94,20 +158,55 @@ class Connection(base.BaseConnection):
             # cursor.close()
             pass
 
+    def execute_batch_return_detail(self, statements):
+        """
+        executed one by one in one transaction,
+        executescript can not bind values or return rowcount of each statement
+        """
+        if self.db.in_transaction:
+            return super().execute_batch_return_detail(statements)
+        cursor = self._cursor()
+        cursor.execute("BEGIN;")
+        try:
+            res = super().execute_batch_return_detail(statements)
+            cursor.execute("COMMIT;")
+        except Exception:
+            if self.db.in_transaction:
+                self.db.rollback()
+            raise
+        return res
+
+    @base.events.observe("executemany")
     def executemany_return_detail(self, query, parameters):
-        """return_detail"""
+        """
+        return_detail
+
+        Out of transaction,rows are committed every commit_interval ones in explicit transactions.
+        """
         cursor = self._cursor()
+        batch = self.commit_interval and not self.db.in_transaction
         try:
-            cursor.executemany(query, parameters)
+            if batch:
+                parameters = list(parameters)
+                rowcount = 0
+                for i in range(0, len(parameters), self.commit_interval):
+                    cursor.execute("BEGIN;")
+                    cursor.executemany(query, parameters[i:i + self.commit_interval])
+                    rowcount += cursor.rowcount
+                    cursor.execute("COMMIT;")
+            else:
+                cursor.executemany(query, parameters)
+                rowcount = cursor.rowcount
             return {
                 "lastrowid": cursor.lastrowid,  # the primary key id affected
-                "rowcount": cursor.rowcount,  # number of rows affected
+                "rowcount": rowcount,  # number of rows affected
                 "rownumber": 0,  # line number
                 "query": query.replace("?", "{}").format(*parameters) if self._return_query else ""  # query executed
             }
         except Exception as e:
             self._log_exception(e, query, parameters)
-            self.close()
+            if batch and self.db.in_transaction:
+                self.db.rollback()
             raise
         finally:
             pass
@@ -115,12 +214,50 @@ class Connection(base.BaseConnection):
 
 class ChainDB(base.ChainDB):
     field_name_quote = '"'
+    begin_statement = "BEGIN;"
+    schema_query = base.schema.SQLITE_QUERY
+    gen_upsert_rows = base.ChainDB.gen_on_conflict_rows
+    # SQLITE_MAX_VARIABLE_NUMBER,defaults to 999 before 3.32.0
+    max_insert_params = 999 if sqlite3.sqlite_version_info < (3, 32, 0) else 32766
 
     def connect(self, config_dict=None, return_query=False):
+        """
+        config_dict accepts host, statement_cache_size, profile, pragmas and commit_interval,
+        see Connection.
+        """
         config_dict["return_query"] = return_query
         self.connection = Connection(**config_dict)
         self.param_place_holder = "?"
 
+    def execute_chunks(self, chunks):
+        """
+        execute statements of insert_many in explicit transactions,
+        commit every commit_interval rows
+        """
+        commit_interval = self.connection.commit_interval
+        if not commit_interval or self.connection.db.in_transaction or self.in_batch() is not None:
+            return super().execute_chunks(chunks)
+
+        res = None
+        rowcount = 0
+        uncommitted = 0
+        self.begin()
+        try:
+            for sql, values in chunks:
+                res = self.execute(sql, *values)
+                rowcount += res["rowcount"]
+                uncommitted += res["rowcount"]
+                if uncommitted >= commit_interval:
+                    self.execute("COMMIT;")
+                    self.execute(self.begin_statement)
+                    uncommitted = 0
+        except Exception:
+            self.rollback()
+            raise
+        self.commit()
+        res["rowcount"] = rowcount
+        return res
+
     def parse_limit(self, sql):
         """parse limit condition"""
 
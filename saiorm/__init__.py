@@ -1,5 +1,8 @@
 #!/usr/bin/env python
 # -*- coding:utf-8 -*-
+from . import cache
+from . import events
+from . import schema
 from .utility import GraceDict
 
 
@@ -25,3 +28,28 @@ def init(driver="MySQL", **kwargs):
         return ChainDB(**kwargs)
     else:
         raise ValueError("saiorm does not support " + driver)
+
+
+def init_sharded(driver="MySQL", shard_key="id", strategy="hash", bounds=None, max_workers=None,
+                 table_shard_keys=None, **kwargs):
+    """
+    ChainDB on many databases,call connect with a list of config dict,
+    kwargs are passed to init for each shard,see shard.ShardedDB
+    """
+    from .shard import ShardedDB
+    return ShardedDB(lambda: init(driver, **kwargs), shard_key=shard_key, strategy=strategy,
+                     bounds=bounds, max_workers=max_workers, table_shard_keys=table_shard_keys)
+
+
+def init_async(driver="MySQL", **kwargs):
+    """ChainDB running in asyncio,require aiomysql, asyncpg or aiosqlite"""
+    from . import aio
+    driver_lower = driver.lower()
+    if driver_lower == "mysql":
+        return aio.MySQLChainDB(**kwargs)
+    elif driver_lower == "postgresql":
+        return aio.PostgreSQLChainDB(**kwargs)
+    elif driver_lower == "sqlite":
+        return aio.SQLiteChainDB(**kwargs)
+    else:
+        raise ValueError("saiorm does not support asyncio with " + driver)
@@ -0,0 +1,691 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+Support asyncio
+
+The chain API is same as ChainDB,terminal methods are coroutines::
+
+    DB = saiorm.init_async(driver="MySQL")
+    await DB.connect({"host": "", "port": 3306, "database": "", "user": "", "password": ""})
+    res = await DB.table("xxx").where([("id", 1)]).select()
+
+Require aiomysql for MySQL, asyncpg for PostgreSQL, aiosqlite for SQLite.
+
+Every connection is a pool,pass pool_size to connect to run more queries concurrently.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+
+try:
+    import aiomysql
+except ImportError:
+    aiomysql = None
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+try:
+    import aiosqlite
+except ImportError:
+    aiosqlite = None
+
+try:
+    from . import utility
+except ImportError:
+    import utility
+
+try:
+    from . import base
+except ImportError:
+    import base
+
+try:
+    from . import pool
+except ImportError:
+    import pool
+
+try:
+    from . import cache
+except ImportError:
+    import cache
+
+try:
+    from . import SQLite
+except ImportError:
+    import SQLite
+
+Row = utility.Row
+GraceDict = utility.GraceDict
+to_unicode = utility.to_unicode
+to_numbered_placeholders = utility.to_numbered_placeholders
+
+
+def _require(driver, name):
+    if driver is None:
+        raise ImportError(f"saiorm requires {name} to use asyncio with this database")
+
+
+class AsyncBaseConnection(object):
+    """
+    Connection pool running in asyncio.
+
+    Subclass should implement _connect, _close_db, _query, _execute, _executemany and _iter.
+    """
+    backend = "MySQL"  # name in events
+    row_factory = Row  # type of rows returned by query_return_detail and iter
+    numpy_dtypes = {}  # column types are not returned,NumPy infers dtype from values
+    listeners = []  # events.Listener of this connection,see add_listener
+
+    def __init__(self, max_idle_time=7 * 3600, pool_size=10, pool_min_size=1,
+                 pool_timeout=30.0):
+        self.max_idle_time = float(max_idle_time)
+        self.pool = pool.AsyncConnectionPool(self._connect, self._close_db,
+                                             min_size=pool_min_size,
+                                             max_size=pool_size,
+                                             timeout=pool_timeout,
+                                             validator=self._ping,
+                                             max_idle_time=self.max_idle_time)
+        # connection pinned by transaction in current task
+        self._pinned = contextvars.ContextVar(f"saiorm_pinned_{id(self)}", default=None)
+
+    async def open(self):
+        """create pool_min_size connections"""
+        await self.pool.fill()
+
+    async def close(self):
+        """close all idle connections"""
+        await self.pool.close()
+
+    async def _connect(self):
+        raise NotImplementedError("You must implement it in subclass")
+
+    async def _close_db(self, db):
+        await db.close()
+
+    async def _ping(self, db):
+        raise NotImplementedError("You must implement it in subclass")
+
+    @contextlib.asynccontextmanager
+    async def _borrow(self):
+        """yield the connection pinned by transaction or borrow one from pool"""
+        pinned = self._pinned.get()
+        if pinned is not None:
+            yield pinned
+            return
+
+        db = await self.pool.acquire()
+        ok = False
+        try:
+            yield db
+            ok = True
+        finally:
+            if ok:
+                await self.pool.release(db)
+            else:
+                await self.pool.discard(db)
+
+    async def pin(self):
+        """use one connection in current task until unpin,for transaction"""
+        if self._pinned.get() is None:
+            self._pinned.set(await self.pool.acquire())
+
+    async def unpin(self, discard=False):
+        """
+        return the connection pinned by current task
+
+        :param discard: bool,close the broken connection instead of returning it
+        """
+        db = self._pinned.get()
+        self._pinned.set(None)
+        if db is not None:
+            if discard:
+                await self.pool.discard(db)
+            else:
+                await self.pool.release(db)
+
+    def in_transaction(self):
+        """whether current task is in a transaction"""
+        return self._pinned.get() is not None
+
+    def add_listener(self, listener):
+        """see base.BaseConnection.add_listener"""
+        self.listeners = self.listeners + [listener]  # copy,statements running keep the old list
+
+    def remove_listener(self, listener):
+        self.listeners = [i for i in self.listeners if i is not listener]
+
+    @base.events.observe_async("query")
+    async def query_return_detail(self, query, *parameters, row_factory=None):
+        """return_detail,rows are built by row_factory,defaults to self.row_factory"""
+        async with self._borrow() as db:
+            column_names, rows, executed = await self._query(db, query, parameters)
+            make_row = utility.row_maker(row_factory or self.row_factory, column_names)
+            return {
+                "data": [make_row(row) for row in rows],
+                "column_names": column_names,
+                "query": executed  # query executed
+            }
+
+    @base.events.observe_async("execute")
+    async def execute_return_detail(self, query, *parameters):
+        """return_detail"""
+        async with self._borrow() as db:
+            return await self._execute(db, query, parameters)
+
+    @base.events.observe_async("executemany")
+    async def executemany_return_detail(self, query, parameters):
+        """return_detail"""
+        async with self._borrow() as db:
+            return await self._executemany(db, query, parameters)
+
+    async def iter(self, query, *parameters, fetch_size=1000, row_factory=None):
+        """Returns an async iterator for the given query and parameters."""
+        async with self._borrow() as db:
+            make_row = None
+            async for column_names, rows in self._iter(db, query, parameters, fetch_size):
+                if make_row is None:
+                    make_row = utility.row_maker(row_factory or self.row_factory, column_names)
+                for row in rows:
+                    yield make_row(row)
+
+    async def explain_return_detail(self, query, *parameters, analyze=False):
+        """see base.BaseConnection.explain_return_detail"""
+        raise NotImplementedError("You must implement it in subclass")
+
+    async def _query(self, db, query, parameters):
+        """:return: tuple,column names,rows and query executed"""
+        raise NotImplementedError("You must implement it in subclass")
+
+    async def _execute(self, db, query, parameters):
+        raise NotImplementedError("You must implement it in subclass")
+
+    async def _executemany(self, db, query, parameters):
+        raise NotImplementedError("You must implement it in subclass")
+
+    async def _iter(self, db, query, parameters, fetch_size):
+        """yield column names and rows by fetch_size"""
+        raise NotImplementedError("You must implement it in subclass")
+
+
+class MySQLConnection(AsyncBaseConnection):
+    """use aiomysql"""
+    param_place_holder = "%s"
+
+    def __init__(self, host, port, database, user=None, password=None,
+                 max_idle_time=7 * 3600, connect_timeout=60, autocommit=True,
+                 time_zone="+0:00", charset="utf8", pool_size=10, pool_min_size=1,
+                 pool_timeout=30.0, **kwargs):
+        _require(aiomysql, "aiomysql")
+        self.host = host
+        self.port = port
+        self.database = database
+        self.db_args = dict(
+            host=host,
+            port=int(port),
+            user=user,
+            password=password or "",
+            db=database,
+            charset=charset,
+            use_unicode=True,
+            init_command=('SET time_zone = "%s"' % time_zone),
+            connect_timeout=connect_timeout,
+            autocommit=autocommit,
+            **kwargs
+        )
+        super().__init__(max_idle_time, pool_size, pool_min_size, pool_timeout)
+
+    async def _connect(self):
+        return await aiomysql.connect(**self.db_args)
+
+    async def _close_db(self, db):
+        db.close()
+
+    async def _ping(self, db):
+        await db.ping(reconnect=False)
+
+    async def explain_return_detail(self, query, *parameters, analyze=False):
+        """EXPLAIN FORMAT=JSON,see MySQL.Connection.explain_return_detail"""
+        try:
+            from . import MySQL  # pymysql is required by aiomysql
+        except ImportError:
+            import MySQL
+        res = await self.query_return_detail("EXPLAIN FORMAT=JSON " + query, *parameters, row_factory=tuple)
+        plan = json.loads(res["data"][0][0])
+        return base.plan_detail(MySQL.parse_plan(plan), plan, res["query"])
+
+    async def _query(self, db, query, parameters):
+        async with db.cursor() as cursor:
+            await cursor.execute(query, parameters)
+            column_names = [d[0] for d in cursor.description]
+            rows = await cursor.fetchall()
+            return column_names, rows, to_unicode(cursor._executed)
+
+    async def _execute(self, db, query, parameters):
+        async with db.cursor() as cursor:
+            await cursor.execute(query, parameters)
+            return {
+                "lastrowid": cursor.lastrowid,  # the primary key id affected
+                "rowcount": cursor.rowcount,  # number of rows affected
+                "rownumber": cursor.rownumber,  # line number
+                "query": to_unicode(cursor._executed)  # query executed
+            }
+
+    async def _executemany(self, db, query, parameters):
+        async with db.cursor() as cursor:
+            await cursor.executemany(query, parameters)
+            return {
+                "lastrowid": cursor.lastrowid,  # the primary key id affected
+                "rowcount": cursor.rowcount,  # number of rows affected
+                "rownumber": cursor.rownumber,  # line number
+                "query": to_unicode(cursor._executed)  # query executed
+            }
+
+    async def _iter(self, db, query, parameters, fetch_size):
+        cursor = await db.cursor(aiomysql.SSCursor)
+        try:
+            await cursor.execute(query, parameters)
+            column_names = [d[0] for d in cursor.description]
+            while True:
+                rows = await cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield column_names, rows
+        finally:
+            await cursor.close()
+
+
+class PostgreSQLConnection(AsyncBaseConnection):
+    """use asyncpg,%s placeholders are replaced with $1, $2 ..."""
+    backend = "PostgreSQL"
+    param_place_holder = "%s"
+
+    def __init__(self, host, port, database, user=None, password=None,
+                 max_idle_time=7 * 3600, pool_size=10, pool_min_size=1,
+                 pool_timeout=30.0):
+        _require(asyncpg, "asyncpg")
+        self.host = host
+        self.port = port
+        self.database = database
+        self.db_args = dict(
+            host=host,
+            port=int(port),
+            user=user,
+            password=password,
+            database=database,
+        )
+        super().__init__(max_idle_time, pool_size, pool_min_size, pool_timeout)
+
+    async def _connect(self):
+        return await asyncpg.connect(**self.db_args)
+
+    async def _ping(self, db):
+        await db.fetchval("SELECT 1")
+
+    async def explain_return_detail(self, query, *parameters, analyze=False):
+        """EXPLAIN (FORMAT JSON),see PostgreSQL.Connection.explain_return_detail"""
+        try:
+            from . import PostgreSQL
+        except ImportError:
+            raise NotImplementedError("explain of asyncio PostgreSQL requires psycopg2 to parse the plan")
+        options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+        res = await self.query_return_detail(f"EXPLAIN ({options}) " + query, *parameters, row_factory=tuple)
+        plan = res["data"][0][0]
+        if isinstance(plan, str):  # asyncpg returns json as str
+            plan = json.loads(plan)
+        return base.plan_detail(PostgreSQL.parse_plan(plan[0]["Plan"], analyze), plan, res["query"])
+
+    async def _query(self, db, query, parameters):
+        query = to_numbered_placeholders(query)
+        statement = await db.prepare(query)  # asyncpg caches statements by itself
+        rows = await statement.fetch(*parameters)
+        column_names = [a.name for a in statement.get_attributes()]
+        return column_names, rows, query
+
+    async def _execute(self, db, query, parameters):
+        query = to_numbered_placeholders(query)
+        status = await db.execute(query, *parameters)  # like INSERT 0 1
+        rowcount = status.rsplit(" ", 1)[-1]
+        return {
+            "lastrowid": 0,  # asyncpg does not return it,use RETURNING instead
+            "rowcount": int(rowcount) if rowcount.isdigit() else -1,  # number of rows affected
+            "rownumber": 0,  # line number
+            "query": query  # query executed
+        }
+
+    async def _executemany(self, db, query, parameters):
+        query = to_numbered_placeholders(query)
+        await db.executemany(query, parameters)
+        return {
+            "lastrowid": 0,  # asyncpg does not return it,use RETURNING instead
+            "rowcount": len(parameters),  # number of rows affected
+            "rownumber": 0,  # line number
+            "query": query  # query executed
+        }
+
+    async def _iter(self, db, query, parameters, fetch_size):
+        query = to_numbered_placeholders(query)
+        async with db.transaction():  # server side cursor works in transaction only
+            statement = await db.prepare(query)
+            column_names = [a.name for a in statement.get_attributes()]
+            cursor = await statement.cursor(*parameters)
+            while True:
+                rows = await cursor.fetch(fetch_size)
+                if not rows:
+                    break
+                yield column_names, rows
+
+
+class SQLiteConnection(AsyncBaseConnection):
+    """
+    use aiosqlite,the only param host should be the path to db file.
+
+    Statements are committed automatically unless in transaction.
+    """
+    backend = "SQLite"
+    param_place_holder = "?"
+
+    def __init__(self, host, return_query=False, max_idle_time=7 * 3600,
+                 pool_size=1, pool_min_size=1, pool_timeout=30.0):
+        _require(aiosqlite, "aiosqlite")
+        self.host = host
+        self._return_query = return_query
+        super().__init__(max_idle_time, pool_size, pool_min_size, pool_timeout)
+
+    async def _connect(self):
+        return await aiosqlite.connect(self.host, isolation_level=None)
+
+    async def _ping(self, db):
+        await db.execute("SELECT 1")
+
+    def _format_query(self, query, parameters):
+        return query.replace("?", "{}").format(*parameters) if self._return_query else ""
+
+    async def explain_return_detail(self, query, *parameters, analyze=False):
+        """EXPLAIN QUERY PLAN,analyze is not supported"""
+        res = await self.query_return_detail("EXPLAIN QUERY PLAN " + query, *parameters, row_factory=tuple)
+        plan = res["data"]
+        return base.plan_detail(SQLite.parse_plan(plan), plan, query)
+
+    async def _query(self, db, query, parameters):
+        cursor = await db.execute(query, parameters)
+        try:
+            column_names = [d[0] for d in cursor.description]
+            rows = await cursor.fetchall()
+            return column_names, rows, self._format_query(query, parameters)
+        finally:
+            await cursor.close()
+
+    async def _execute(self, db, query, parameters):
+        cursor = await db.execute(query, parameters)
+        try:
+            return {
+                "lastrowid": cursor.lastrowid,  # the primary key id affected
+                "rowcount": cursor.rowcount,  # number of rows affected
+                "rownumber": 0,  # line number
+                "query": self._format_query(query, parameters)  # query executed
+            }
+        finally:
+            await cursor.close()
+
+    async def _executemany(self, db, query, parameters):
+        cursor = await db.executemany(query, parameters)
+        try:
+            return {
+                "lastrowid": cursor.lastrowid,  # the primary key id affected
+                "rowcount": cursor.rowcount,  # number of rows affected
+                "rownumber": 0,  # line number
+                "query": query if self._return_query else ""  # query executed
+            }
+        finally:
+            await cursor.close()
+
+    async def _iter(self, db, query, parameters, fetch_size):
+        cursor = await db.execute(query, parameters)
+        try:
+            column_names = [d[0] for d in cursor.description]
+            while True:
+                rows = await cursor.fetchmany(fetch_size)
+                if not rows:
+                    break
+                yield column_names, rows
+        finally:
+            await cursor.close()
+
+
+class AsyncChainDB(object):
+    """
+    Terminal methods of ChainDB in asyncio.
+
+    Terminal methods generate SQL when calling,then return an awaitable,
+    chain methods return new query objects,so tasks sharing one ChainDB will not mix their params.
+    """
+    connection_class = None
+
+    async def connect(self, config_dict=None):
+        self.connection = self.connection_class(**config_dict)
+        await self.connection.open()
+        self.param_place_holder = self.connection_class.param_place_holder
+
+    async def close(self):
+        await self.connection.close()
+
+    def execute(self, *args, **kwargs):
+        """execute SQL"""
+        return self.connection.execute_return_detail(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        """execute SQL with many lines"""
+        return self.connection.executemany_return_detail(*args, **kwargs)
+
+    def batch(self):
+        raise NotImplementedError("batch is not supported in asyncio")
+
+    def query(self, *args, **kwargs):
+        """query SQL"""
+        return self.connection.query_return_detail(*args, **kwargs)
+
+    def select(self, fields="*"):
+        sql, condition_values = self.build_select(fields)
+        row_factory = self.get_row_factory()
+        cached = self.get_cache_entry(sql, condition_values, row_factory)
+        if cached is not None:
+            return self._select_cached(sql, condition_values, row_factory, cached, self._cache_ttl)
+        return self._select(self.query(sql, *condition_values, row_factory=row_factory))
+
+    async def _select(self, awaitable):
+        res = await awaitable
+        self.last_query = res["query"]
+        return res["data"]
+
+    async def _select_cached(self, sql, condition_values, row_factory, cached, ttl):
+        result_cache, key, tables, rows = cached
+        if rows is None:
+            generation = result_cache.generation(tables)
+            res = await self.query(sql, *condition_values, row_factory=row_factory)
+            rows = res["data"]
+            result_cache.set(key, rows, tables, ttl, generation)
+            self.last_query = res["query"]
+        else:
+            self.last_query = sql
+        return cache.copy_rows(rows)
+
+    def select_columns(self, fields="*", numpy=False):
+        sql, condition_values = self.build_select(fields)
+        return self._select_columns(self.query(sql, *condition_values, row_factory=tuple), numpy)
+
+    async def _select_columns(self, awaitable, numpy):
+        res = await awaitable
+        self.last_query = res["query"]
+        return self.to_columns(res, numpy)
+
+    def paginate(self, key="id", after=None, size=100, fields="*", cursor=None, desc=False):
+        keys, after = self.parse_paginate_key(key, after, cursor)
+        sql, values = self.build_paginate(fields, keys, after, size + 1, desc)
+        return self._paginate(self.query(sql, *values, row_factory=self.get_row_factory()), size, keys)
+
+    async def _paginate(self, awaitable, size, keys):
+        res = await awaitable
+        self.last_query = res["query"]
+        return self.gen_page(res["data"], size, keys, res["column_names"])
+
+    def get(self, fields="*"):
+        """will replace self._limit to 1"""
+        return self._get(self.limit(1).select(fields))
+
+    def explain(self, fields="*", analyze=False):
+        """see base.BaseDB.explain"""
+        sql, condition_values = self.build_select(fields)
+        return self._record(self.connection.explain_return_detail(sql, *condition_values, analyze=analyze))
+
+    async def _get(self, awaitable):
+        res = await awaitable
+        return res[0] if res else {}  # return dit type
+
+    async def _record(self, awaitable):
+        res = await awaitable
+        self.last_query = res["query"]
+        return res
+
+    async def _write(self, awaitable, table):
+        res = await self._record(awaitable)
+        self.invalidate_cache(table)
+        return res
+
+    async def _false(self):
+        return False
+
+    def update(self, dict_data=None):
+        if not dict_data:
+            return self._false()
+        sql, values = self.build_update(dict_data)
+        return self._write(self.execute(sql, *values), self._table)
+
+    def insert(self, dict_data=None):
+        if not dict_data:
+            return self._false()
+        sql, values = self.build_insert(dict_data)
+        return self._write(self.execute(sql, *values), self._table)
+
+    def insert_many(self, dict_data=None):
+        built = self.build_insert_many(dict_data) if dict_data else None
+        if not built:
+            return self._false()
+        sql, values = built
+        return self._write(self.executemany(sql, values), self._table)
+
+    def upsert_many(self, rows, conflict_keys, update_fields=None):
+        built = self.build_upsert_many(rows, conflict_keys, update_fields) if rows else None
+        if not built:
+            return self._false()
+        fields, values, gen_rows = built
+        sql = gen_rows(fields, ",".join([self.param_place_holder] * len(values[0])), 1)
+        return self._write(self.executemany(sql, values), self._table)
+
+    def delete(self):
+        if self.strict and not self._where:
+            logging.warning("without where condition,can not delete")
+            return self._false()
+
+        sql, sql_values = self.gen_delete()
+        return self._write(self.execute(sql, *sql_values), self._table)
+
+    def increase(self, field, step=1):
+        """number field Increase"""
+        sql, sql_values = self.gen_increase(field, str(step))
+        return self._write(self.execute(sql, *sql_values), self._table)
+
+    def decrease(self, field, step=1):
+        """number field decrease"""
+        sql, sql_values = self.gen_decrease(field, str(step))
+        return self._write(self.execute(sql, *sql_values), self._table)
+
+    def get_fields_name(self):
+        """return all fields of table"""
+        return self._get_fields_name(self._table, self.gen_get_fields_name())
+
+    async def _get_fields_name(self, table, sql):
+        if not table:
+            return []
+
+        tables = await self._load_schema(self.schema_key(), not self.cache_fields_name)
+        table_schema = base.schema.find_table(tables, table)
+        if table_schema:
+            return [i["name"] for i in table_schema["columns"]]
+        res = await self.connection.query_return_detail(sql)
+        return res["column_names"]
+
+    def load_schema(self, refresh=False):
+        """see base.BaseDB.load_schema"""
+        return self._load_schema(self.schema_key(), refresh)
+
+    async def _load_schema(self, key, refresh):
+        tables = None if refresh else self.schema_cache.get(key)
+        if tables is None:
+            res = await self.connection.query_return_detail(self.schema_query, row_factory=tuple)
+            tables = base.schema.build_tables(res["data"])
+            self.schema_cache.set(key, tables)
+        return tables
+
+    def get_schema(self, table=None):
+        return self._get_schema(table or self._table)
+
+    async def _get_schema(self, table):
+        return base.schema.find_table(await self.load_schema(), table)
+
+    async def begin(self):
+        """
+        Transaction
+
+        The connection is pinned to current task until commit or rollback.
+        """
+        await self.connection.pin()
+        try:
+            await self.execute(self.begin_statement)
+        except Exception:
+            await self.connection.unpin(discard=True)
+            raise
+
+    async def commit(self):
+        """
+        Transaction
+        """
+        try:
+            await self.execute("COMMIT;")
+        finally:
+            await self.connection.unpin()
+            self.invalidate_transaction_cache()
+
+    async def rollback(self):
+        """
+        Transaction
+        """
+        try:
+            await self.execute("ROLLBACK;")
+        finally:
+            await self.connection.unpin()
+            self.invalidate_transaction_cache()
+
+    fetchall = select  # alias
+    fetchone = get  # alias
+
+
+class MySQLChainDB(AsyncChainDB, base.ChainDB):
+    connection_class = MySQLConnection
+
+
+class PostgreSQLChainDB(AsyncChainDB, base.ChainDB):
+    connection_class = PostgreSQLConnection
+    field_name_quote = '"'
+    schema_query = base.schema.POSTGRESQL_QUERY
+    gen_upsert_rows = base.ChainDB.gen_on_conflict_rows
+
+    # PostgreSQL LIMIT is same as SQLite
+    parse_limit = SQLite.ChainDB.parse_limit
+
+
+class SQLiteChainDB(AsyncChainDB, SQLite.ChainDB):
+    connection_class = SQLiteConnection
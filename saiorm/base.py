@@ -1,27 +1,99 @@
 #!/usr/bin/env python
 # -*- coding:utf-8 -*-
-import time
+import contextlib
+import functools
 import logging
+import threading
+import time
 
 try:
     from . import utility
 except ImportError:
     import utility
 
+try:
+    from . import pool
+except ImportError:
+    import pool
+
+try:
+    from . import cache
+except ImportError:
+    import cache
+
+try:
+    from . import events
+except ImportError:
+    import events
+
+try:
+    from . import replica
+except ImportError:
+    import replica
+
+try:
+    from . import schema
+except ImportError:
+    import schema
+
 GraceDict = utility.GraceDict
 is_array = utility.is_array
 Row = utility.Row
 to_unicode = utility.to_unicode
 
+BOUND_VALUE = object()  # placeholder of bound values in the shape of statement
+
+
+def split_names(names):
+    """field names in list,names can be a list or str joined by comma"""
+    if isinstance(names, str):
+        return [i.strip() for i in names.split(",") if i.strip()]
+    return list(names)
+
+
+def plan_node(table, access, index=None, rows=None, full_scan=False):
+    """one table access in the normalized plan of explain"""
+    return {
+        "table": table,  # table or collection name
+        "access": access,  # access type of database,eg. ALL,Seq Scan,SCAN,Index Seek,IXSCAN
+        "index": index,  # index used,None if not
+        "rows": rows,  # rows scanned,estimated unless analyzed,None if unknown
+        "full_scan": full_scan,  # read the whole table or index
+    }
+
+
+def plan_detail(nodes, plan, query):
+    """normalized result of explain"""
+    rows = [i["rows"] for i in nodes if i["rows"] is not None]
+    return {
+        "nodes": nodes,  # list of plan_node
+        "rows": sum(rows) if rows else None,  # rows scanned of all tables
+        "indexes": sorted({i["index"] for i in nodes if i["index"]}),  # indexes used
+        "full_scan": any(i["full_scan"] for i in nodes),  # any table is scanned fully
+        "plan": plan,  # plan returned by database
+        "query": query  # query explained
+    }
+
 
 class BaseConnection(object):
     """default MySQL"""
+    backend = "MySQL"  # name in events
+    row_factory = Row  # type of rows returned by query_return_detail and iter
+    numpy_dtypes = {}  # type code in cursor.description => NumPy dtype,used by select_columns
+    listeners = []  # events.Listener of this connection,see add_listener
     def __init__(self, host, port, database, user=None, password=None,
                  max_idle_time=7 * 3600, connect_timeout=60, autocommit=True,
-                 time_zone="+0:00", charset="utf8", **kwargs):
+                 time_zone="+0:00", charset="utf8", pool_size=0, pool_min_size=1,
+                 pool_timeout=30.0, statement_cache_size=0, **kwargs):
         self.host = host
+        self.port = port
         self.database = database
         self.max_idle_time = float(max_idle_time)
+        self.statement_cache_size = 0
+        if statement_cache_size:
+            # COM_STMT_PREPARE is not implemented by pymysql,every statement is sent as text
+            logging.warning("pymysql does not support server side prepared statement,"
+                            "statement_cache_size is ignored")
 
         args = dict(
             host=host,
@@ -41,28 +113,106 @@ class BaseConnection(object):
         self.db_args = args
         self._last_use_time = time.time()
         try:
-            self.reconnect()
+            self._init_connection(pool_size, pool_min_size, pool_timeout)
         except Exception:
             pass
 
     def __del__(self):
         self.close()
 
+    def _init_connection(self, pool_size=0, pool_min_size=1, pool_timeout=30.0):
+        """
+        connect to database,use a connection pool if pool_size is greater than 0
+
+        :param pool_size: int,max connections in pool
+        :param pool_min_size: int,connections created when initialization
+        :param pool_timeout: float,seconds to wait for a free connection
+        """
+        self._local = threading.local()  # connection pinned by transaction
+        self.pool = None
+        if pool_size:
+            self.pool = pool.ConnectionPool(self._connect,
+                                            min_size=pool_min_size,
+                                            max_size=pool_size,
+                                            timeout=pool_timeout,
+                                            validator=self._ping,
+                                            max_idle_time=self.max_idle_time,
+                                            prefill=False)
+            self.pool.fill()
+        else:
+            self.reconnect()
+
     def close(self):
         """Closes this database connection."""
         if getattr(self, "db", None) is not None:
             self.db.close()
             self.db = None
+        if getattr(self, "pool", None) is not None:
+            self.pool.close()
 
     def reconnect(self):
+        """Closes the existing database connection and re-opens it."""
+        self.close()
+        self.db = self._connect()
+
+    def _discard(self):
+        """close the broken connection,the pooled one is discarded by _borrow"""
+        if self.pool is None:
+            self.close()
+
+    def _connect(self):
+        """return a new connection of the driver"""
         raise NotImplementedError("You must implement it in subclass")
 
-    def iter(self, query, *parameters, **kwparameters):
+    def _ping(self, db):
+        """check the connection before borrowing it from pool"""
+        cursor = db.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+        finally:
+            cursor.close()
+
+    def iter(self, query, *parameters, fetch_size=1000, row_factory=None, **kwparameters):
+        """
+        Returns an iterator for the given query and parameters,
+        rows are fetched from server fetch_size ones each time.
+        """
         raise NotImplementedError("You must implement it in subclass")
 
-    def _log_exception(self, exception, query, parameters):
+    def execute_batch_return_detail(self, statements):
+        """
+        execute statements collected by ChainDB.batch,
+        in as few round trips as the database supports,one by one by default
+
+        :param statements: list of sql and values
+        :return: list,detail of each statement as execute_return_detail
+        """
+        return [self.execute_return_detail(query, *values) for query, values in statements]
+
+    def explain_return_detail(self, query, *parameters, analyze=False):
+        """
+        explain the query
+
+        :param analyze: bool,run the query to get the actual rows if database supports it
+        :return: dict,see plan_detail
+        """
         raise NotImplementedError("You must implement it in subclass")
 
+    def add_listener(self, listener):
+        """
+        call listener before and after each statement of this connection,see events.Listener
+        """
+        self.listeners = self.listeners + [listener]  # copy,statements running keep the old list
+
+    def remove_listener(self, listener):
+        self.listeners = [i for i in self.listeners if i is not listener]
+
+    def _log_exception(self, exception, query, parameters):
+        """log exception when execute SQL"""
+        logging.error(f"Error on {self.backend} {getattr(self, 'host', '')} when executing {query!r} "
+                      f"with {events.parameters_count(parameters)} parameters: {exception!r}")
+
     def _ensure_connected(self):
         # Mysql by default closes client connections that are idle for
         # 8 hours, but the client library does not report this fact until
@@ -78,59 +228,185 @@ class BaseConnection(object):
         self._ensure_connected()
         return self.db.cursor()
 
+    @contextlib.contextmanager
+    def _borrow(self):
+        """
+        yield a connection for one call.
+
+        Borrow it from pool and return it after using if pool enabled,
+        or use the connection pinned by transaction in current thread.
+        """
+        pinned = getattr(self._local, "db", None)
+        if pinned is not None:
+            yield pinned
+        elif self.pool is None:
+            self._ensure_connected()
+            yield self.db
+        else:
+            db = self.pool.acquire()
+            ok = False
+            try:
+                yield db
+                ok = True
+            finally:
+                if ok:
+                    self.pool.release(db)
+                else:
+                    self.pool.discard(db)
+
+    def pin(self):
+        """use one connection in current thread until unpin,for transaction"""
+        if self.pool is not None and getattr(self._local, "db", None) is None:
+            self._local.db = self.pool.acquire()
+        self._local.pinned = True
+
+    def unpin(self, discard=False):
+        """
+        return the connection pinned by current thread
+
+        :param discard: bool,close the broken connection instead of returning it
+        """
+        db = getattr(self._local, "db", None)
+        self._local.db = None
+        self._local.pinned = False
+        if db is not None:
+            if discard:
+                self.pool.discard(db)
+            else:
+                self.pool.release(db)
+        elif discard:
+            self._discard()
+
+    def in_transaction(self):
+        """whether current thread is in a transaction"""
+        return getattr(self._local, "pinned", False)
+
     def _execute(self, cursor, query, parameters, kwparameters):
         try:
             return cursor.execute(query, kwparameters or parameters)
         except Exception as e:
             self._log_exception(e, query, parameters)
-            self.close()
+            self._discard()
             raise
 
-    def query_return_detail(self, query, *parameters, **kwparameters):
-        """return_detail"""
-        cursor = self._cursor()
-        try:
-            self._execute(cursor, query, parameters, kwparameters)
-            column_names = [d[0] for d in cursor.description]
-            return {
-                "data": [Row(zip(column_names, row)) for row in cursor],
-                "column_names": column_names,
-                "query": to_unicode(cursor._executed)  # query executed
-            }
-        finally:
-            cursor.close()
-
+    @events.observe("query")
+    def query_return_detail(self, query, *parameters, row_factory=None, **kwparameters):
+        """return_detail,rows are built by row_factory,defaults to self.row_factory"""
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                self._execute(cursor, query, parameters, kwparameters)
+                column_names = [d[0] for d in cursor.description]
+                make_row = utility.row_maker(row_factory or self.row_factory, column_names)
+                return {
+                    "data": [make_row(row) for row in cursor],
+                    "column_names": column_names,
+                    "column_types": [d[1] for d in cursor.description],
+                    "query": to_unicode(cursor._executed)  # query executed
+                }
+            finally:
+                cursor.close()
+
+    @events.observe("execute")
     def execute_return_detail(self, query, *parameters, **kwparameters):
         """return_detail"""
-        cursor = self._cursor()
-        try:
-            self._execute(cursor, query, parameters, kwparameters)
-            return {
-                "lastrowid": cursor.lastrowid,  # the primary key id affected
-                "rowcount": cursor.rowcount,  # number of rows affected
-                "rownumber": cursor.rownumber,  # line number
-                "query": to_unicode(cursor._executed)  # query executed
-            }
-        finally:
-            cursor.close()
-
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                self._execute(cursor, query, parameters, kwparameters)
+                return {
+                    "lastrowid": cursor.lastrowid,  # the primary key id affected
+                    "rowcount": cursor.rowcount,  # number of rows affected
+                    "rownumber": cursor.rownumber,  # line number
+                    "query": to_unicode(cursor._executed)  # query executed
+                }
+            finally:
+                cursor.close()
+
+    @events.observe("executemany")
     def executemany_return_detail(self, query, parameters):
         """return_detail"""
-        cursor = self._cursor()
-        try:
-            cursor.executemany(query, parameters)
-            return {
-                "lastrowid": cursor.lastrowid,  # the primary key id affected
-                "rowcount": cursor.rowcount,  # number of rows affected
-                "rownumber": cursor.rownumber,  # line number
-                "query": to_unicode(cursor._executed)  # query executed
-            }
-        except Exception as e:
-            self._log_exception(e, query, parameters)
-            self.close()
-            raise
-        finally:
-            cursor.close()
+        with self._borrow() as db:
+            cursor = db.cursor()
+            try:
+                cursor.executemany(query, parameters)
+                return {
+                    "lastrowid": cursor.lastrowid,  # the primary key id affected
+                    "rowcount": cursor.rowcount,  # number of rows affected
+                    "rownumber": cursor.rownumber,  # line number
+                    "query": to_unicode(cursor._executed)  # query executed
+                }
+            except Exception as e:
+                self._log_exception(e, query, parameters)
+                self._discard()
+                raise
+            finally:
+                cursor.close()
+
+
+class SharedState(object):
+    """state of a DB shared by the query objects derived from it"""
+
+    def __init__(self, result_cache=None):
+        self.connection = None
+        self.result_cache = result_cache
+        self.local = threading.local()  # last_query of each thread
+
+
+class Batch(object):
+    """
+    Statements collected by DB.batch in current thread,executed when the with block exits without exception.
+
+    Writes in the block return a detail dict at once,it's filled after executing.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.statements = []  # sql and values
+        self.details = []  # detail dict returned by each write
+        self.tables = set()  # tables written,cached results are dropped after executing
+
+    def __enter__(self):
+        local = self.db._shared.local
+        if getattr(local, "batch", None) is not None:
+            raise RuntimeError("batch can not be nested")
+        local.batch = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.db._shared.local.batch = None
+        if exc_type is None:
+            self.execute()
+
+    def add(self, query, values, table=""):
+        """collect a statement,return its detail to be filled"""
+        detail = {
+            "lastrowid": None,  # the primary key id affected
+            "rowcount": None,  # number of rows affected
+            "rownumber": 0,  # line number
+            "query": ""  # query executed
+        }
+        self.statements.append((query, values))
+        self.details.append(detail)
+        if table:
+            self.tables.add(table)
+        return detail
+
+    def execute(self):
+        """
+        execute the collected statements
+
+        :return: list,detail of each statement
+        """
+        statements = self.statements
+        self.statements = []
+        if statements:
+            res = self.db.connection.execute_batch_return_detail(statements)
+            for detail, i in zip(self.details[-len(statements):], res):
+                detail.update(i)
+            for table in self.tables:
+                self.db.invalidate_cache(table)
+        return self.details
 
 
 class BaseDB(object):
@@ -143,39 +419,87 @@ class BaseDB(object):
 
     If use SQL Server, param primary_key is necessary,used in the LIMIT implement tec.
 
+    Chain methods return a new query object instead of changing the DB,
+    so the DB and query objects can be reused and shared by threads.
     """
+    field_name_quote = "`"  # MySQL use `,PostgreSql and SQLite use ",SQLServer use ", new in 0.2
+    max_insert_rows = 1000  # max rows in one INSERT statement of insert_many
+    max_insert_params = 65535  # max bound values in one statement
+    schema_query = ""  # catalog query of load_schema,see schema.build_tables
+
+    # chain params,chain methods return a new query object by clone instead of changing them
+    _table = ""
+    _where = ""
+    _order_by = ""
+    _group_by = ""
+    _limit = 0
+    _offset = 0
+    _inner_join = ""
+    _left_join = ""
+    _right_join = ""
+    _outer_join = ""
+    _full_join = ""
+    _on = ""
+    _cache = False  # cache result of select
+    _cache_ttl = None
+    _use_primary = False  # query on primary instead of replicas
 
     def __init__(self, table_name_prefix="", debug=False, strict=True,
-                 cache_fields_name=True, grace_result=True):
-        self.connection = None
+                 cache_fields_name=True, grace_result=True, sql_cache_size=256,
+                 row_factory=None, result_cache=None, schema_cache=None):
+        self._shared = SharedState(result_cache)  # shared by the query objects derived from it
         self.table_name_prefix = table_name_prefix
         self.debug = debug
         self.strict = strict
 
-        self.cache_fields_name = cache_fields_name  # when call get_fields_name
-        self._cached_fields_name = {}  # cached fields name
+        self.cache_fields_name = cache_fields_name  # use schema_cache when call get_fields_name
+        # schema.SchemaCache of load_schema,can be shared by many DB
+        self.schema_cache = schema_cache or schema.SchemaCache()
         self.grace_result = grace_result
+        # type of rows returned by select,get and iter,see utility.row_maker
+        # GraceDict if grace_result else Row by default
+        self.row_factory = row_factory
         self.param_place_holder = "%s"  # SQLite will use ?
-        self.field_name_quote = "`"  # MySQL use `,PostgreSql and SQLite use ",SQLServer use ', new in 0.2
-
-        self._table = ""
-        self._reset()
-
-    def _reset(self):
-        """reset param when call again"""
-        # self._table = "" # keep table name
-        self._where = ""
-        self._order_by = ""
-        self._group_by = ""
-        self._limit = 0
-        self._offset = 0
-        self._inner_join = ""
-        self._left_join = ""
-        self._right_join = ""
-        self._outer_join = ""
-        self._full_join = ""
-        self._on = ""
-        self.last_query = ""  # latest executed sql
+        # compiled SELECT statements by the shape of chain params,0 to disable it
+        self._sql_cache = utility.LRUCache(sql_cache_size) if sql_cache_size else None
+        self._cache_local = threading.local()  # tables written in transaction
+
+    @property
+    def connection(self):
+        """connection of the DB,shared by the query objects derived from it"""
+        return self._shared.connection
+
+    @connection.setter
+    def connection(self, connection):
+        self._shared.connection = connection
+
+    @property
+    def result_cache(self):
+        """cache.ResultCache used by select with cache(),can be shared by many DB"""
+        return self._shared.result_cache
+
+    @result_cache.setter
+    def result_cache(self, result_cache):
+        self._shared.result_cache = result_cache
+
+    @property
+    def last_query(self):
+        """latest executed sql in current thread"""
+        return getattr(self._shared.local, "last_query", "")
+
+    @last_query.setter
+    def last_query(self, query):
+        self._shared.local.last_query = query
+
+    def clone(self, **params):
+        """
+        a new query object with chain params changed,self is not changed,
+        so a query object can be reused and shared by threads.
+        """
+        query = object.__new__(self.__class__)
+        query.__dict__.update(self.__dict__)
+        query.__dict__.update(params)
+        return query
 
     def wrap_field_name(self, fields):
         """
@@ -184,9 +508,10 @@ class BaseDB(object):
         """
         # todo  在 join 的时候,添加符号可能导致出错,需要判断是否有点,然后分开处理
         if self.field_name_quote not in fields and "," in fields:
-            if "." not in fields:
+            if "." not in fields and "(" not in fields:
+                separator = self.field_name_quote + "," + self.field_name_quote
                 fields = self.field_name_quote + \
-                         self.field_name_quote.join(fields.split(",")) + \
+                         separator.join([i.strip() for i in fields.split(",")]) + \
                          self.field_name_quote
         return fields
 
@@ -194,27 +519,70 @@ class BaseDB(object):
         """
         set a connected torndb.Connection
 
-        :param config_dict: dict,config to connect database
+        :param config_dict: dict,config to connect database,
+            statement_cache_size works on PostgreSQL and SQLite only,see their Connection
         """
         raise NotImplementedError("You must implement it in subclass")
 
     def execute(self, *args, **kwargs):
-        """execute SQL"""
-        res = self.connection.execute_return_detail(*args, **kwargs)
-        self._reset()  # reset param
-        return res
+        """execute SQL,collected if in batch"""
+        batch = self.in_batch()
+        if batch is not None and not kwargs:
+            return batch.add(args[0], args[1:], self._table)
+        return self.connection.execute_return_detail(*args, **kwargs)
+
+    def batch(self):
+        """
+        collect insert,insert_many,update,delete,increase,decrease and execute of this DB in current thread,
+        send them in as few round trips as possible when the with block exits,see Batch.
+        They return a detail dict filled after executing,insert_many returns the one of its last statement.
+        """
+        return Batch(self)
+
+    def in_batch(self):
+        """Batch of current thread,None if not in batch"""
+        return getattr(self._shared.local, "batch", None)
 
     def executemany(self, *args, **kwargs):
         """execute SQL with many lines"""
-        res = self.connection.executemany_return_detail(*args, **kwargs)
-        self._reset()  # reset param
-        return res
+        return self.connection.executemany_return_detail(*args, **kwargs)
 
     def query(self, *args, **kwargs):
         """query SQL"""
-        res = self.connection.query_return_detail(*args, **kwargs)
-        self._reset()  # reset param
-        return res
+        return self.read_connection().query_return_detail(*args, **kwargs)
+
+    def new_connection(self, connection_class, config_dict, replicas=None, replica_strategy="round_robin"):
+        """
+        connect to primary and replicas
+
+        :param replicas: list of config dict,queries are sent to them,
+            key weight in config is the weight of replica,used by strategy weighted
+        :param replica_strategy: str,round_robin,least_outstanding or weighted,see replica.ReplicaConnection
+        """
+        primary = connection_class(**config_dict)
+        if not replicas:
+            return primary
+        weights = [i.get("weight", 1) for i in replicas]
+        replica_connections = [connection_class(**{k: v for k, v in i.items() if k != "weight"})
+                               for i in replicas]
+        return replica.ReplicaConnection(primary, replica_connections, replica_strategy, weights)
+
+    def add_listener(self, listener):
+        """call listener before and after each statement,see events.Listener"""
+        self.connection.add_listener(listener)
+
+    def remove_listener(self, listener):
+        self.connection.remove_listener(listener)
+
+    def read_connection(self):
+        """connection to query,primary if use_primary is called"""
+        if self._use_primary:
+            return getattr(self.connection, "primary", self.connection)
+        return self.connection
+
+    def use_primary(self):
+        """query on primary,to read rows just written"""
+        return self.clone(_use_primary=True)
 
     def table(self, table_name="", *args):
         """
@@ -223,34 +591,35 @@ class BaseDB(object):
         # check table name prefix
         if self.table_name_prefix and not table_name.startswith(self.table_name_prefix):
             table_name = self.table_name_prefix + table_name
-        self._table = table_name
-        return self
+        return self.clone(_table=table_name)
 
     def where(self, condition):
-        self._where = condition
-        return self
+        return self.clone(_where=condition)
 
     def order_by(self, condition):
-        self._order_by = condition
-        return self
+        return self.clone(_order_by=condition)
 
     def limit(self, condition):
-        self._limit = condition
-        return self
+        return self.clone(_limit=condition)
 
     def offset(self, condition):
-        self._offset = condition
-        return self
+        return self.clone(_offset=condition)
 
     def group_by(self, condition):
-        self._group_by = condition
-        return self
+        return self.clone(_group_by=condition)
+
+    def cache(self, ttl=None):
+        """
+        cache result of select and get,entries of the table are dropped when it's written by saiorm
+
+        :param ttl: float,seconds the result lives,use ttl of result_cache if None
+        """
+        return self.clone(_cache=True, _cache_ttl=ttl)
 
     def on(self, condition):
         if self.table_name_prefix and "###" in condition:
             condition = condition.replace("###", self.table_name_prefix)
-        self._on = condition
-        return self
+        return self.clone(_on=condition)
 
     def join(self, condition):
         if self.table_name_prefix:
@@ -258,8 +627,7 @@ class BaseDB(object):
                 condition = condition.replace("###", self.table_name_prefix)
             else:
                 condition = self.table_name_prefix + condition
-        self._inner_join = condition
-        return self
+        return self.clone(_inner_join=condition)
 
     def inner_join(self, condition):
         if self.table_name_prefix:
@@ -267,8 +635,7 @@ class BaseDB(object):
                 condition = condition.replace("###", self.table_name_prefix)
             else:
                 condition = self.table_name_prefix + condition
-        self._inner_join = condition
-        return self
+        return self.clone(_inner_join=condition)
 
     def left_join(self, condition):
         if self.table_name_prefix:
@@ -276,8 +643,7 @@ class BaseDB(object):
                 condition = condition.replace("###", self.table_name_prefix)
             else:
                 condition = self.table_name_prefix + condition
-        self._left_join = condition
-        return self
+        return self.clone(_left_join=condition)
 
     def right_join(self, condition):
         if self.table_name_prefix:
@@ -285,26 +651,200 @@ class BaseDB(object):
                 condition = condition.replace("###", self.table_name_prefix)
             else:
                 condition = self.table_name_prefix + condition
-        self._right_join = condition
-        return self
+        return self.clone(_right_join=condition)
 
     def select(self, fields="*"):
         """
         fields is fields or native sql function,
         ,use DB().select("=now()") will run SELECT now()
         """
+        sql, condition_values = self.build_select(fields)
+        row_factory = self.get_row_factory()
+        cached = self.get_cache_entry(sql, condition_values, row_factory)
+        if cached is None:
+            res = self.query(sql, *condition_values, row_factory=row_factory)
+            self.last_query = res["query"]
+            return res["data"]
+
+        result_cache, key, tables, rows = cached
+        if rows is None:
+            generation = result_cache.generation(tables)
+            res = self.query(sql, *condition_values, row_factory=row_factory)
+            rows = res["data"]
+            result_cache.set(key, rows, tables, self._cache_ttl, generation)
+            self.last_query = res["query"]
+        else:
+            self.last_query = sql
+        return cache.copy_rows(rows)
+
+    def get_cache_entry(self, sql, values, row_factory):
+        """
+        look up result of select in result_cache
+
+        :return: tuple,cache,key,tables the query reads and rows,rows is None if missed,
+            None if the query should not be cached
+        """
+        if not self._cache or self.connection.in_transaction():  # read uncommitted rows
+            return None
+        if self.result_cache is None:
+            self.result_cache = cache.ResultCache()
+
+        database = self.schema_key()  # a result_cache can be shared by many DB
+        key = (database, sql, tuple(values), row_factory)
+        try:
+            hash(key)
+        except TypeError:  # unhashable value
+            return None
+        tables = [(database, cache.table_name(i)) for i in (self._table, self._inner_join, self._left_join,
+                                                            self._right_join, self._outer_join, self._full_join)
+                  if i]
+        return self.result_cache, key, tables, self.result_cache.get(key)
+
+    def invalidate_cache(self, table=None):
+        """drop cached results reading the table after writing,current table by default"""
+        table = table or self._table
+        if self.result_cache is None or not table:
+            return
+        table = (self.schema_key(), cache.table_name(table))
+        self.result_cache.invalidate(table)
+        if self.connection.in_transaction():  # drop it again when committed
+            tables = getattr(self._cache_local, "tables", None)
+            if tables is None:
+                tables = self._cache_local.tables = set()
+            tables.add(table)
+
+    def invalidate_transaction_cache(self):
+        """drop cached results reading the tables written in transaction"""
+        tables = getattr(self._cache_local, "tables", None)
+        self._cache_local.tables = None
+        if self.result_cache is not None and tables:
+            for table in tables:
+                self.result_cache.invalidate(table)
+
+    def select_columns(self, fields="*", numpy=False):
+        """
+        same as select,but return values by column,no dict is built for rows.
+
+        :param numpy: bool,return NumPy arrays instead of lists,
+            dtype is inferred from the column type in cursor.description
+        :return: tuple,column names and list of columns
+        """
+        sql, condition_values = self.build_select(fields)
+        res = self.query(sql, *condition_values, row_factory=tuple)
+        self.last_query = res["query"]
+        return self.to_columns(res, numpy)
+
+    def to_columns(self, res, numpy=False):
+        """convert the result of query_return_detail with tuple rows to columns"""
+        column_names = res["column_names"]
+        columns = utility.to_columns(res["data"], len(column_names))
+        if numpy:
+            numpy_dtypes = self.connection.numpy_dtypes
+            column_types = res.get("column_types") or [None] * len(columns)
+            columns = [utility.to_numpy_array(values, numpy_dtypes.get(column_type))
+                       for values, column_type in zip(columns, column_types)]
+        return column_names, columns
+
+    def explain(self, fields="*", analyze=False):
+        """
+        explain the SELECT statement select generates
+
+        :param analyze: bool,run the query to get the actual rows if database supports it
+        :return: dict,nodes(table,access,index,rows,full_scan of each table),rows,indexes,full_scan,plan and query
+        """
+        sql, condition_values = self.build_select(fields)
+        res = self.read_connection().explain_return_detail(sql, *condition_values, analyze=analyze)
+        self.last_query = res["query"]
+        return res
+
+    def get_row_factory(self):
+        """row_factory used by select"""
+        if self.row_factory:
+            return self.row_factory
+        return GraceDict if self.grace_result else Row
+
+    def iter(self, fields="*", fetch_size=1000):
+        """
+        same as select,but yield rows lazily,fetch fetch_size rows from server each time.
+
+        The connection is occupied until the iteration is finished.
+        """
+        sql, condition_values = self.build_select(fields)
+        self.last_query = sql
+        return self.read_connection().iter(sql, *condition_values, fetch_size=fetch_size,
+                               row_factory=self.get_row_factory())
+
+    def paginate(self, key="id", after=None, size=100, fields="*", cursor=None, desc=False):
+        """
+        keyset pagination,seek rows after the key of last page instead of OFFSET,
+        the cost of deep pages is same as the first one.
+
+        :param key: str or list,key to order rows,should be unique,"a,b" or ["a", "b"] for composite key
+        :param after: value of key in the last row of previous page,tuple for composite key
+        :param size: int,rows in one page
+        :param fields: str,should contain the key
+        :param cursor: str,next_cursor returned by previous page,used instead of after
+        :param desc: bool,order by key descending
+        :return: dict,data and next_cursor,next_cursor is None on the last page
+        """
+        keys, after = self.parse_paginate_key(key, after, cursor)
+        rows, column_names = self.select_page(fields, keys, after, size + 1, desc)  # one more to see next page
+        return self.gen_page(rows, size, keys, column_names)
+
+    @staticmethod
+    def parse_paginate_key(key, after, cursor):
+        """
+        :return: tuple,list of key names and list of values after or None
+        """
+        keys = [i.strip() for i in key.split(",")] if isinstance(key, str) else list(key)
+        if cursor:
+            after = utility.decode_cursor(cursor)
+        if after is not None:
+            after = list(after) if is_array(after) else [after]
+            if len(after) != len(keys):
+                raise ValueError(f"paginate needs {len(keys)} values of key {keys},got {after}")
+        return keys, after
+
+    def gen_page(self, rows, size, keys, column_names=None):
+        """result of paginate,rows has one more line if there is next page"""
+        next_cursor = None
+        if len(rows) > size:
+            rows = rows[:size]
+            next_cursor = utility.encode_cursor(self.get_key_values(rows[-1], keys, column_names))
+        return {
+            "data": rows,
+            "next_cursor": next_cursor,  # None if there is no more page
+        }
+
+    def select_page(self, fields, keys, after, limit, desc):
+        """
+        select rows of paginate
+
+        :return: tuple,rows and column names
+        """
+        raise NotImplementedError("You must implement it in subclass")
+
+    @staticmethod
+    def get_key_values(row, keys, column_names=None):
+        """values of key in row,name like a.id is found as id"""
+        names = [i.split(".")[-1].strip('`"[]') for i in keys]
+        if isinstance(row, tuple):  # tuple and namedtuple
+            return [row[column_names.index(i)] for i in names]
+        return [row[i] for i in names]
+
+    def build_select(self, fields="*"):
+        """
+        generate SELECT statement
+
+        :return: tuple,sql and values
+        """
         condition_values = []
         if fields.startswith("`"):  # native function
             sql = self.gen_select_without_fields(fields[1:])  # 用于直接执行 mysql 函数
         else:
             condition_sql, condition_values = self.parse_condition()
             sql = self.gen_select_with_fields(fields, condition_sql)
-        res = self.query(sql, *condition_values)
-        self.last_query = res["query"]
-        if self.grace_result:
-            res["data"] = [GraceDict(i) for i in res["data"]]
-
-        return res["data"]
+        return sql, condition_values
 
     def gen_select_with_fields(self, fields, condition):
         raise NotImplementedError("You must implement it in subclass")
@@ -314,21 +854,29 @@ class BaseDB(object):
 
     def get(self, fields="*"):
         """will replace self._limit to 1"""
-        self._limit = 1
-        res = self.select(fields)
+        res = self.limit(1).select(fields)
         return res[0] if res else {}  # return dit type
 
     def update(self, dict_data=None):
         if not dict_data:
             return False
+        sql, values = self.build_update(dict_data)
+        res = self.execute(sql, *values)
+        self.invalidate_cache()
+        self.last_query = res["query"]
+        return res
+
+    def build_update(self, dict_data):
+        """
+        generate UPDATE statement
+
+        :return: tuple,sql and values
+        """
         fields, values = self.split_update_fields_value(dict_data)
         condition_sql, condition_values = self.parse_condition()
         sql = self.gen_update(fields, condition_sql)
         values += condition_values
-        values = tuple(values)
-        res = self.execute(sql, *values)
-        self.last_query = res["query"]
-        return res
+        return sql, tuple(values)
 
     def gen_update(self, *args, **kwargs):
         raise NotImplementedError("You must implement it in subclass")
@@ -349,6 +897,18 @@ class BaseDB(object):
         if not dict_data:
             return False
 
+        sql, values = self.build_insert(dict_data)
+        res = self.execute(sql, *values)
+        self.invalidate_cache()
+        self.last_query = res["query"]
+        return res
+
+    def build_insert(self, dict_data):
+        """
+        generate INSERT statement
+
+        :return: tuple,sql and values
+        """
         keys = dict_data.keys()
         if "fields" in keys and "values" in keys:  # split dict
             fields = ",".join(dict_data["fields"])
@@ -358,17 +918,14 @@ class BaseDB(object):
             values = [v for v in dict_data["values"]]
         else:  # natural dict
             fields = ",".join(keys)
-            values = dict_data.values()
+            values = list(dict_data.values())
 
         values_sign = ",".join([self.param_place_holder for i in values])
         if fields:
             sql = self.gen_insert_with_fields(fields, values_sign)
         else:
             sql = self.gen_insert_without_fields(values_sign)
-
-        res = self.execute(sql, *values)
-        self.last_query = res["query"]
-        return res
+        return sql, values
 
     def gen_insert_with_fields(self, *args, **kwargs):
         raise NotImplementedError("You must implement it in subclass")
@@ -378,13 +935,158 @@ class BaseDB(object):
 
     def insert_many(self, dict_data=None):
         """
-        insert one line,,support rwo kinds data,such as insert,
+        insert many lines,support rwo kinds data,such as insert,
         but the values should be wraped with list or tuple
 
+        Lines are inserted by multi-row INSERT statements,
+        each one is kept under the limits of database,see build_insert_chunks.
+        rowcount of the result is the sum of all statements.
         """
         if not dict_data:
             return False
 
+        split = self.split_insert_many(dict_data)
+        if not split:
+            return False
+
+        fields, values = split
+        res = self.execute_chunks(self.build_insert_chunks(fields, values))
+        self.invalidate_cache()
+        self.last_query = res["query"]
+        return res
+
+    def upsert_many(self, rows, conflict_keys, update_fields=None):
+        """
+        insert many lines,update the existing lines conflicting on conflict_keys instead,
+        rows are the same as insert_many with field names,and sent by multi-row statements like it.
+
+        :param conflict_keys: list or str joined by comma,fields of primary key or an unique index,
+            MySQL updates on any unique key conflicting
+        :param update_fields: list or str joined by comma,fields updated on conflict,
+            all fields except conflict_keys by default,the existing lines are kept if it's empty
+        """
+        built = self.build_upsert_many(rows, conflict_keys, update_fields) if rows else None
+        if not built:
+            return False
+
+        res = self.execute_chunks(self.build_insert_chunks(*built))
+        self.invalidate_cache()
+        self.last_query = res["query"]
+        return res
+
+    def build_upsert_many(self, rows, conflict_keys, update_fields=None):
+        """
+        :return: tuple,field names joined by comma,list of tuple and function generates statement of rows,
+            None if rows are invalid
+        """
+        split = self.split_insert_many(rows)
+        if not split:
+            return None
+
+        fields, values = split
+        if not fields:
+            logging.error("upsert_many needs field names")
+            return None
+
+        conflict_keys = split_names(conflict_keys)
+        if update_fields is None:
+            update_fields = [i for i in split_names(fields) if i not in conflict_keys]
+        gen_rows = functools.partial(self.gen_upsert_rows, conflict_keys=conflict_keys,
+                                     update_fields=split_names(update_fields))
+        return fields, values, gen_rows
+
+    def gen_upsert_rows(self, *args, **kwargs):
+        raise NotImplementedError("You must implement it in subclass")
+
+    def execute_chunks(self, chunks):
+        """
+        execute statements of insert_many
+
+        :param chunks: iterable of sql and values
+        :return: dict,detail of the last statement,rowcount is the sum of all statements
+        """
+        if self.in_batch() is not None:  # rowcount is unknown until executing
+            return [self.execute(sql, *values) for sql, values in chunks][-1]
+
+        res = None
+        rowcount = 0
+        for sql, values in chunks:
+            res = self.execute(sql, *values)
+            rowcount += res["rowcount"]
+        res["rowcount"] = rowcount
+        return res
+
+    def build_insert_many(self, dict_data):
+        """
+        generate INSERT statement for executemany
+
+        :return: tuple,sql and values of all lines,None if dict_data is invalid
+        """
+        split = self.split_insert_many(dict_data)
+        if not split:
+            return None
+
+        fields, values = split
+        values_sign = ",".join([self.param_place_holder for f in values[0]])
+        if fields:
+            sql = self.gen_insert_with_fields(fields, values_sign)
+        else:
+            sql = self.gen_insert_without_fields(values_sign)
+        return sql, values
+
+    def build_insert_chunks(self, fields, values, gen_rows=None):
+        """
+        generate multi-row INSERT statements,
+        rows in one statement are limited by max_insert_rows, max_insert_params and get_max_insert_bytes.
+
+        :param fields: str,field names joined by comma,None to insert all fields
+        :param values: list of tuple
+        :param gen_rows: function generates statement by fields,values_sign and rows_count,
+            gen_insert_rows by default
+        :return: generator of sql and flat values
+        """
+        gen_rows = gen_rows or self.gen_insert_rows
+        columns_count = len(values[0])
+        max_rows = max(1, min(self.max_insert_rows, self.max_insert_params // columns_count))
+        max_bytes = self.get_max_insert_bytes()
+        values_sign = ",".join([self.param_place_holder] * columns_count)
+
+        sql_cache = {}  # rows count => sql
+
+        def build(chunk):
+            rows_count = len(chunk)
+            sql = sql_cache.get(rows_count)
+            if sql is None:
+                sql = sql_cache[rows_count] = gen_rows(fields, values_sign, rows_count)
+            return sql, [v for row in chunk for v in row]
+
+        chunk = []
+        chunk_size = 0
+        for row in values:
+            row_size = utility.estimate_size(row) if max_bytes else 0
+            if chunk and (len(chunk) >= max_rows or chunk_size + row_size > max_bytes > 0):
+                yield build(chunk)
+                chunk = []
+                chunk_size = 0
+            chunk.append(row)
+            chunk_size += row_size
+        if chunk:
+            yield build(chunk)
+
+    def get_max_insert_bytes(self):
+        """max bytes of one INSERT statement,0 means no limit"""
+        return 0
+
+    def gen_insert_rows(self, *args, **kwargs):
+        raise NotImplementedError("You must implement it in subclass")
+
+    def split_insert_many(self, dict_data):
+        """
+        split data of insert_many to field names and values
+
+        :return: tuple,field names joined by comma(None if not given) and list of tuple,
+            None if dict_data is invalid
+        """
         fields = ""  # all fields
 
         if is_array(dict_data):
@@ -392,30 +1094,22 @@ class BaseDB(object):
             keys = dict_data_item_1.keys()
             fields = ",".join(keys)
             values = [tuple(i.values()) for i in dict_data]
-            values_sign = ",".join([self.param_place_holder for f in keys])
         elif isinstance(dict_data, dict):  # split dict
             keys = dict_data.get("fields")
             if keys:
-                if "values" in keys and len(keys) == 1:  # split dict without fields
-                    fields = None
-                else:
-                    fields = ",".join(dict_data["fields"])
+                fields = ",".join(keys)
+            else:  # split dict without fields
+                fields = None
             values = list([v for v in dict_data["values"]])
-            values_sign = ",".join([self.param_place_holder for f in keys])
         else:
             logging.error("Param should be list or tuple or dict")
-            return False
+            return None
 
-        if fields:
-            sql = self.gen_insert_with_fields(fields, values_sign)
-        else:
-            sql = self.gen_insert_without_fields(values_sign)
+        if not values:
+            return None
 
         values = tuple([tuple(i) for i in values])  # SQL Server support tuple only
-
-        res = self.executemany(sql, values)
-        self.last_query = res["query"]
-        return res
+        return fields, values
 
     def gen_insert_many_with_fields(self, *args, **kwargs):
         raise NotImplementedError("You must implement it in subclass")
@@ -430,6 +1124,7 @@ class BaseDB(object):
 
         sql, sql_values = self.gen_delete()
         res = self.execute(sql, *sql_values)
+        self.invalidate_cache()
         self.last_query = res["query"]
         return res
 
@@ -439,7 +1134,8 @@ class BaseDB(object):
     def increase(self, field, step=1):
         """number field Increase"""
         sql, sql_values = self.gen_increase(field, str(step))
-        res = self.execute(sql, sql_values)
+        res = self.execute(sql, *sql_values)
+        self.invalidate_cache()
         self.last_query = res["query"]
         return res
 
@@ -450,6 +1146,7 @@ class BaseDB(object):
         """number field decrease """
         sql, sql_values = self.gen_decrease(field, str(step))
         res = self.execute(sql, *sql_values)
+        self.invalidate_cache()
         self.last_query = res["query"]
         return res
 
@@ -457,18 +1154,45 @@ class BaseDB(object):
         raise NotImplementedError("You must implement it in subclass")
 
     def get_fields_name(self, *args, **kwargs):
-        """return all fields of table"""
+        """return all fields of table,read from schema_cache,see load_schema"""
         if not self._table:
             return []
 
-        if self.cache_fields_name and self._cached_fields_name.get(self._table):
-            return self._cached_fields_name.get(self._table)
-        else:
-            res = self.connection.query_return_detail(self.gen_get_fields_name())
-            fields_name = res["column_names"]
-            self._cached_fields_name[self._table] = fields_name
+        table_schema = schema.find_table(self.load_schema(refresh=not self.cache_fields_name), self._table)
+        if table_schema:
+            return [i["name"] for i in table_schema["columns"]]
+        # not in catalog,like temporary table
+        res = self.connection.query_return_detail(self.gen_get_fields_name())
+        return res["column_names"]
+
+    def schema_key(self):
+        """key of the database in schema_cache"""
+        connection = self.connection
+        backend = getattr(connection, "backend", type(connection).__name__)
+        port = getattr(connection, "port", None)
+        host = f"{getattr(connection, 'host', '')}:{port}" if port else getattr(connection, "host", "")
+        return f"{backend}://{host}/{getattr(connection, 'database', '')}"
+
+    def load_schema(self, refresh=False):
+        """
+        columns,primary keys and indexes of all tables,loaded by one catalog query and kept in schema_cache
 
-            return fields_name
+        :param refresh: bool,query database even if it's cached,call it after changing tables
+        :return: dict,table name => dict of columns,primary_key and indexes,see schema.build_tables
+        """
+        key = self.schema_key()
+        tables = None if refresh else self.schema_cache.get(key)
+        if tables is None:
+            res = self.connection.query_return_detail(self.schema_query, row_factory=tuple)
+            tables = schema.build_tables(res["data"])
+            self.schema_cache.set(key, tables)
+        return tables
+
+    def get_schema(self, table=None):
+        """
+        :return: dict,columns,primary_key and indexes of table(current table by default),None if not found
+        """
+        return schema.find_table(self.load_schema(), table or self._table)
 
     def gen_get_fields_name(self, *args, **kwargs):
         """get one line from table"""
@@ -510,6 +1234,7 @@ class BaseDB(object):
 
     fetchall = select  # alias
     fetchone = get  # alias
+    select_iter = iter  # alias
 
 
 class ChainDB(BaseDB):
@@ -518,6 +1243,8 @@ class ChainDB(BaseDB):
 
     Statements are MySQL style.For other type ,implement the difference only.
     """
+    begin_statement = "START TRANSACTION;"
+    schema_query = schema.MYSQL_QUERY
 
     def gen_select_with_fields(self, fields, condition):
         fields = self.wrap_field_name(fields)
@@ -548,8 +1275,11 @@ class ChainDB(BaseDB):
                 if v0.startswith("`"):
                     v0 = v0[1:]
                 v0 = v0.replace("?", self.param_place_holder)
-                fields += f"{k}={v},"
+                fields += f"{k}={v0},"
                 values.append(v[1])
+            else:
+                fields += k + "=" + self.param_place_holder + ","
+                values.append(v)
 
         if fields:
             fields = fields[:-1]
@@ -571,6 +1301,30 @@ class ChainDB(BaseDB):
     def gen_insert_many_without_fields(self, values_sign):
         return f"INSERT INTO {self._table}  VALUES ({values_sign});"
 
+    def gen_insert_rows(self, fields, values_sign, rows_count):
+        """INSERT statement with rows_count rows in VALUES"""
+        rows_sign = ",".join([f"({values_sign})"] * rows_count)
+        if fields:
+            return f"INSERT INTO {self._table} ({fields}) VALUES {rows_sign};"
+        return f"INSERT INTO {self._table} VALUES {rows_sign};"
+
+    def gen_upsert_rows(self, fields, values_sign, rows_count, conflict_keys, update_fields):
+        """INSERT ... ON DUPLICATE KEY UPDATE of MySQL,conflict_keys are decided by unique keys of table"""
+        sql = self.gen_insert_rows(fields, values_sign, rows_count).rstrip(";")
+        if update_fields:
+            updates = ",".join([f"{i}=VALUES({i})" for i in update_fields])
+        else:  # keep the existing lines
+            updates = f"{conflict_keys[0]}={conflict_keys[0]}"
+        return f"{sql} ON DUPLICATE KEY UPDATE {updates};"
+
+    def gen_on_conflict_rows(self, fields, values_sign, rows_count, conflict_keys, update_fields):
+        """INSERT ... ON CONFLICT DO UPDATE of PostgreSQL and SQLite"""
+        sql = self.gen_insert_rows(fields, values_sign, rows_count).rstrip(";")
+        if not update_fields:
+            return f"{sql} ON CONFLICT ({','.join(conflict_keys)}) DO NOTHING;"
+        updates = ",".join([f"{i}=EXCLUDED.{i}" for i in update_fields])
+        return f"{sql} ON CONFLICT ({','.join(conflict_keys)}) DO UPDATE SET {updates};"
+
     def gen_delete(self):
         sql_where, sql_values_where = self.parse_where_condition("")
         return f"DELETE FROM {self._table} {sql_where};", sql_values_where
@@ -589,6 +1343,170 @@ class ChainDB(BaseDB):
         """get one line from table"""
         return f"SELECT * FROM {self._table} LIMIT 1;"
 
+    def build_select(self, fields="*"):
+        """
+        generate SELECT statement,reuse the compiled one with the same shape
+
+        :return: tuple,sql and values
+        """
+        if self._sql_cache is None or fields.startswith("`"):
+            return self.compile_select(fields)
+
+        key, values = self.select_shape(fields)
+        if key is None:
+            return self.compile_select(fields)
+
+        try:
+            sql = self._sql_cache.get(key)
+        except TypeError:  # unhashable value joined into SQL directly
+            return self.compile_select(fields)
+
+        if sql is None:
+            sql, values = self.compile_select(fields)
+            self._sql_cache.set(key, sql)
+        return sql, values
+
+    def compile_select(self, fields="*"):
+        """generate SELECT statement without the shape cache"""
+        return super().build_select(fields)
+
+    def select_page(self, fields, keys, after, limit, desc):
+        """select rows of paginate"""
+        sql, values = self.build_paginate(fields, keys, after, limit, desc)
+        res = self.query(sql, *values, row_factory=self.get_row_factory())
+        self.last_query = res["query"]
+        return res["data"], res["column_names"]
+
+    def build_paginate(self, fields, keys, after, limit, desc):
+        """
+        generate SELECT statement of paginate,seek condition is joined to where condition with AND
+
+        :return: tuple,sql and values
+        """
+        sql = self.parse_join()
+        where_sql, values = self.parse_where_condition("")
+        where_sql = where_sql.strip()[len("WHERE"):].strip()
+        if after is not None:
+            seek_sql, seek_values = self.parse_seek(keys, after, desc)
+            where_sql = f"({where_sql}) AND {seek_sql}" if where_sql else seek_sql
+            values += seek_values
+        if where_sql:
+            sql += f" WHERE {where_sql}"
+        order = ", ".join(f"{i} DESC" if desc else i for i in keys)
+        return self.gen_paginate(fields, sql, order, values, limit)
+
+    def parse_seek(self, keys, after, desc):
+        """
+        condition of rows after the key values,
+        composite key (a, b) is expanded to (a > ?) OR (a = ? AND b > ?)
+
+        :return: tuple,sql and values
+        """
+        sign = "<" if desc else ">"
+        ors = []
+        values = []
+        for index, k in enumerate(keys):
+            ands = [f"{i}={self.param_place_holder}" for i in keys[:index]]
+            ands.append(f"{k}{sign}{self.param_place_holder}")
+            ors.append(" AND ".join(ands))
+            values += after[:index + 1]
+        if len(ors) == 1:
+            return ors[0], values
+        return "(" + " OR ".join(f"({i})" for i in ors) + ")", values
+
+    def gen_paginate(self, fields, condition, order, values, limit):
+        return f"SELECT {fields} FROM {self._table} {condition} ORDER BY {order} LIMIT {self.param_place_holder};", \
+               values + [limit]
+
+    def select_shape(self, fields):
+        """
+        the shape of SELECT statement and the values to bind.
+
+        Values joined into SQL directly are parts of the shape,
+        the bound values are replaced by a placeholder,as parse_where_condition does.
+
+        :return: tuple,the shape and values,the shape is None if it can not be cached
+        """
+        where = self._where
+        if not where:
+            where_shape = ()
+            values = []
+        elif isinstance(where, str):
+            where_shape = where
+            values = []
+        elif isinstance(where, list) or isinstance(where, tuple):
+            where_shape, values = self.where_shape(where)
+        else:
+            return None, None
+
+        key = (self._table, fields, where_shape, self._order_by, self._limit, self._offset,
+               self._group_by, self.param_place_holder)
+        if any((self._inner_join, self._left_join, self._right_join,
+                self._outer_join, self._full_join, self._on)):
+            key += (self._inner_join, self._left_join, self._right_join,
+                    self._outer_join, self._full_join, self._on)
+        return key, values
+
+    @staticmethod
+    def where_shape(where):
+        """
+        split list type where condition to shape and values,
+        keep the same branches with parse_where_condition.
+        """
+        shape = []
+        values = []
+        and_or_length = 3  # decides how the last AND / OR is trimmed
+        for i in where:
+            v0 = i[1]
+            if len(i) == 2:  # single value
+                and_or_length = 3
+                if isinstance(v0, str) and v0.startswith("`"):  # native mysql function
+                    shape.append((i[0], v0))
+                else:
+                    shape.append((i[0], BOUND_VALUE))
+                    values.append(v0)
+                continue
+
+            i = tuple(i)
+            start = 1  # index of the sign in i
+            if isinstance(v0, str) and v0.lower() == "or":
+                start = 2
+                and_or_length = 2
+                if len(i) == 3:  # single value with OR
+                    v = i[2]
+                    if isinstance(v, str) and v.startswith("`"):
+                        shape.append(i)
+                    else:
+                        shape.append(i[:2] + (BOUND_VALUE,))
+                        values.append(v)
+                    continue
+                v0 = i[2]
+
+            sign = v0.strip().lower() if isinstance(v0, str) else ""
+            if sign[:1] in ("<", ">", "!"):  # < <= > >= !=
+                v1 = i[start + 1]
+                if isinstance(v1, str) and v1.startswith("`"):
+                    shape.append(i)
+                else:
+                    shape.append(i[:start + 1] + (BOUND_VALUE,) + i[start + 2:])
+                    values.append(v1)
+            elif sign in ("in", "not in", "is not"):  # JOIN STRING DIRECT
+                v1 = i[start + 1]
+                if is_array(v1):
+                    shape.append(i[:start + 1] + (tuple(v1),) + i[start + 2:])
+                else:
+                    shape.append(i)
+            elif sign == "between":
+                shape.append(i[:start + 1] + (BOUND_VALUE, BOUND_VALUE) + i[start + 3:])
+                values += [i[start + 1], i[start + 2]]
+            elif sign.startswith("`"):  # native mysql function
+                shape.append(i)
+            else:  # all the rest values are bound as one
+                shape.append(i[:start] + (BOUND_VALUE,))
+                values.append(i[start:])
+        shape.append(and_or_length)
+        return tuple(shape), values
+
     def parse_join(self):
         """parse join condition"""
         sql = ""
@@ -730,21 +1648,42 @@ class ChainDB(BaseDB):
     def begin(self, *args, **kwargs):
         """
         Transaction
+
+        The connection is pinned to current thread until commit or rollback.
         """
         # self.connection.db.autocommit(False)
         # todo pymysql 可能需要重新初始化才能修改 autocommit
-
-        self.execute("START TRANSACTION;")
+        self._check_transaction()
+        self.connection.pin()
+        try:
+            self.execute(self.begin_statement)
+        except Exception:
+            self.connection.unpin(discard=True)
+            raise
 
     def commit(self, *args, **kwargs):
         """
         Transaction
         """
-        self.execute("COMMIT;")
+        self._check_transaction()
+        try:
+            self.execute("COMMIT;")
+        finally:
+            self.connection.unpin()
+            self.invalidate_transaction_cache()
+
+    def _check_transaction(self):
+        if self.in_batch() is not None:
+            raise RuntimeError("transaction statements can not be collected by batch,"
+                               "call begin before the with block and commit after it")
 
     def rollback(self, *args, **kwargs):
         """
         Transaction
         """
-        self.execute("ROLLBACK;")
-        self.connection.db.autocommit(True)
+        self._check_transaction()
+        try:
+            self.execute("ROLLBACK;")
+        finally:
+            self.connection.unpin()
+            self.invalidate_transaction_cache()
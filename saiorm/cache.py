@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+Cache of query results
+
+Results are keyed by the database,the final SQL and bound values,
+entries of a table are dropped when the table is written by saiorm.
+Tables are (database,table name) given by ChainDB,so a cache can be shared by many DB.
+"""
+import collections
+import threading
+import time
+
+try:
+    from . import utility
+except ImportError:
+    import utility
+
+
+class ResultCache(object):
+    """
+    Least recently used cache of query results with TTL,thread-safe.
+
+    :param max_entries: int,the least recently used one will be evicted when exceed it
+    :param max_bytes: int,evict entries when the estimated size of results exceed it,0 means no limit
+    :param ttl: float,default seconds an entry lives
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=0, ttl=60.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._data = collections.OrderedDict()  # key => (rows, tables, expire time, bytes)
+        self._tables = collections.defaultdict(set)  # table => keys reading it
+        self._generations = collections.defaultdict(int)  # table => times of invalidation
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def bytes(self):
+        """estimated size of cached results"""
+        return self._bytes
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,  # evicted by max_entries or max_bytes
+            "invalidations": self.invalidations,  # dropped by writing
+            "entries": len(self._data),
+            "bytes": self._bytes,
+        }
+
+    def get(self, key):
+        """
+        :return: cached rows,None if missed or expired
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[2] < time.time():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def generation(self, tables):
+        """
+        take it before querying and pass it to set,
+        so the result read before a writing will not be cached after the invalidation
+        """
+        return tuple(self._generations[table] for table in tables)
+
+    def set(self, key, rows, tables, ttl=None, generation=None):
+        """
+        :param rows: list,result of select
+        :param tables: list of tables the query reads
+        :param ttl: float,seconds the entry lives,use the default one if None
+        :param generation: tuple,returned by generation before querying
+        """
+        ttl = self.ttl if ttl is None else ttl
+        size = sum(utility.estimate_size(row_values(row)) for row in rows)
+        if self.max_bytes and size > self.max_bytes:
+            return  # too big to cache
+        with self._lock:
+            if generation is not None and generation != self.generation(tables):
+                return  # tables are written while querying
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (rows, tables, time.time() + ttl, size)
+            self._bytes += size
+            for table in tables:
+                self._tables[table].add(key)
+            while len(self._data) > self.max_entries or (self.max_bytes and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._data)))
+                self.evictions += 1
+
+    def invalidate(self, table):
+        """drop all entries reading the table"""
+        with self._lock:
+            self._generations[table] += 1
+            keys = self._tables.pop(table, ())
+            for key in keys:
+                if key in self._data:
+                    self._remove(key)
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._tables.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        rows, tables, expire_time, size = self._data.pop(key)
+        self._bytes -= size
+        for table in tables:
+            keys = self._tables.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tables[table]
+
+
+def row_values(row):
+    """values of rows made by all kinds of row_factory"""
+    if isinstance(row, tuple):
+        return row
+    values = getattr(row, "values", None)
+    if values is not None:
+        return values()
+    return (row,)
+
+
+def copy_rows(rows):
+    """shallow copy of cached rows,so changing the result will not change the cache"""
+    return [row if isinstance(row, tuple) else
+            type(row)(row) if isinstance(row, dict) else
+            row.__class__(tuple(row.values())) if isinstance(row, utility.SlotsRow) else
+            row
+            for row in rows]
+
+
+def table_name(name):
+    """table name without alias and quotes,"abc AS a" => abc"""
+    return name.strip().split()[0].strip('`"[]').lower() if name.strip() else ""
@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+Query events
+
+Listeners are called before and after each statement executed by connections,
+add them to one connection by connection.add_listener or to all by add_listener.
+"""
+import asyncio
+import collections
+import functools
+import inspect
+import logging
+import re
+import threading
+import time
+
+try:
+    from . import utility
+except ImportError:
+    import utility
+
+listeners = []  # called for all connections
+
+
+def add_listener(listener):
+    """listen to statements of all connections"""
+    listeners.append(listener)
+
+
+def remove_listener(listener):
+    listeners.remove(listener)
+
+
+class QueryEvent(object):
+    """
+    A statement executed by connection,
+    elapsed,rowcount and exception are set after executing.
+    """
+    __slots__ = ("backend", "kind", "query", "parameters_count", "parameters", "connection",
+                 "start_time", "elapsed", "rowcount", "exception")
+
+    def __init__(self, backend, kind, query, parameters_count, parameters=None, connection=None):
+        self.backend = backend  # MySQL,PostgreSQL,SQLite or SQLServer
+        self.kind = kind  # query,execute,executemany,copy_in or load_data
+        self.query = query  # SQL with placeholders
+        self.parameters_count = parameters_count  # bound values,None if unknown
+        self.parameters = parameters  # tuple or dict of bound values of query and execute
+        self.connection = connection  # connection executing it
+        self.start_time = time.time()
+        self.elapsed = None  # seconds
+        self.rowcount = None  # rows returned by query or affected by the others
+        self.exception = None
+
+    @property
+    def shape(self):
+        """statement without values,see statement_shape"""
+        return statement_shape(self.query)
+
+    def __repr__(self):
+        return f"<QueryEvent {self.backend} {self.kind} {self.query!r} {self.elapsed}>"
+
+
+class Listener(object):
+    """
+    Base class of listeners,override before and after.
+    """
+
+    def before(self, event):
+        pass
+
+    def after(self, event):
+        pass
+
+
+class SlowQueryLogger(Listener):
+    """
+    log statements slower than threshold
+
+    :param threshold: float,seconds
+    :param logger: logging.Logger,logger named saiorm.slow_query by default
+    """
+
+    def __init__(self, threshold=1.0, logger=None, level=logging.WARNING):
+        self.threshold = threshold
+        self.logger = logger or logging.getLogger("saiorm.slow_query")
+        self.level = level
+
+    def after(self, event):
+        if event.elapsed >= self.threshold:
+            self.logger.log(self.level, f"Slow {event.kind} on {event.backend} took {event.elapsed:.3f}s,"
+                                        f"rowcount {event.rowcount}: {event.query}")
+
+
+class LatencyHistogram(Listener):
+    """
+    Rolling latency of each statement shape,keeps the latest window ones.
+
+    :param window: int,latest statements kept for each shape
+    :param max_shapes: int,the least recently used shape will be dropped when exceed it
+    """
+
+    def __init__(self, window=1000, max_shapes=1000):
+        self.window = window
+        self.max_shapes = max_shapes
+        self._shapes = collections.OrderedDict()  # shape => (deque of elapsed, [count])
+        self._lock = threading.Lock()
+
+    def after(self, event):
+        shape = event.shape
+        with self._lock:
+            entry = self._shapes.get(shape)
+            if entry is None:
+                entry = self._shapes[shape] = (collections.deque(maxlen=self.window), [0])
+                while len(self._shapes) > self.max_shapes:
+                    self._shapes.popitem(last=False)
+            else:
+                self._shapes.move_to_end(shape)
+            entry[0].append(event.elapsed)
+            entry[1][0] += 1
+
+    def percentiles(self, shape):
+        """
+        :return: dict,count(all the time),p50,p95,p99 and max of the window in seconds,None if not found
+        """
+        with self._lock:
+            entry = self._shapes.get(shape)
+            if entry is None:
+                return None
+            values = sorted(entry[0])
+            count = entry[1][0]
+        return {
+            "count": count,
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "max": values[-1],
+        }
+
+    def report(self):
+        """
+        :return: list of tuple,shape and percentiles,the slowest p99 first
+        """
+        with self._lock:
+            shapes = list(self._shapes)
+        res = [(i, self.percentiles(i)) for i in shapes]
+        res = [i for i in res if i[1]]
+        res.sort(key=lambda i: i[1]["p99"], reverse=True)
+        return res
+
+    def clear(self):
+        with self._lock:
+            self._shapes.clear()
+
+
+class AutoExplain(Listener):
+    """
+    explain SELECT statements slower than threshold and log the plan,
+    a statement shape is explained once in interval seconds.
+
+    :param threshold: float,seconds
+    :param analyze: bool,run the query again to get the actual rows,see BaseConnection.explain_return_detail
+    :param interval: float,seconds
+    :param logger: logging.Logger,logger named saiorm.auto_explain by default
+    """
+
+    def __init__(self, threshold=1.0, analyze=False, interval=60.0, logger=None, level=logging.WARNING):
+        self.threshold = threshold
+        self.analyze = analyze
+        self.interval = interval
+        self.logger = logger or logging.getLogger("saiorm.auto_explain")
+        self.level = level
+        self.plans = utility.LRUCache(256)  # shape => (time, result of explain)
+        self._local = threading.local()  # do not explain the statements of explain
+        self._tasks = set()  # explaining of asyncio connections
+
+    def after(self, event):
+        if (event.exception is not None or event.kind != "query" or event.elapsed < self.threshold or
+                event.connection is None or isinstance(event.parameters, dict) or
+                not event.query.lstrip()[:6].upper() == "SELECT" or getattr(self._local, "explaining", False)):
+            return
+
+        shape = event.shape
+        last = self.plans.get(shape)
+        if last is not None and time.time() - last[0] < self.interval:
+            return
+
+        self._local.explaining = True
+        try:
+            res = event.connection.explain_return_detail(event.query, *(event.parameters or ()),
+                                                         analyze=self.analyze)
+        finally:
+            self._local.explaining = False
+        if inspect.isawaitable(res):  # asyncio connection,explain in a task
+            self.plans.set(shape, (time.time(), None))
+            task = asyncio.ensure_future(self._log_plan_async(shape, event, res))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            return
+        self._log_plan(shape, event, res)
+
+    async def _log_plan_async(self, shape, event, awaitable):
+        try:
+            res = await awaitable
+        except Exception:
+            logging.error(f"Error when explaining {event.query}", exc_info=True)
+            return
+        self._log_plan(shape, event, res)
+
+    def _log_plan(self, shape, event, res):
+        self.plans.set(shape, (time.time(), res))
+        self.logger.log(self.level, f"Slow query on {event.backend} took {event.elapsed:.3f}s,"
+                                    f"full_scan {res['full_scan']},indexes {res['indexes']},rows {res['rows']}: "
+                                    f"{event.query} {res['nodes']}")
+
+
+def percentile(sorted_values, p):
+    """nearest rank"""
+    index = max(0, -(-len(sorted_values) * p // 100) - 1)
+    return sorted_values[int(index)]
+
+
+_string_literal = re.compile(r"'(?:[^']|'')*'")
+_number = re.compile(r"(?<![\w$])-?\d+(?:\.\d+)?\b")
+_placeholder = re.compile(r"%s|%\(\w+\)s|\?|\$\d+")
+_in_list = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_values_list = re.compile(r"\bVALUES\s*(\([^()]*\))(?:\s*,\s*\([^()]*\))+", re.IGNORECASE)
+_whitespace = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=1024)
+def statement_shape(query):
+    """
+    statement without values,same shape for the same chain call
+
+    SELECT * FROM t WHERE id IN (1, 2) LIMIT 10 => SELECT * FROM t WHERE id IN (...) LIMIT ?
+    """
+    if not isinstance(query, str):
+        return str(query)
+    shape = _string_literal.sub("?", query)
+    shape = _placeholder.sub("?", shape)
+    shape = _number.sub("?", shape)
+    shape = _in_list.sub("IN (...)", shape)
+    shape = _values_list.sub(lambda m: "VALUES " + m.group(1) + ", ...", shape)
+    return _whitespace.sub(" ", shape).strip()
+
+
+def parameters_count(parameters):
+    """number of bound values,None if unknown"""
+    if parameters is None:
+        return 0
+    if isinstance(parameters, (list, tuple, dict)):
+        return len(parameters)
+    return None
+
+
+def observe(kind):
+    """
+    decorator of connection methods receiving query and parameters,
+    call listeners of the connection and global listeners before and after it.
+    """
+
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, query, *parameters, **kwparameters):
+            if not listeners and not self.listeners:
+                return method(self, query, *parameters, **kwparameters)
+
+            event, active = start_event(self, kind, query, parameters, kwparameters)
+            start = time.perf_counter()
+            try:
+                res = method(self, query, *parameters, **kwparameters)
+            except Exception as e:
+                finish_event(active, event, start, exception=e)
+                raise
+            finish_event(active, event, start, res)
+            return res
+
+        return wrapper
+
+    return decorator
+
+
+def observe_async(kind):
+    """same as observe,for coroutine methods of asyncio connections"""
+
+    def decorator(method):
+        @functools.wraps(method)
+        async def wrapper(self, query, *parameters, **kwparameters):
+            if not listeners and not self.listeners:
+                return await method(self, query, *parameters, **kwparameters)
+
+            event, active = start_event(self, kind, query, parameters, kwparameters)
+            start = time.perf_counter()
+            try:
+                res = await method(self, query, *parameters, **kwparameters)
+            except Exception as e:
+                finish_event(active, event, start, exception=e)
+                raise
+            finish_event(active, event, start, res)
+            return res
+
+        return wrapper
+
+    return decorator
+
+
+def start_event(connection, kind, query, parameters, kwparameters):
+    """
+    build the event of a statement and call before of listeners
+
+    :return: tuple,event and listeners called
+    """
+    params = None
+    if kind == "executemany":
+        rows = parameters[0] if parameters else ()
+        count = sum(len(i) for i in rows) if isinstance(rows, (list, tuple)) else None
+    elif kind in ("query", "execute"):
+        params = {k: v for k, v in kwparameters.items() if k != "row_factory"} or parameters
+        count = len(params)
+    else:
+        count = None
+    event = QueryEvent(connection.backend, kind, query, count, params, connection)
+    active = listeners + connection.listeners
+    notify(active, "before", event)
+    return event, active
+
+
+def finish_event(active, event, start, res=None, exception=None):
+    """fill elapsed,rowcount or exception of the event and call after of listeners"""
+    event.elapsed = time.perf_counter() - start
+    event.exception = exception
+    if isinstance(res, dict):
+        event.rowcount = len(res["data"]) if "data" in res else res.get("rowcount")
+        if event.kind == "load_data":
+            event.query = res.get("query") or event.query
+    notify(active, "after", event)
+
+
+def notify(active, name, event):
+    for listener in active:
+        try:
+            getattr(listener, name)(event)
+        except Exception:
+            logging.error(f"Error in listener {listener!r}", exc_info=True)
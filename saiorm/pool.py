@@ -0,0 +1,320 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+Connection pool
+
+Connections are created by the creator function of the backend,
+borrowed per call and returned after using.
+"""
+import asyncio
+import collections
+import contextlib
+import logging
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """No connection is available in pool before timeout"""
+    pass
+
+
+class PoolClosed(Exception):
+    """The pool has been closed"""
+    pass
+
+
+class ConnectionPool(object):
+    """
+    Thread-safe pool of database connections.
+
+    :param creator: function without param,returns a new connection
+    :param min_size: int,connections created when initialization
+    :param max_size: int,max connections opened at the same time
+    :param timeout: float,seconds to wait for a free connection
+    :param validator: function receives a connection,returns False if it's broken
+    :param validate_after: float,validate the connection on borrow if it has been idle longer than it
+    :param max_idle_time: float,close the connection if it has been idle longer than it
+    :param prefill: bool,create min_size connections when initialization
+    """
+
+    def __init__(self, creator, min_size=1, max_size=10, timeout=30.0,
+                 validator=None, validate_after=5.0, max_idle_time=7 * 3600,
+                 prefill=True):
+        if max_size < 1:
+            raise ValueError("max_size of pool should be greater than 0")
+
+        self.creator = creator
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.validator = validator
+        self.validate_after = validate_after
+        self.max_idle_time = max_idle_time
+
+        self._idle = collections.deque()  # (connection, last use time)
+        self._size = 0  # idle and borrowed connections
+        self._closed = False  # borrowed connections are closed when returned after close
+        self._condition = threading.Condition()
+
+        if prefill:
+            self.fill()
+
+    def fill(self):
+        """create connections until there are min_size ones"""
+        while self._size < self.min_size:
+            conn = self.creator()
+            with self._condition:
+                self._idle.append((conn, time.time()))
+                self._size += 1
+                self._condition.notify()
+
+    @property
+    def size(self):
+        """number of connections opened"""
+        return self._size
+
+    @property
+    def idle_size(self):
+        """number of connections waiting for borrowing"""
+        return len(self._idle)
+
+    def acquire(self, timeout=None):
+        """borrow a connection,wait until timeout if the pool is exhausted"""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.time() + timeout
+        conn = None
+        last_use_time = 0
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise PoolClosed("Connection pool has been closed")
+                if self._idle:
+                    conn, last_use_time = self._idle.pop()  # LIFO,the hottest one first
+                    break
+                if self._size < self.max_size:
+                    self._size += 1  # take the place,create it outside the lock
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No connection available in {timeout} seconds,"
+                                      f"max_size is {self.max_size}")
+                self._condition.wait(remaining)
+
+        if conn is not None:
+            idle_time = time.time() - last_use_time
+            if idle_time > self.max_idle_time:
+                self._close(conn)
+                conn = None
+            elif idle_time > self.validate_after and not self._validate(conn):
+                self._close(conn)
+                conn = None
+
+        if conn is None:
+            try:
+                conn = self.creator()
+            except Exception:
+                with self._condition:
+                    self._size -= 1
+                    self._condition.notify()
+                raise
+        return conn
+
+    def release(self, conn):
+        """return a connection to pool,close it if pool is closed"""
+        with self._condition:
+            if not self._closed:
+                self._idle.append((conn, time.time()))
+                self._condition.notify()
+                return
+        self.discard(conn)
+
+    def discard(self, conn):
+        """close a broken connection instead of returning it"""
+        self._close(conn)
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    @contextlib.contextmanager
+    def connection(self):
+        """borrow a connection in with statement"""
+        conn = self.acquire()
+        ok = False
+        try:
+            yield conn
+            ok = True
+        finally:
+            if ok:
+                self.release(conn)
+            else:
+                self.discard(conn)
+
+    def close(self):
+        """close all idle connections,borrowed ones are closed when returned,acquire raises PoolClosed after it"""
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for conn, last_use_time in idle:
+            self._close(conn)
+
+    def _validate(self, conn):
+        if self.validator is None:
+            return True
+        try:
+            return self.validator(conn) is not False
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            logging.debug("Error when closing pooled connection", exc_info=True)
+
+
+class AsyncConnectionPool(object):
+    """
+    Pool of asyncio database connections,used in one event loop.
+
+    Params are same as ConnectionPool,but creator and validator should be coroutine functions.
+
+    :param closer: coroutine function receives a connection and closes it
+    """
+
+    def __init__(self, creator, closer, min_size=1, max_size=10, timeout=30.0,
+                 validator=None, validate_after=5.0, max_idle_time=7 * 3600):
+        if max_size < 1:
+            raise ValueError("max_size of pool should be greater than 0")
+
+        self.creator = creator
+        self.closer = closer
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.validator = validator
+        self.validate_after = validate_after
+        self.max_idle_time = max_idle_time
+
+        self._idle = collections.deque()  # (connection, last use time)
+        self._size = 0  # idle and borrowed connections
+        self._closed = False  # borrowed connections are closed when returned after close
+        self._condition = None  # created in event loop
+
+    @property
+    def size(self):
+        """number of connections opened"""
+        return self._size
+
+    @property
+    def idle_size(self):
+        """number of connections waiting for borrowing"""
+        return len(self._idle)
+
+    def _get_condition(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    async def fill(self):
+        """create connections until there are min_size ones"""
+        condition = self._get_condition()
+        while self._size < self.min_size:
+            conn = await self.creator()
+            async with condition:
+                self._idle.append((conn, time.time()))
+                self._size += 1
+                condition.notify()
+
+    async def acquire(self, timeout=None):
+        """borrow a connection,wait until timeout if the pool is exhausted"""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = time.time() + timeout
+        condition = self._get_condition()
+        conn = None
+        last_use_time = 0
+        async with condition:
+            while True:
+                if self._closed:
+                    raise PoolClosed("Connection pool has been closed")
+                if self._idle:
+                    conn, last_use_time = self._idle.pop()  # LIFO,the hottest one first
+                    break
+                if self._size < self.max_size:
+                    self._size += 1  # take the place,create it outside the lock
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout(f"No connection available in {timeout} seconds,"
+                                      f"max_size is {self.max_size}")
+                try:
+                    await asyncio.wait_for(condition.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+
+        if conn is not None:
+            idle_time = time.time() - last_use_time
+            if idle_time > self.max_idle_time:
+                await self._close(conn)
+                conn = None
+            elif idle_time > self.validate_after and not await self._validate(conn):
+                await self._close(conn)
+                conn = None
+
+        if conn is None:
+            try:
+                conn = await self.creator()
+            except Exception:
+                async with condition:
+                    self._size -= 1
+                    condition.notify()
+                raise
+        return conn
+
+    async def release(self, conn):
+        """return a connection to pool,close it if pool is closed"""
+        condition = self._get_condition()
+        async with condition:
+            if not self._closed:
+                self._idle.append((conn, time.time()))
+                condition.notify()
+                return
+        await self.discard(conn)
+
+    async def discard(self, conn):
+        """close a broken connection instead of returning it"""
+        await self._close(conn)
+        condition = self._get_condition()
+        async with condition:
+            self._size -= 1
+            condition.notify()
+
+    async def close(self):
+        """close all idle connections,borrowed ones are closed when returned,acquire raises PoolClosed after it"""
+        self._closed = True
+        idle = list(self._idle)
+        self._idle.clear()
+        self._size -= len(idle)
+        if self._condition is not None:
+            async with self._condition:
+                self._condition.notify_all()
+        for conn, last_use_time in idle:
+            await self._close(conn)
+
+    async def _validate(self, conn):
+        if self.validator is None:
+            return True
+        try:
+            return await self.validator(conn) is not False
+        except Exception:
+            return False
+
+    async def _close(self, conn):
+        try:
+            await self.closer(conn)
+        except Exception:
+            logging.debug("Error when closing pooled connection", exc_info=True)
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+Read/write splitting
+
+Queries are sent to replicas,the others are sent to primary,
+queries in transaction are sent to primary too.
+"""
+import itertools
+import threading
+
+STRATEGIES = ("round_robin", "least_outstanding", "weighted")
+
+
+class ReplicaConnection(object):
+    """
+    Route queries of a primary connection and its replicas,
+    attributes not defined here are the ones of primary,so it can be used as a connection.
+
+    :param primary: connection to execute statements
+    :param replicas: list of connections to query
+    :param strategy: str,how to choose a replica,
+        round_robin,least_outstanding(the one running fewest queries) or weighted(smooth weighted round robin)
+    :param weights: list of int,weight of each replica,used by weighted
+    """
+
+    def __init__(self, primary, replicas, strategy="round_robin", weights=None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy of replicas should be one of {STRATEGIES},got {strategy}")
+        if not replicas:
+            raise ValueError("replicas should not be empty")
+
+        self.primary = primary
+        self.replicas = list(replicas)
+        self.strategy = strategy
+        self.weights = list(weights) if weights else [1] * len(self.replicas)
+        if len(self.weights) != len(self.replicas):
+            raise ValueError("weights should have the same length as replicas")
+
+        self._counter = itertools.count()
+        self._outstanding = [0] * len(self.replicas)  # queries running on each replica
+        self._current_weights = [0] * len(self.replicas)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.primary, name)
+
+    def add_listener(self, listener):
+        for i in [self.primary] + self.replicas:
+            i.add_listener(listener)
+
+    def remove_listener(self, listener):
+        for i in [self.primary] + self.replicas:
+            i.remove_listener(listener)
+
+    def close(self):
+        self.primary.close()
+        for i in self.replicas:
+            i.close()
+
+    def choose(self):
+        """
+        :return: int,index of the replica to query,call it with lock
+        """
+        if self.strategy == "round_robin":
+            return next(self._counter) % len(self.replicas)
+
+        if self.strategy == "least_outstanding":  # round robin among the idle ones
+            n = len(self.replicas)
+            start = next(self._counter)
+            return min(((start + i) % n for i in range(n)), key=self._outstanding.__getitem__)
+
+        # weighted,same as nginx,spread the heavy one among the others
+        total = sum(self.weights)
+        best = 0
+        for index, weight in enumerate(self.weights):
+            self._current_weights[index] += weight
+            if self._current_weights[index] > self._current_weights[best]:
+                best = index
+        self._current_weights[best] -= total
+        return best
+
+    def _acquire(self):
+        with self._lock:
+            index = self.choose()
+            self._outstanding[index] += 1
+        return index
+
+    def _release(self, index):
+        with self._lock:
+            self._outstanding[index] -= 1
+
+    def query_return_detail(self, query, *parameters, **kwparameters):
+        """query on replica,on primary in transaction"""
+        if self.primary.in_transaction():
+            return self.primary.query_return_detail(query, *parameters, **kwparameters)
+
+        index = self._acquire()
+        try:
+            return self.replicas[index].query_return_detail(query, *parameters, **kwparameters)
+        finally:
+            self._release(index)
+
+    def iter(self, query, *parameters, **kwparameters):
+        """iterate on replica,on primary in transaction"""
+        if self.primary.in_transaction():
+            return self.primary.iter(query, *parameters, **kwparameters)
+        return self._iter(query, parameters, kwparameters)
+
+    def _iter(self, query, parameters, kwparameters):
+        index = self._acquire()
+        try:
+            yield from self.replicas[index].iter(query, *parameters, **kwparameters)
+        finally:
+            self._release(index)
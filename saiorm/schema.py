@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+Schema cache
+
+Columns,primary keys and indexes of all tables are loaded by one catalog query,
+kept for ttl seconds and saved to a JSON snapshot file optionally,
+so new processes read the snapshot instead of querying database.
+"""
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+SNAPSHOT_VERSION = 1
+
+# catalog queries,each row is (kind, table, name, position, type or column, nullable or unique),see build_tables
+MYSQL_QUERY = """
+SELECT 'column', TABLE_NAME, COLUMN_NAME, ORDINAL_POSITION, COLUMN_TYPE, IS_NULLABLE = 'YES'
+FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()
+UNION ALL
+SELECT CASE WHEN INDEX_NAME = 'PRIMARY' THEN 'primary' ELSE 'index' END,
+       TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX, COLUMN_NAME, NON_UNIQUE = 0
+FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE()
+"""
+
+POSTGRESQL_QUERY = """
+SELECT 'column'::text, c.relname::text, a.attname::text, a.attnum::int,
+       format_type(a.atttypid, a.atttypmod), NOT a.attnotnull
+FROM pg_catalog.pg_attribute a
+JOIN pg_catalog.pg_class c ON c.oid = a.attrelid
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+WHERE c.relkind IN ('r', 'p', 'v', 'm') AND a.attnum > 0 AND NOT a.attisdropped
+  AND n.nspname = ANY (current_schemas(false))
+UNION ALL
+SELECT CASE WHEN i.indisprimary THEN 'primary' ELSE 'index' END, c.relname::text, ic.relname::text, k.n::int,
+       a.attname::text, i.indisunique
+FROM pg_catalog.pg_index i
+JOIN pg_catalog.pg_class c ON c.oid = i.indrelid
+JOIN pg_catalog.pg_class ic ON ic.oid = i.indexrelid
+JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+CROSS JOIN LATERAL unnest(i.indkey::int2[]) WITH ORDINALITY AS k(attnum, n)
+JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid AND a.attnum = k.attnum
+WHERE n.nspname = ANY (current_schemas(false))
+"""
+
+SQLITE_QUERY = """
+SELECT 'column', m.name, p.name, p.cid + 1, p.type, NOT p."notnull"
+FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p
+WHERE m.type IN ('table', 'view') AND substr(m.name, 1, 7) != 'sqlite_'
+UNION ALL
+SELECT 'primary', m.name, 'PRIMARY', p.pk, p.name, 1
+FROM sqlite_master AS m JOIN pragma_table_info(m.name) AS p
+WHERE m.type = 'table' AND p.pk > 0 AND substr(m.name, 1, 7) != 'sqlite_'
+UNION ALL
+SELECT 'index', m.name, l.name, i.seqno + 1, i.name, l."unique"
+FROM sqlite_master AS m JOIN pragma_index_list(m.name) AS l JOIN pragma_index_info(l.name) AS i
+WHERE m.type = 'table' AND l.origin != 'pk' AND substr(m.name, 1, 7) != 'sqlite_'
+"""
+
+SQLSERVER_QUERY = """
+SELECT 'column', t.name, c.name, c.column_id, ty.name, c.is_nullable
+FROM sys.columns c
+JOIN sys.objects t ON t.object_id = c.object_id
+JOIN sys.types ty ON ty.user_type_id = c.user_type_id
+WHERE t.type IN ('U', 'V') AND t.is_ms_shipped = 0
+UNION ALL
+SELECT CASE WHEN i.is_primary_key = 1 THEN 'primary' ELSE 'index' END, t.name, i.name, ic.key_ordinal,
+       c.name, i.is_unique
+FROM sys.indexes i
+JOIN sys.objects t ON t.object_id = i.object_id
+JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+WHERE t.type = 'U' AND t.is_ms_shipped = 0 AND ic.key_ordinal > 0
+"""
+
+
+class SchemaCache(object):
+    """
+    Schema of databases,thread-safe,can be shared by many DB.
+
+    :param ttl: float,seconds a schema lives,None means never expires
+    :param snapshot_path: str,JSON file to save schemas,loaded when the first schema is read
+    """
+
+    def __init__(self, ttl=300.0, snapshot_path=None):
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self._schemas = {}  # database key => (loaded time, tables)
+        self._snapshot_loaded = False
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :return: dict,table name => schema of table,None if missed or expired
+        """
+        with self._lock:
+            if not self._snapshot_loaded:
+                self._load_snapshot()
+            entry = self._schemas.get(key)
+            if entry is None:
+                return None
+            if self.ttl is not None and time.time() - entry[0] > self.ttl:
+                del self._schemas[key]
+                return None
+            return entry[1]
+
+    def set(self, key, tables):
+        """
+        :param tables: dict,returned by build_tables
+        """
+        with self._lock:
+            self._schemas[key] = (time.time(), tables)
+            if self.snapshot_path:
+                self._save_snapshot()
+
+    def invalidate(self, key=None):
+        """drop schema of the database,all if key is None,call it after changing tables"""
+        with self._lock:
+            if key is None:
+                self._schemas.clear()
+            else:
+                self._schemas.pop(key, None)
+            if self.snapshot_path:
+                self._save_snapshot()
+
+    def _load_snapshot(self):
+        self._snapshot_loaded = True
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, encoding="utf8") as f:
+                snapshot = json.load(f)
+            if snapshot.get("version") != SNAPSHOT_VERSION:
+                return
+            for key, entry in snapshot["databases"].items():
+                if key not in self._schemas:
+                    self._schemas[key] = (entry["loaded_time"], entry["tables"])
+        except Exception:
+            logging.warning(f"Cannot load schema snapshot {self.snapshot_path}", exc_info=True)
+
+    def _save_snapshot(self):
+        """write to a temp file and rename it,so other processes never read a partial one"""
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "databases": {key: {"loaded_time": loaded_time, "tables": tables}
+                          for key, (loaded_time, tables) in self._schemas.items()},
+        }
+        directory = os.path.dirname(os.path.abspath(self.snapshot_path))
+        try:
+            fd, path = tempfile.mkstemp(dir=directory, prefix=".saiorm_schema_", suffix=".json")
+            try:
+                with os.fdopen(fd, "w", encoding="utf8") as f:
+                    json.dump(snapshot, f)
+                os.replace(path, self.snapshot_path)
+            except Exception:
+                os.remove(path)
+                raise
+        except Exception:
+            logging.warning(f"Cannot save schema snapshot {self.snapshot_path}", exc_info=True)
+
+
+def build_tables(rows):
+    """
+    build schemas of tables from rows of catalog query,each row is
+    (kind, table, name, position, type or column, nullable or unique),kind is column,primary or index
+
+    :return: dict,table name => dict of columns,primary_key and indexes
+    """
+    tables = {}
+    rows = sorted(rows, key=lambda i: (i[1], i[0], i[2] if i[0] == "index" else "", int(i[3])))
+    for kind, table, name, position, value, flag in rows:
+        if value is None:  # column of expression index
+            continue
+        schema = tables.get(table)
+        if schema is None:
+            schema = tables[table] = table_schema()
+        if kind == "column":
+            schema["columns"].append({
+                "name": name,
+                "type": value,  # type name of database
+                "nullable": bool(flag),
+            })
+        elif kind == "primary":
+            schema["primary_key"].append(value)
+        else:
+            index = schema["indexes"].get(name)
+            if index is None:
+                index = schema["indexes"][name] = {"columns": [], "unique": bool(flag)}
+            index["columns"].append(value)
+    return tables
+
+
+def table_schema():
+    return {
+        "columns": [],  # dict of name,type and nullable,in the order of table
+        "primary_key": [],  # column names
+        "indexes": {},  # index name => dict of columns and unique,primary key is not in it
+    }
+
+
+def find_table(tables, name):
+    """schema of table name,quotes and schema name like public. are ignored,None if not found"""
+    if not name:
+        return None
+    res = tables.get(name)
+    if res is None:
+        name = name.strip().split()[0].split(".")[-1].strip('`"[]')
+        res = tables.get(name) or tables.get(name.lower())
+    return res
@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# -*- coding:utf-8 -*-
+"""
+Horizontal sharding
+
+Every shard is a ChainDB connected to one database,
+the chain is recorded and replayed on the shards chosen by the value of shard key.
+"""
+import bisect
+import concurrent.futures
+import copy
+import logging
+import zlib
+
+try:
+    from . import utility
+except ImportError:
+    import utility
+
+is_array = utility.is_array
+
+
+def crc32(value):
+    return zlib.crc32(str(value).encode("utf-8")) & 0xffffffff
+
+
+class HashSharding(object):
+    """crc32 of value modulo the number of shards"""
+
+    def __init__(self, shards_count):
+        self.shards_count = shards_count
+
+    def shard(self, value):
+        return crc32(value) % self.shards_count
+
+
+class RangeSharding(object):
+    """
+    :param bounds: sorted list,upper bounds(exclusive) of shards except the last one,
+        [100, 200] means <100, 100~199 and >=200
+    """
+
+    def __init__(self, shards_count, bounds):
+        if len(bounds) != shards_count - 1:
+            raise ValueError(f"{shards_count} shards need {shards_count - 1} bounds,got {bounds}")
+        self.shards_count = shards_count
+        self.bounds = list(bounds)
+
+    def shard(self, value):
+        return bisect.bisect_right(self.bounds, value)
+
+
+class ConsistentHashSharding(object):
+    """
+    hash ring,only about 1/n values move when adding a shard
+
+    :param vnodes: int,virtual nodes of each shard on the ring
+    """
+
+    def __init__(self, shards_count, vnodes=160):
+        self.shards_count = shards_count
+        ring = sorted((crc32(f"shard-{i}-{v}"), i) for i in range(shards_count) for v in range(vnodes))
+        self._hashes = [i[0] for i in ring]
+        self._shards = [i[1] for i in ring]
+
+    def shard(self, value):
+        index = bisect.bisect(self._hashes, crc32(value)) % len(self._hashes)
+        return self._shards[index]
+
+
+STRATEGIES = {
+    "hash": HashSharding,
+    "range": RangeSharding,
+    "consistent_hash": ConsistentHashSharding,
+}
+
+CHAIN_METHODS = ("where", "order_by", "limit", "offset", "group_by", "on",
+                 "join", "inner_join", "left_join", "right_join", "cache", "use_primary")
+
+
+class ShardedDB(object):
+    """
+    Route chain operations to shards.
+
+    Rows are routed by the value of shard key in insert dict,
+    or in where condition like (shard_key, value) and (shard_key, "IN", [values]).
+    Queries without shard key are scattered to all shards and the results are gathered.
+
+    :param chain_db_creator: function without param,returns a new ChainDB
+    :param shard_key: str,default shard key of tables
+    :param table_shard_keys: dict,table name => shard key of the table if it's not the default one
+    :param strategy: str,hash,range or consistent_hash
+    :param bounds: list,bounds of range strategy,see RangeSharding
+    :param max_workers: int,threads to run on shards in parallel,number of shards by default
+    """
+
+    def __init__(self, chain_db_creator, shard_key="id", strategy="hash", bounds=None, max_workers=None,
+                 table_shard_keys=None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy of sharding should be one of {tuple(STRATEGIES)},got {strategy}")
+        self.chain_db_creator = chain_db_creator
+        self.shard_key = shard_key
+        self.table_shard_keys = dict(table_shard_keys or {})
+        self.strategy = strategy
+        self.bounds = bounds
+        self.max_workers = max_workers
+        self.shards = []  # ChainDB of each shard
+        self.sharding = None
+        self._executor = None
+
+        self._table = ""
+        self._shard_key = None  # shard key of current query,passed to table
+        self._chain = ()  # chain methods called,replayed on shards
+        self._where = None
+
+    def clone(self, **params):
+        """a new ShardedDB with chain params changed,shards are shared"""
+        query = copy.copy(self)
+        query.__dict__.update(params)
+        return query
+
+    def connect(self, config_dicts, **kwargs):
+        """
+        connect to all shards
+
+        :param config_dicts: list of config dict,one for each shard,the order should not be changed
+        :param kwargs: other params of ChainDB.connect,eg. return_query
+        """
+        self.close()
+        self.shards = []
+        for config_dict in config_dicts:
+            db = self.chain_db_creator()
+            db.connect(dict(config_dict), **kwargs)
+            self.shards.append(db)
+
+        n = len(self.shards)
+        if self.strategy == "range":
+            self.sharding = RangeSharding(n, self.bounds or [])
+        else:
+            self.sharding = STRATEGIES[self.strategy](n)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers or n)
+
+    def close(self):
+        for db in self.shards:
+            db.connection.close()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def table(self, table_name="", shard_key=None):
+        """
+        :param shard_key: str,shard key of this query,the one in table_shard_keys or the default one if None
+        """
+        return self.clone(_table=table_name, _shard_key=shard_key)
+
+    def __getattr__(self, name):
+        if name in CHAIN_METHODS:
+            def chain(*args, **kwargs):
+                query = self.clone(_chain=self._chain + ((name, args, kwargs),))
+                if name == "where":
+                    query._where = args[0] if args else kwargs.get("condition")
+                return query
+
+            return chain
+        raise AttributeError(name)
+
+    def get_shard_key(self):
+        return self._shard_key or self.table_shard_keys.get(self._table, self.shard_key)
+
+    def shard(self, value):
+        """ChainDB of the shard where value of shard key is"""
+        return self.shards[self.sharding.shard(value)]
+
+    def shard_indexes(self):
+        """
+        indexes of shards to run current chain,all of them if shard key is not in where condition
+        """
+        key = self.get_shard_key()
+        if is_array(self._where):
+            for i in self._where:
+                if i[0] != key:
+                    continue
+                if len(i) == 2 and not (isinstance(i[1], str) and i[1].startswith("`")):
+                    return [self.sharding.shard(i[1])]
+                if len(i) == 3 and isinstance(i[1], str) and i[1].strip().lower() == "in" and is_array(i[2]):
+                    return sorted({self.sharding.shard(v) for v in i[2]})
+        return list(range(len(self.shards)))
+
+    def _replay(self, index):
+        """ChainDB of the shard with table and chain methods"""
+        db = self.shards[index].table(self._table)
+        for name, args, kwargs in self._chain:
+            db = getattr(db, name)(*args, **kwargs)
+        return db
+
+    def run(self, indexes, func):
+        """
+        run func(ChainDB, index of shard) on shards in parallel
+
+        :return: list,results of each shard
+        """
+        if len(indexes) == 1:
+            return [func(self._replay(indexes[0]), indexes[0])]
+        futures = [self._executor.submit(lambda i: func(self._replay(i), i), i) for i in indexes]
+        return [f.result() for f in futures]
+
+    def select(self, fields="*"):
+        """
+        select on shards,rows are merged by order_by,limit and offset are applied after merging
+        """
+        indexes = self.shard_indexes()
+        if len(indexes) == 1:
+            return self.run(indexes, lambda db, i: db.select(fields))[0]
+
+        chain, order_by, offset, limit = self.pop_limit()
+        if limit:  # each shard returns the top offset + limit rows
+            chain += (("limit", (offset + limit,), {}),)
+        rows = []
+        for res in self.clone(_chain=chain).run(indexes, lambda db, i: db.select(fields)):
+            rows += res
+        if order_by:
+            rows = sort_rows(rows, order_by)
+        if limit:
+            rows = rows[offset:offset + limit]
+        elif offset:
+            rows = rows[offset:]
+        return rows
+
+    def pop_limit(self):
+        """
+        chain without limit and offset
+
+        :return: tuple,the chain,order_by,offset and limit
+        """
+        order_by = ""
+        offset = limit = 0
+        chain = []
+        for name, args, kwargs in self._chain:
+            if name == "limit":
+                limit = args[0]
+                if isinstance(limit, str) and "," in limit:
+                    m, n = limit.replace(" ", "").split(",")
+                    offset, limit = int(m), int(n)
+                else:
+                    limit = int(limit)
+                continue
+            if name == "offset":
+                offset = int(args[0] or 0)
+                continue
+            if name == "order_by":
+                order_by = args[0]
+            chain.append((name, args, kwargs))
+        return tuple(chain), order_by, offset, limit
+
+    def get(self, fields="*"):
+        res = self.limit(1).select(fields)
+        return res[0] if res else {}
+
+    def insert(self, dict_data=None):
+        """insert one line into the shard by value of shard key"""
+        if not dict_data:
+            return False
+        value = split_value(dict_data, self.get_shard_key())
+        return self.run([self.sharding.shard(value)], lambda db, i: db.insert(dict_data))[0]
+
+    def insert_many(self, dict_data=None):
+        """
+        split lines by shard and insert them in parallel
+
+        :return: dict,rowcount is the sum of all shards,shards is the detail of each shard
+        """
+        if not dict_data:
+            return False
+        batches = self.split_shards(dict_data)
+        indexes = sorted(batches)
+        res = self.run(indexes, lambda db, i: db.insert_many(batches[i]))
+        return merge_details(indexes, res)
+
+    def upsert_many(self, rows, conflict_keys, update_fields=None):
+        """split lines by shard and upsert them in parallel,see insert_many"""
+        if not rows:
+            return False
+        batches = self.split_shards(rows)
+        indexes = sorted(batches)
+        res = self.run(indexes, lambda db, i: db.upsert_many(batches[i], conflict_keys, update_fields))
+        return merge_details(indexes, res)
+
+    def split_shards(self, dict_data):
+        """
+        split lines of insert_many by value of shard key
+
+        :return: dict,shard index => lines in the same format as dict_data
+        """
+        key = self.get_shard_key()
+        batches = {}
+        if isinstance(dict_data, dict):  # split dict
+            fields = list(dict_data["fields"])
+            index = fields.index(key)
+            for v in dict_data["values"]:
+                batches.setdefault(self.sharding.shard(v[index]), []).append(v)
+            return {k: {"fields": fields, "values": v} for k, v in batches.items()}
+        for row in dict_data:
+            batches.setdefault(self.sharding.shard(row[key]), []).append(row)
+        return batches
+
+    def _write(self, func):
+        indexes = self.shard_indexes()
+        return merge_details(indexes, self.run(indexes, func))
+
+    def update(self, dict_data=None):
+        return self._write(lambda db, i: db.update(dict_data))
+
+    def delete(self):
+        if self.shards and self.shards[0].strict and not self._where:
+            logging.warning("without where condition,can not delete")
+            return False
+        return self._write(lambda db, i: db.delete())
+
+    def increase(self, field, step=1):
+        return self._write(lambda db, i: db.increase(field, step))
+
+    def decrease(self, field, step=1):
+        return self._write(lambda db, i: db.decrease(field, step))
+
+    fetchall = select  # alias
+    fetchone = get  # alias
+
+
+def split_value(dict_data, key):
+    """value of key in natural dict or split dict"""
+    if "fields" in dict_data and "values" in dict_data:
+        return dict_data["values"][list(dict_data["fields"]).index(key)]
+    return dict_data[key]
+
+
+def merge_details(indexes, details):
+    """sum rowcount of details returned by shards"""
+    return {
+        "rowcount": sum(i["rowcount"] for i in details if i),  # number of rows affected
+        "shards": dict(zip(indexes, details)),  # shard index => detail
+        "query": "",
+    }
+
+
+def sort_rows(rows, order_by):
+    """sort rows gathered from shards by order by condition like "a DESC, b" """
+    for field in reversed([i.strip() for i in order_by.split(",") if i.strip()]):
+        parts = field.split()
+        name = parts[0].split(".")[-1].strip('`"[]')
+        reverse = len(parts) > 1 and parts[1].lower() == "desc"
+        rows.sort(key=lambda row: sort_key(dict.get(row, name) if isinstance(row, dict) else row[name]),
+                  reverse=reverse)
+    return rows
+
+
+def sort_key(value):
+    """None first as databases do in ascending order"""
+    return (value is not None, value)
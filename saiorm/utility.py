@@ -1,5 +1,18 @@
 #!/usr/bin/env python
 # -*- coding:utf-8 -*-
+import base64
+import collections
+import datetime
+import decimal
+import functools
+import json
+import keyword
+import threading
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # optional,used by select_columns only
 
 
 class Row(dict):
@@ -42,6 +55,215 @@ class GraceDict(dict):
             return ""
 
 
+class LRUCache(object):
+    """
+    Least recently used cache,thread-safe.
+
+    :param max_size: int,the least recently used one will be evicted when exceed it
+    :param on_evict: function receives key and value,called after evicting
+    """
+
+    def __init__(self, max_size=256, on_evict=None):
+        self.max_size = max_size
+        self.on_evict = on_evict
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        evicted = []
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                evicted.append(self._data.popitem(last=False))
+        if self.on_evict:
+            for k, v in evicted:
+                self.on_evict(k, v)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class SlotsRow(object):
+    """
+    Base class of compact rows generated by slots_row_class,a slot for each column.
+
+    Attribute access returns the value like Row,
+    item access returns empty string for None and missing key like GraceDict.
+    """
+    __slots__ = ()
+    _columns = ()  # column names
+    _slots_name = ()  # slot names of columns,invalid names are renamed to _0, _1 ...
+    _index = {}  # column name => slot name
+
+    def __getitem__(self, name):
+        slot = self._index.get(name)
+        if slot is None:
+            if not isinstance(name, int):
+                return ""
+            slot = self._slots_name[name]
+        v = getattr(self, slot)
+        return "" if v is None else v
+
+    def get(self, key, default=""):
+        slot = self._index.get(key)
+        if slot is None:
+            return default or ""
+        v = getattr(self, slot)
+        return "" if v is None else v
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def __len__(self):
+        return len(self._columns)
+
+    def __iter__(self):
+        return iter(self._columns)
+
+    def __eq__(self, other):
+        if isinstance(other, SlotsRow):
+            return self._columns == other._columns and self.values() == other.values()
+        if isinstance(other, dict):
+            return self.to_dict() == other
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.to_dict()!r})"
+
+    def keys(self):
+        return list(self._columns)
+
+    def values(self):
+        return [getattr(self, i) for i in self._slots_name]
+
+    def items(self):
+        return list(zip(self._columns, self.values()))
+
+    def to_dict(self):
+        return dict(zip(self._columns, self.values()))
+
+
+@functools.lru_cache(maxsize=256)
+def slots_row_class(column_names):
+    """
+    generate a SlotsRow subclass for column names,initialize it with a row tuple.
+
+    :param column_names: tuple,names in cursor.description
+    """
+    reserved = set(dir(SlotsRow))
+    slots_name = []
+    for index, name in enumerate(column_names):
+        if not name.isidentifier() or keyword.iskeyword(name) or name in reserved \
+                or name.startswith("_") or name in slots_name:
+            name = f"_{index}"
+        slots_name.append(name)
+
+    # assign all slots by unpacking,much faster than setattr one by one
+    namespace = {}
+    exec("def __init__(self, row):\n    " + ", ".join(f"self.{i}" for i in slots_name) + ", = row",
+         namespace)
+    return type("SlotsRecord", (SlotsRow,), {
+        "__slots__": tuple(slots_name),
+        "__init__": namespace["__init__"],
+        "_columns": tuple(column_names),
+        "_slots_name": tuple(slots_name),
+        "_index": dict(zip(column_names, slots_name)),
+    })
+
+
+@functools.lru_cache(maxsize=256)
+def namedtuple_class(column_names):
+    """namedtuple class for column names,invalid names are renamed to _0, _1 ..."""
+    return collections.namedtuple("Record", column_names, rename=True)
+
+
+def row_maker(row_factory, column_names):
+    """
+    function converts a row tuple from cursor to the type of row_factory
+
+    :param row_factory: tuple, "namedtuple", "slots", dict or its subclass like Row and GraceDict,
+        or a function receives column names and row tuple
+    :param column_names: list,names in cursor.description
+    """
+    if row_factory is tuple:
+        return tuple
+    if row_factory == "namedtuple":
+        return namedtuple_class(tuple(column_names))._make
+    if row_factory == "slots":
+        return slots_row_class(tuple(column_names))
+    if isinstance(row_factory, type) and issubclass(row_factory, dict):
+        return lambda row: row_factory(zip(column_names, row))
+    if callable(row_factory):
+        return lambda row: row_factory(column_names, row)
+    raise ValueError(f"Invalid row_factory {row_factory!r}")
+
+
+def to_columns(rows, columns_count):
+    """transpose row tuples to a list for each column"""
+    if not rows:
+        return [[] for i in range(columns_count)]
+    return [list(i) for i in zip(*rows)]
+
+
+def to_numpy_array(values, dtype=None):
+    """
+    convert a column to NumPy array
+
+    :param values: list
+    :param dtype: str,inferred by NumPy if None.Use object if values do not fit it,
+        like NULL in integer column.
+    """
+    if numpy is None:
+        raise ImportError("saiorm requires numpy to return NumPy arrays")
+    if dtype is None:
+        return numpy.array(values)
+    if numpy.dtype(dtype).kind in "biu" and None in values:  # NULL can not be integer or bool
+        dtype = object
+    try:
+        return numpy.array(values, dtype=dtype)
+    except (TypeError, ValueError, OverflowError):
+        return numpy.array(values, dtype=object)
+
+
+def estimate_size(row):
+    """
+    estimate bytes of values in SQL statement,a little bigger than the real one
+
+    :param row: tuple,values of a row
+    """
+    size = 4  # parentheses and comma
+    for v in row:
+        if isinstance(v, str):
+            size += len(v) * 3 + 3  # utf8 and quotes
+        elif isinstance(v, (bytes, bytearray)):
+            size += len(v) * 2 + 3  # escaped and quotes
+        else:
+            size += 24
+    return size
+
+
 def is_array(obj):
     return isinstance(obj, tuple) or isinstance(obj, list)
 
@@ -60,3 +282,76 @@ def to_unicode(value):
             "Expected str, bytes, bytearray; got %r" % type(value)
         )
     return value.decode("utf-8")
+
+
+def to_numbered_placeholders(query):
+    """
+    Replace %s placeholders with $1, $2 ... ,used by PostgreSQL server side statement.
+
+    %% is unescaped to %.
+    """
+    res = []
+    index = 0
+    for part in query.split("%%"):
+        pieces = part.split("%s")
+        for i, piece in enumerate(pieces):
+            if i:
+                index += 1
+                res.append(f"${index}")
+            res.append(piece)
+        res.append("%")
+    return "".join(res[:-1])
+
+
+def _encode_cursor_value(v):
+    """json type of values in cursor token,type is kept for datetime,date,Decimal and bytes"""
+    if isinstance(v, datetime.datetime):
+        return {"$datetime": v.isoformat()}
+    if isinstance(v, datetime.date):
+        return {"$date": v.isoformat()}
+    if isinstance(v, decimal.Decimal):
+        return {"$decimal": str(v)}
+    if isinstance(v, (bytes, bytearray)):
+        return {"$bytes": base64.b64encode(v).decode()}
+    if type(v).__name__ == "ObjectId":  # _id of MongoDB
+        return {"$oid": str(v)}
+    return str(v)
+
+
+def _decode_cursor_value(d):
+    if len(d) == 1:
+        k, v = next(iter(d.items()))
+        if k == "$datetime":
+            return datetime.datetime.fromisoformat(v)
+        if k == "$date":
+            return datetime.date.fromisoformat(v)
+        if k == "$decimal":
+            return decimal.Decimal(v)
+        if k == "$bytes":
+            return base64.b64decode(v)
+        if k == "$oid":
+            import bson  # installed with pymongo
+            return bson.ObjectId(v)
+    return d
+
+
+def encode_cursor(values):
+    """
+    opaque cursor token of paginate,url safe
+
+    :param values: list,key values of the last row in page
+    """
+    s = json.dumps(list(values), default=_encode_cursor_value, separators=(",", ":"))
+    return base64.urlsafe_b64encode(s.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """key values in cursor token,raise ValueError if token is broken"""
+    try:
+        s = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(s, object_hook=_decode_cursor_value)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor token {token!r}") from e
+    if not isinstance(values, list):
+        raise ValueError(f"Invalid cursor token {token!r}")
+    return values
@@ -1,6 +1,8 @@
 import decimal
 import os
 import sys
+import tempfile
+import threading
 import unittest
 
 sys.path.append(os.path.abspath('..'))
@@ -48,6 +50,24 @@ class TestFunctions(unittest.TestCase):
         res = DB.select("`SUM(1+2) as s")[0]
         self.assertEqual(decimal.Decimal("3"), res["s"])
 
+    def test_row_factory(self):
+        tuple_db = saiorm.init(driver="MySQL", row_factory=tuple)
+        tuple_db.connection = DB.connection
+        res = tuple_db.select("`SUM(1+2) as s")[0]
+        self.assertEqual((decimal.Decimal("3"),), res)
+
+        namedtuple_db = saiorm.init(driver="MySQL", row_factory="namedtuple")
+        namedtuple_db.connection = DB.connection
+        res = namedtuple_db.get("`SUM(1+2) as s")
+        self.assertEqual(decimal.Decimal("3"), res.s)
+
+        slots_db = saiorm.init(driver="MySQL", row_factory="slots")
+        slots_db.connection = DB.connection
+        res = slots_db.get("`SUM(1+2) as s, NULL as n")
+        self.assertEqual(decimal.Decimal("3"), res.s)
+        self.assertEqual(None, res.n)
+        self.assertEqual("", res["n"])
+
     def test_get(self):
         res = DB.get("`SUM(1+2) as s")
         self.assertEqual(decimal.Decimal("3"), res["s"])
@@ -97,6 +117,63 @@ class TestFunctions(unittest.TestCase):
         res = table.where([(field, name + "_1")]).get(field)
         self.assertEqual(name + "_1", res[field])
 
+    def test_insert_many_chunks(self):
+        chunk_db = saiorm.init(driver="MySQL", table_name_prefix=conf["table_name_prefix"])
+        chunk_db.connection = DB.connection
+        chunk_db.max_insert_rows = 2
+        table = chunk_db.table("user")
+        field = "name"
+        name = "test_insert_many_chunks"
+
+        res = table.insert_many({
+            "fields": [field, "phone"],
+            "values": [(name + "_" + str(i), "14012345678") for i in range(5)]
+        })
+        self.assertEqual(5, res["rowcount"])
+
+        res = table.where([(field, name + "_4")]).get(field)
+        self.assertEqual(name + "_4", res[field])
+
+    def test_upsert_many(self):
+        table = DB.table("blog")
+        field = "content"
+        name = "test_upsert_many"
+
+        res = table.upsert_many([{
+            "id": 3,
+            "user_id": 3,
+            field: name + "_3",
+        }, {
+            "id": 100,
+            "user_id": 100,
+            field: name + "_100",
+        }], "id", [field])
+        self.assertEqual(3, res["rowcount"])  # MySQL counts 2 for an updated line
+
+        self.assertEqual(name + "_3", table.where([("id", 3)]).get(field)[field])
+        self.assertEqual(name + "_100", table.where([("id", 100)]).get(field)[field])
+
+    def test_load_data(self):
+        load_db = saiorm.init(driver="MySQL", table_name_prefix=conf["table_name_prefix"])
+        load_db.connect({
+            "host": conf["host"],
+            "port": conf["port"],
+            "database": conf["database"],
+            "user": conf["user"],
+            "password": conf["password"],
+            "local_infile": True,
+        })
+        load_db.result_cache = saiorm.cache.ResultCache(max_entries=10, ttl=60)
+        table = load_db.table("user")
+        field = "name"
+        name = "test_load_data"
+
+        self.assertEqual([], table.cache().where([(field, name + "_2")]).select(field))
+        res = table.load_data(({field: name + "_" + str(i), "phone": "14012345678"} for i in range(3)))
+        self.assertEqual(3, res["rowcount"])
+        res = table.cache().where([(field, name + "_2")]).select(field)  # invalidated by load_data
+        self.assertEqual(name + "_2", res[0][field])
+
     def test_delete(self):
         table = DB.table("user")
         field = "name"
@@ -139,6 +216,26 @@ class TestFunctions(unittest.TestCase):
         res = table.where([("id", 3)]).get(field)
         self.assertEqual(332, res[field])
 
+    def test_batch(self):
+        batch_db = saiorm.init(driver="MySQL", table_name_prefix=conf["table_name_prefix"])
+        batch_db.connect({
+            "host": conf["host"],
+            "port": conf["port"],
+            "database": conf["database"],
+            "user": conf["user"],
+            "password": conf["password"],
+            "multi_statements": True,
+        })
+        table = batch_db.table("blog")
+        with batch_db.batch() as batch:
+            res = table.where([("id", 1)]).update({"content": "test_batch_1"})
+            table.where([("id", 2)]).update({"content": "test_batch_2"})
+            table.where([("id", 0)]).delete()
+            self.assertIsNone(res["rowcount"])  # filled after executing
+        self.assertEqual([1, 1, 0], [i["rowcount"] for i in batch.details])
+        self.assertEqual(1, res["rowcount"])
+        self.assertEqual("test_batch_2", table.where([("id", 2)]).get("content")["content"])
+
     def test_order_by(self):
         table = DB.table("login_log")
         res = table.where([
@@ -156,6 +253,95 @@ class TestFunctions(unittest.TestCase):
         res = table.limit(3).select("*")
         self.assertEqual(3, len(res))
 
+    def test_select_columns(self):
+        table = DB.table("login_log")
+        column_names, columns = table.where([
+            ("user_id", 1)
+        ]).select_columns("id,user_id")
+        self.assertEqual(["id", "user_id"], column_names)
+        self.assertEqual([1, 1], columns[1])
+
+    def test_iter(self):
+        table = DB.table("login_log")
+        res = table.where([
+            ("user_id", 1)
+        ]).order_by("id desc").iter("*", fetch_size=1)
+        self.assertEqual(2, len(list(res)))
+
+    def test_paginate(self):
+        table = DB.table("login_log")
+        page = table.paginate("id", size=4)
+        self.assertEqual([1, 2, 3, 4], [i["id"] for i in page["data"]])
+        page = table.paginate("id", size=4, cursor=page["next_cursor"])
+        self.assertEqual([5, 6], [i["id"] for i in page["data"]])
+        self.assertIsNone(page["next_cursor"])
+
+        page = table.paginate("user_id,id", after=(1, 2), size=10)
+        self.assertEqual([3, 5, 4, 6], [i["id"] for i in page["data"]])
+
+    def test_result_cache(self):
+        DB.result_cache = saiorm.cache.ResultCache(max_entries=10, ttl=60)
+        try:
+            table = DB.table("login_log")
+            res = table.cache().where([("id", 1)]).select()
+            res[0]["user_id"] = 0  # result is a copy
+            res = table.cache().where([("id", 1)]).select()
+            self.assertEqual(1, res[0]["user_id"])
+            self.assertEqual(1, DB.result_cache.hits)
+
+            table.where([("id", 1)]).update({"user_id": 1})  # invalidate
+            table.cache().where([("id", 1)]).select()
+            self.assertEqual(2, DB.result_cache.misses)
+        finally:
+            DB.result_cache = None
+
+    def test_listener(self):
+        histogram = saiorm.events.LatencyHistogram()
+        events = []
+
+        class Recorder(saiorm.events.Listener):
+            def after(self, event):
+                events.append(event)
+
+        recorder = Recorder()
+        DB.add_listener(histogram)
+        DB.add_listener(recorder)
+        try:
+            DB.table("login_log").where([("id", 1)]).get()
+            DB.table("login_log").where([("id", 2)]).get()
+        finally:
+            DB.remove_listener(histogram)
+            DB.remove_listener(recorder)
+
+        self.assertEqual(2, len(events))
+        self.assertEqual(("query", 1, 1), (events[0].kind, events[0].parameters_count, events[0].rowcount))
+        self.assertEqual(events[0].shape, events[1].shape)
+        self.assertEqual(2, histogram.percentiles(events[0].shape)["count"])
+
+    def test_explain(self):
+        res = DB.table("login_log").where([("id", 1)]).explain()
+        self.assertFalse(res["full_scan"])
+        self.assertEqual(["PRIMARY"], res["indexes"])
+        res = DB.table("login_log").where([("user_id", 1)]).explain()
+        self.assertTrue(res["full_scan"])
+
+    def test_schema(self):
+        table = DB.table("login_log")
+        self.assertEqual(["id", "user_id", "login_time"], table.get_fields_name())
+        table_schema = table.get_schema()
+        self.assertEqual(["id"], table_schema["primary_key"])
+        self.assertFalse(table_schema["columns"][0]["nullable"])
+        self.assertTrue(table_schema["columns"][2]["nullable"])
+        self.assertIn("prefix_user", DB.load_schema())
+
+        path = os.path.join(tempfile.mkdtemp(), "schema.json")
+        snapshot_db = saiorm.init(driver="MySQL", table_name_prefix=conf["table_name_prefix"],
+                                  schema_cache=saiorm.schema.SchemaCache(snapshot_path=path))
+        snapshot_db.connection = DB.connection
+        snapshot_db.load_schema()
+        warm_cache = saiorm.schema.SchemaCache(snapshot_path=path)  # as a new process
+        self.assertEqual(table_schema, warm_cache.get(DB.schema_key())["prefix_login_log"])
+
     def test_inner_join(self):
         res = DB.table("user AS u").inner_join("login_log AS l").on("l.user_id = u.id").where([
             ("u.id", ">", 1),
@@ -177,6 +363,118 @@ class TestFunctions(unittest.TestCase):
         ]).select("u.*,l.*")
         self.assertEqual(3, len(res))
 
+    def test_pool(self):
+        pool_db = saiorm.init(driver="MySQL", table_name_prefix=conf["table_name_prefix"])
+        pool_db.connect({
+            "host": conf["host"],
+            "port": conf["port"],
+            "database": conf["database"],
+            "user": conf["user"],
+            "password": conf["password"],
+            "pool_size": 3,
+        })
+        errors = []
+
+        def select():
+            try:
+                for i in range(20):
+                    pool_db.connection.query_return_detail("SELECT 1 AS s")
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=select) for i in range(6)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([], errors)
+        self.assertTrue(pool_db.connection.pool.size <= 3)
+
+        db = pool_db.connection.pool.acquire()
+        pool_db.connection.close()
+        pool_db.connection.pool.release(db)  # closed instead of returned
+        self.assertEqual(0, pool_db.connection.pool.size)
+        with self.assertRaises(saiorm.pool.PoolClosed):
+            pool_db.connection.pool.acquire()
+
+    def test_query_object(self):
+        table = DB.table("login_log")
+        query = table.where([("user_id", 1)])
+        self.assertEqual(2, len(query.select()))
+        self.assertEqual(2, len(query.select()))  # reusable
+        self.assertEqual(1, len(query.limit(1).select()))
+        self.assertEqual(6, len(table.select()))  # not changed by where
+
+        pool_db = saiorm.init(driver="MySQL", table_name_prefix=conf["table_name_prefix"])
+        pool_db.connect({
+            "host": conf["host"],
+            "port": conf["port"],
+            "database": conf["database"],
+            "user": conf["user"],
+            "password": conf["password"],
+            "pool_size": 4,
+        })
+        shared = pool_db.table("login_log")
+        errors = []
+
+        def select(user_id, count):
+            try:
+                for i in range(20):
+                    if len(shared.where([("user_id", user_id)]).select()) != count:
+                        errors.append(user_id)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=select, args=i) for i in ((1, 2), (2, 2), (3, 1), (4, 1))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([], errors)
+
+    def test_replicas(self):
+        config = {
+            "host": conf["host"],
+            "port": conf["port"],
+            "database": conf["database"],
+            "user": conf["user"],
+            "password": conf["password"],
+        }
+        replica_db = saiorm.init(driver="MySQL", table_name_prefix=conf["table_name_prefix"])
+        replica_db.connect(dict(config), replicas=[dict(config), dict(config, weight=2)],
+                           replica_strategy="weighted")
+        replica_connection = replica_db.connection
+        self.assertIsInstance(replica_connection, saiorm.replica.ReplicaConnection)
+        self.assertEqual([1, 0, 1], [replica_connection.choose() for i in range(3)])
+
+        self.assertEqual(1, replica_db.table("login_log").where([("id", 1)]).get()["user_id"])
+        self.assertEqual(1, replica_db.table("login_log").use_primary().where([("id", 1)]).get()["user_id"])
+        replica_db.begin()
+        self.assertTrue(replica_connection.primary.in_transaction())
+        replica_db.commit()
+
+    def test_shard(self):
+        config = {
+            "host": conf["host"],
+            "port": conf["port"],
+            "database": conf["database"],
+            "user": conf["user"],
+            "password": conf["password"],
+        }
+        # two shards on the same database,scattered queries get every row twice
+        shard_db = saiorm.init_sharded(driver="MySQL", shard_key="user_id", strategy="range", bounds=[3],
+                                       table_name_prefix=conf["table_name_prefix"])
+        shard_db.connect([config, config])
+        try:
+            self.assertEqual(0, shard_db.sharding.shard(2))
+            self.assertEqual(1, shard_db.sharding.shard(3))
+            self.assertEqual(2, len(shard_db.table("login_log").where([("user_id", 1)]).select()))
+            self.assertEqual(12, len(shard_db.table("login_log").select()))
+            res = shard_db.table("login_log").order_by("id DESC").limit(3).select()
+            self.assertEqual([6, 6, 5], [i["id"] for i in res])
+        finally:
+            shard_db.close()
+
     def test_transaction(self):
         table = DB.table("user")
         field = "name"